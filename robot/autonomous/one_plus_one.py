@@ -10,6 +10,7 @@ from commands.go_to_stow import GoToStow
 from commands.move_wrist import MoveWrist
 from commands.run_intake import RunIntake
 from commands.score import Score
+from commands.wait_for_game_piece import WaitForGamePiece
 
 class OnePlusOne(commands2.SequentialCommandGroup):
     def __init__(self, container, indent=0) -> None:
@@ -35,11 +36,7 @@ class OnePlusOne(commands2.SequentialCommandGroup):
                 )
 
         # wait for HP to drop coral
-        self.addCommands(
-                commands2.WaitUntilCommand(
-                    container.intake.has_coral
-                    ).withTimeout(6)
-                )
+        self.addCommands(WaitForGamePiece(container, event='acquired', timeout=6, indent=indent+1))
 
         # move to HP while moving the wrist while waiting a bit more then stopping the intake
         # path handles going to l4
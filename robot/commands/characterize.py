@@ -0,0 +1,96 @@
+import math
+import os
+import time
+import commands2
+import numpy as np
+import wpilib
+from wpilib import SmartDashboard
+
+from constants import ElevatorConstants, ShoulderConstants
+
+
+class Characterize(commands2.Command):
+    """ SysId style voltage test on the elevator or the pivot, recorded for tools/fit_feedforward.py
+    quasistatic: volts ramp up at ramp_rate, so the mechanism is never accelerating much - gives kS, kG and kV
+    dynamic: a step to step_volts - the acceleration is what pins down kA
+    Every loop goes into a preallocated float32 buffer (time, volts, position, velocity) that end() saves as an .npz
+    """
+    k_columns = ['time', 'volts', 'position', 'velocity']
+
+    def __init__(self, container, mechanism='elevator', test='quasistatic', direction=1, ramp_rate=1.0, step_volts=4.0,
+                 timeout=10.0, indent=0) -> None:
+        super().__init__()
+        if mechanism not in ['elevator', 'pivot']:
+            raise ValueError(f'Characterize: unknown mechanism {mechanism}')
+        if test not in ['quasistatic', 'dynamic']:
+            raise ValueError(f'Characterize: unknown test {test}')
+        self.setName(f'Characterize {mechanism} {test} {"forward" if direction > 0 else "reverse"}')
+        self.indent = indent
+        self.container = container
+        self.mechanism = mechanism
+        self.subsystem = container.elevator if mechanism == 'elevator' else container.pivot
+        self.addRequirements(self.subsystem)
+        self.test = test
+        self.direction = math.copysign(1, direction)
+        self.ramp_rate = ramp_rate  # V/s
+        self.step_volts = step_volts
+        self.timeout = timeout
+        # stop short of the soft limits - the spark would stop us anyway, but then the data is junk
+        if mechanism == 'elevator':
+            self.limits = (ElevatorConstants.k_min_height + 0.05, ElevatorConstants.k_max_height - 0.05)
+        else:
+            self.limits = (ShoulderConstants.k_min_angle + math.radians(10), ShoulderConstants.k_max_angle - math.radians(10))
+        # allocated once here - nothing grows while the test is running
+        self.buffer = np.zeros((int(timeout / 0.02) + 10, len(self.k_columns)), dtype=np.float32)
+        self.samples = 0
+        self.timer = wpilib.Timer()
+        self.start_time = None
+        self.volts = 0
+
+    def get_measurements(self):
+        if self.mechanism == 'elevator':
+            return self.subsystem.get_height(), self.subsystem.get_velocity()
+        return self.subsystem.get_angle(), self.subsystem.get_velocity()
+
+    def initialize(self) -> None:
+        """Called just before this Command runs the first time."""
+        self.start_time = round(self.container.get_enabled_time(), 2)
+        print(f"{self.indent * '    '}** Started {self.getName()} at {self.start_time} s **", flush=True)
+        SmartDashboard.putString("alert", f"** Started {self.getName()} at {self.start_time} s **")
+        self.samples = 0
+        self.timer.restart()
+
+    def execute(self) -> None:
+        elapsed = self.timer.get()
+        if self.test == 'quasistatic':
+            self.volts = self.direction * self.ramp_rate * elapsed
+        else:
+            self.volts = self.direction * self.step_volts
+        self.subsystem.set_voltage(self.volts)
+        if self.samples < len(self.buffer):
+            position, velocity = self.get_measurements()
+            self.buffer[self.samples] = (elapsed, self.volts, position, velocity)
+            self.samples += 1
+
+    def isFinished(self) -> bool:
+        position, _ = self.get_measurements()
+        past_limit = position > self.limits[1] if self.direction > 0 else position < self.limits[0]
+        return past_limit or self.timer.hasElapsed(self.timeout) or self.samples >= len(self.buffer)
+
+    def save(self) -> str:
+        folder = '/home/lvuser/characterization' if wpilib.RobotBase.isReal() else 'characterization'
+        os.makedirs(folder, exist_ok=True)
+        direction = 'forward' if self.direction > 0 else 'reverse'
+        filename = os.path.join(folder, f'{self.mechanism}_{self.test}_{direction}_{time.strftime("%Y%m%d_%H%M%S")}.npz')
+        np.savez(filename, data=self.buffer[:self.samples], columns=self.k_columns, mechanism=self.mechanism, test=self.test,
+                 direction=self.direction, ramp_rate=self.ramp_rate, step_volts=self.step_volts)
+        return filename
+
+    def end(self, interrupted: bool) -> None:
+        self.subsystem.set_voltage(0)
+        self.subsystem.stop_tracking()  # hold wherever we stopped
+        filename = self.save() if self.samples > 1 else 'nothing'
+        end_time = self.container.get_enabled_time()
+        message = 'Interrupted' if interrupted else 'Ended'
+        print(f"{self.indent * '    '}** {message} {self.getName()} at {end_time:.1f} s - saved {self.samples} samples to {filename} **")
+        SmartDashboard.putString(f"alert", f"** {message} {self.getName()} at {end_time:.1f} s - saved {self.samples} samples **")
@@ -1,19 +1,19 @@
 import commands2
 from pathplannerlib.util import translation2dFromJson
 from wpilib import SmartDashboard
-from wpimath.units import inchesToMeters, degreesToRadians
+from wpimath.units import inchesToMeters, degreesToRadians, radiansToDegrees
 
 from subsystems.elevator import Elevator
 from subsystems.pivot import Pivot
 from subsystems.wrist import Wrist
 from subsystems.intake import Intake
-import trajectory
+import trajectory_library
 from trajectory import CustomTrajectory
 from subsystems.robot_state import RobotState
 
 class FollowTrajectory(commands2.Command):  # change the name for your command
 
-    def __init__(self, container, current_trajectory=None, wait_to_finish=True, indent=0) -> None:
+    def __init__(self, container, current_trajectory=None, wait_to_finish=True, use_feedforward=True, start_from_measured=False, use_intake=True, indent=0) -> None:
         super().__init__()
         self.setName('Follow Trajectory')  # change this to something appropriate for this command
         self.indent = indent
@@ -23,20 +23,43 @@ class FollowTrajectory(commands2.Command):  # change the name for your command
         self.wrist: Wrist = container.wrist
         self.intake: Intake = container.intake
         self.wait_to_finish = wait_to_finish
-        self.addRequirements(self.elevator, self.pivot, self.wrist, self.intake)  # commandsv2 version of requirements
+        self.use_feedforward = use_feedforward  # track the trajectory's own velocity/acceleration instead of re-profiling
+        self.start_from_measured = start_from_measured  # blend in from where the mechanisms actually are instead of jumping to the first waypoint
+        self.use_intake = use_intake  # False leaves the intake alone - the trajectory's intake column is ignored
+        self.addRequirements(self.elevator, self.pivot, self.wrist)  # commandsv2 version of requirements
+        if self.use_intake:
+            self.addRequirements(self.intake)
         # sick of IDE complaining
         self.start_time = None
         self.command_time = 0
         if current_trajectory is None:
-            self.trajectory: CustomTrajectory = trajectory.trajectory_L3
+            self.trajectory: CustomTrajectory = trajectory_library.load_trajectory('l3_test')
         else:
             self.trajectory: CustomTrajectory = current_trajectory
+        self.active_trajectory: CustomTrajectory = self.trajectory  # what we are following this run - may be a blend
         self.waypoint_counter = 0
+        self.waypoint_list = list(self.trajectory.waypoints.keys())
+        self.columns = [self.trajectory.columns[key] for key in ['elevator', 'pivot', 'wrist', 'intake']]
+        self.state_buffer = self.trajectory.make_state_buffer()  # ours alone - library trajectories are shared between commands
+
+    def measured_state(self) -> dict:
+        """ where the mechanisms are now, in trajectory units (pivot and wrist in degrees) """
+        return {'elevator': (self.elevator.get_height(), self.elevator.get_velocity()),
+                'pivot': (radiansToDegrees(self.pivot.get_angle()), radiansToDegrees(self.pivot.get_velocity())),
+                'wrist': (radiansToDegrees(self.wrist.get_angle()), radiansToDegrees(self.wrist.get_velocity()))}
+
+    def make_trajectory(self) -> CustomTrajectory:
+        """ the trajectory to follow this time - subclasses can plan one from scratch """
+        if self.start_from_measured:
+            return self.trajectory.blend_from_state(self.measured_state())
+        return self.trajectory
 
     def initialize(self) -> None:
         """Called just before this Command runs the first time."""
         self.start_time = self.container.get_enabled_time()
         self.waypoint_counter = 0
+        self.active_trajectory = self.make_trajectory()
+        self.waypoint_list = list(self.active_trajectory.waypoints.keys())
 
         print(f"{self.indent * '    '}** Started {self.getName()}  at {self.start_time:.1f} s **", flush=True)
 
@@ -44,27 +67,35 @@ class FollowTrajectory(commands2.Command):  # change the name for your command
         # get how long we are into the command
         self.command_time = self.container.get_enabled_time() - self.start_time
         # get the trajectory positions
-        targets = self.trajectory.get_value(self.command_time)
+        targets, velocities, accelerations = self.active_trajectory.sample_state(self.command_time, self.state_buffer)  # ordered by trajectory.columns
+        elevator, pivot, wrist, intake = self.columns
         # move all subsystems to the new target
-        self.elevator.set_goal(targets['elevator'])
-        self.pivot.set_goal(degreesToRadians(targets['pivot']))
-        self.wrist.set_position(degreesToRadians(targets['wrist']))
-        self.intake.set_reference(targets['intake'])
+        if self.use_feedforward:  # pivot and wrist are in degrees in the trajectory
+            self.elevator.track_state(float(targets[elevator]), float(velocities[elevator]), float(accelerations[elevator]))
+            self.pivot.track_state(degreesToRadians(targets[pivot]), degreesToRadians(velocities[pivot]), degreesToRadians(accelerations[pivot]))
+        else:
+            self.elevator.set_goal(float(targets[elevator]))
+            self.pivot.set_goal(degreesToRadians(targets[pivot]))
+        self.wrist.set_position(degreesToRadians(targets[wrist]))
+        if self.use_intake:
+            self.intake.set_reference(float(targets[intake]))
 
         # report progress
-        waypoint_list = list(self.trajectory.waypoints.keys())  # make this part of the class
-        if self.command_time > waypoint_list[self.waypoint_counter]:
-            print(f'{"  " + " " * self.indent}starting waypoint {self.waypoint_counter}: {self.trajectory.waypoints[waypoint_list[self.waypoint_counter]]} at {self.container.get_enabled_time():.1f}')
+        if self.waypoint_counter < len(self.waypoint_list) and self.command_time > self.waypoint_list[self.waypoint_counter]:
+            print(f'{"  " + " " * self.indent}starting waypoint {self.waypoint_counter}: {self.active_trajectory.waypoints[self.waypoint_list[self.waypoint_counter]]} at {self.container.get_enabled_time():.1f}')
             self.waypoint_counter += 1
 
     def isFinished(self) -> bool:
         if self.wait_to_finish:
-            return self.command_time >= self.trajectory.time_steps[-1]
+            return self.command_time >= self.active_trajectory.time_steps[-1]
         else:
             return True
 
 
     def end(self, interrupted: bool) -> None:
+        # the profiles take over again from wherever the trajectory left them
+        self.elevator.stop_tracking()
+        self.pivot.stop_tracking()
         end_time = self.container.get_enabled_time()
         message = 'Interrupted' if interrupted else 'Ended'
         print_end_message = True
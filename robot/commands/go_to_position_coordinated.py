@@ -0,0 +1,46 @@
+import math
+from wpilib import SmartDashboard
+
+import constants
+from constants import ElevatorConstants, ShoulderConstants, WristConstants
+import motion_planner
+import safe_region
+from commands.follow_trajectory import FollowTrajectory
+
+
+class GoToPositionCoordinated(FollowTrajectory):
+    """ Go to one of constants.k_positions as one planned move instead of parallel MoveElevator / MovePivot / MoveWrist
+    The plan starts from wherever the mechanisms are when the command starts - see motion_planner.plan_move
+    """
+
+    def __init__(self, container, position: str, use_safe_region=True, indent=0) -> None:
+        self.position = position
+        self.target = {'elevator': constants.k_positions[position]['elevator'],
+                       'pivot': constants.k_positions[position]['shoulder_pivot'],
+                       'wrist': constants.k_positions[position]['wrist_pivot']}
+        self.region = safe_region.default_region() if use_safe_region else None
+        self.velocity_limits = {'elevator': ElevatorConstants.k_max_velocity_meter_per_second,
+                                'pivot': ShoulderConstants.k_max_velocity_rad_per_second,
+                                'wrist': WristConstants.k_max_velocity_rad_per_second}
+        self.acceleration_limits = {'elevator': ElevatorConstants.k_max_acceleration_meter_per_sec_squared,
+                                    'pivot': ShoulderConstants.k_max_acceleration_rad_per_sec_squared,
+                                    'wrist': WristConstants.k_max_acceleration_rad_per_sec_squared}
+        # planned from stow for now so the command has something to show - initialize plans the real one
+        stow = {'elevator': constants.k_positions['stow']['elevator'], 'pivot': constants.k_positions['stow']['shoulder_pivot'],
+                'wrist': constants.k_positions['stow']['wrist_pivot']}
+        nominal, _ = motion_planner.plan_move(stow, self.target, self.velocity_limits, self.acceleration_limits, self.region,
+                                              name=f'stow_to_{position}')
+        super().__init__(container, current_trajectory=nominal, wait_to_finish=True, use_intake=False, indent=indent)
+        self.setName(f'Go to position coordinated ({position})')
+        self.report = None
+
+    def make_trajectory(self):
+        start = {'elevator': self.elevator.get_height(), 'pivot': self.pivot.get_angle(), 'wrist': self.wrist.get_angle()}
+        trajectory, self.report = motion_planner.plan_move(start, self.target, self.velocity_limits, self.acceleration_limits,
+                                                           self.region, name=f'to_{self.position}')
+        if not self.report['wrist_safe']:
+            message = f'{self.getName()}: no safe place to move the wrist - leaving it at {math.degrees(start["wrist"]):.0f} deg'
+            print(message)
+            SmartDashboard.putString('alert', message)
+        SmartDashboard.putNumber('_coordinated_plan_time', self.report['duration'])
+        return trajectory
@@ -60,7 +60,7 @@ class MovePivot(commands2.Command):  # change the name for your command
 
     def isFinished(self) -> bool:
         if self.wait_to_finish:
-            return abs(self.pivot.get_angle() - self.goal) < ShoulderConstants.k_tolerance
+            return self.pivot.get_at_goal()
         else:
             return True
 
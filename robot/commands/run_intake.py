@@ -26,7 +26,7 @@ class RunIntake(commands2.Command):  # change the name for your command
         SmartDashboard.putString("alert", msg)
 
         if self.value < 0:
-            constants.IntakeConstants.k_intake_config.smartCurrentLimit(5)
+            constants.IntakeConstants.k_intake_config.smartCurrentLimit(constants.IntakeConstants.k_coral_intaking_current_limit)
         else:
             constants.IntakeConstants.k_intake_config.smartCurrentLimit(10)
 
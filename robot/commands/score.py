@@ -6,6 +6,7 @@ from commands.run_intake import RunIntake
 from commands.move_wrist_by_pose import StowWristAfterPositionDelta
 from commands.set_leds import SetLEDs
 from commands.rumble_command import RumbleCommand
+from commands.wait_for_game_piece import WaitForGamePiece
 from subsystems.led import Led
 
 class Score(commands2.SequentialCommandGroup):
@@ -24,13 +25,14 @@ class Score(commands2.SequentialCommandGroup):
                                  value=constants.IntakeConstants.k_coral_scoring_voltage, 
                                  control_type=SparkMax.ControlType.kVoltage, indent=indent+1))
         self.addCommands(SetLEDs(container=self.container, led=self.container.led, indicator=Led.Indicator.kSUCCESSFLASH))
+        # done when the coral has left (plus a moment to clear) - the two old fixed waits are now just the cap
         self.addCommands(
                 commands2.ParallelDeadlineGroup(
-                        commands2.WaitCommand(constants.IntakeConstants.k_seconds_to_stay_on_while_scoring),
+                        WaitForGamePiece(container, event='released', timeout=2 * constants.IntakeConstants.k_seconds_to_stay_on_while_scoring,
+                                         settle_time=constants.IntakeConstants.k_release_settle_time, indent=indent+1),
                         RumbleCommand(container, 1, True, True, 0.2, indent+1)        
                 )
         )
-        self.addCommands(commands2.WaitCommand(constants.IntakeConstants.k_seconds_to_stay_on_while_scoring))
 
         self.addCommands(StowWristAfterPositionDelta(container, wait_to_finish=True, indent=indent+1))
         self.addCommands(GoToStow(container=self.container, indent=indent+1))
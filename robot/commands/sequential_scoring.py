@@ -5,6 +5,8 @@ import rev
 
 from commands.move_elevator import MoveElevator
 from commands.move_pivot import MovePivot
+from commands.wait_for_game_piece import WaitForGamePiece
+import constants
 
 class SequentialScoring(commands2.SequentialCommandGroup):
     def __init__(self, container, indent=0) -> None:
@@ -25,18 +27,17 @@ class SequentialScoring(commands2.SequentialCommandGroup):
         # move elevator above the target (if possible)
         self.addCommands(MoveElevator(container=self.container, elevator=self.container.elevator,
                                       mode='scoring', offset=0.0, use_dash=False, wait_to_finish=True, indent=indent+1).withTimeout(3))
-        self.addCommands(WaitCommand(seconds=0.1))
         # TODO - HERE YOU WOULD WANT TO SET THE WRIST IF WE HAVE CLEARANCE
         # move pivot to scoring position
         self.addCommands(MovePivot(container=self.container, pivot=self.container.pivot,
                                    mode='scoring', use_dash=False, wait_to_finish=True, indent=indent+1).withTimeout(3))
         # move elevator to right above scoring position
-        self.addCommands(WaitCommand(seconds=0.1))
         # self.addCommands(MoveElevator(container=self.container, elevator=self.container.elevator,
         #                               mode='scoring', use_dash=False, wait_to_finish=True, indent=indent+1))
         # TODO - LOWER ARM 10 DEGREES, POSSIBLY LOWER ELEVATOR 1 INCH, RELEASE, RESET
         self.addCommands(InstantCommand(lambda: self.container.intake.set_reference(value=3, control_type=rev.SparkMax.ControlType.kVoltage)))
-        self.addCommands(WaitCommand(3))
+        self.addCommands(WaitForGamePiece(self.container, event='released', timeout=3,
+                                          settle_time=constants.IntakeConstants.k_release_settle_time, indent=indent+1))
         self.addCommands(InstantCommand(lambda: self.container.intake.set_reference(value=0, control_type=rev.SparkMax.ControlType.kVoltage)))
 
 
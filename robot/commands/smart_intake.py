@@ -30,6 +30,7 @@ class SmartIntake(commands2.Command):
 
         self.addRequirements(self.intake)
         self.count = 0
+        self.acquired = False
 
     def initialize(self) -> None:
         self.start_time = round(self.container.get_enabled_time(), 2)
@@ -38,19 +39,25 @@ class SmartIntake(commands2.Command):
         self.timer.restart()
 
         self.intake.set_reference(value=self.intake_voltage, control_type=SparkMax.ControlType.kVoltage)
+        self.acquired = self.intake.has_coral()
+        self.intake.subscribe('acquired', self.on_acquired)  # the TOF edge instead of polling has_coral every loop
 
         # TODO: add led indication here that intake is on
 
+    def on_acquired(self, timestamp) -> None:
+        self.acquired = True
+
     def execute(self) -> None:
         self.count += 1
 
     def isFinished(self) -> bool:
         if self.wait_to_finish:
-            return self.intake.has_algae() or self.intake.has_coral() or self.timer.hasElapsed(self.timeout)
+            return self.acquired or self.intake.has_algae() or self.timer.hasElapsed(self.timeout)
         else:
             return True
 
     def end(self, interrupted: bool) -> None:
+        self.intake.unsubscribe('acquired', self.on_acquired)
 
         if self.intake.has_coral():
             self.led.set_mode(Led.Mode.kCORAL)
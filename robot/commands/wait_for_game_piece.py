@@ -0,0 +1,66 @@
+import commands2
+import wpilib
+from wpilib import SmartDashboard
+
+import constants
+from subsystems.intake import Intake
+
+
+class WaitForGamePiece(commands2.Command):
+
+    def __init__(self, container, event='released', timeout=3.0, settle_time=0.0, use_current=True, indent=0) -> None:
+        """
+        Ends as soon as the intake sees the event instead of after a fixed wait - timeout is only a safety cap
+        event='acquired': the TOF sees coral, or (use_current) the rollers stall on a piece
+        event='released': the TOF no longer sees coral
+        settle_time keeps the command running that much longer after the event, e.g. so the piece clears the rollers
+        Doesn't require the intake - it only watches, so whatever is driving the rollers keeps going
+        """
+        super().__init__()
+        self.setName(f'Wait for game piece {event}')
+        self.indent = indent
+        self.container = container
+        self.intake: Intake = container.intake
+        if event not in ['acquired', 'released']:
+            raise ValueError(f'WaitForGamePiece: unknown event {event}')
+        self.event = event
+        self.timeout = timeout
+        self.settle_time = settle_time
+        self.use_current = use_current
+        self.timer = wpilib.Timer()
+        self.event_time = None
+
+    def initialize(self) -> None:
+        """Called just before this Command runs the first time."""
+        self.start_time = round(self.container.get_enabled_time(), 2)
+        print(f"{self.indent * '    '}** Started {self.getName()} at {self.start_time} s **", flush=True)
+        self.timer.restart()
+        self.event_time = None
+        # the intake tells us when the TOF edge happens - no polling.  it may already be true when we start
+        self.intake.subscribe(self.event, self.on_event)
+        if self.intake.has_coral() == (self.event == 'acquired'):
+            self.on_event(wpilib.Timer.getFPGATimestamp())
+
+    def on_event(self, timestamp) -> None:
+        if self.event_time is None:
+            self.event_time = self.timer.get()
+
+    def execute(self) -> None:
+        # the current spike is a level, not an edge - it backs up the TOF when we are waiting for a piece
+        if self.event == 'acquired' and self.use_current and self.intake.has_current_spike():
+            self.on_event(wpilib.Timer.getFPGATimestamp())
+
+    def isFinished(self) -> bool:
+        if self.event_time is not None and self.timer.get() - self.event_time >= self.settle_time:
+            return True
+        return self.timer.hasElapsed(self.timeout)
+
+    def end(self, interrupted: bool) -> None:
+        self.intake.unsubscribe(self.event, self.on_event)
+        end_time = self.container.get_enabled_time()
+        message = 'Interrupted' if interrupted else 'Ended'
+        cause = f'{self.event} after {self.event_time:.2f} s' if self.event_time is not None else f'no {self.event} - timed out'
+        print(f"{self.indent * '    '}** {message} {self.getName()} at {end_time:.1f} s ({cause}) **")
+        SmartDashboard.putString(f"alert", f"** {message} {self.getName()} at {end_time:.1f} s ({cause}) **")
+        if constants.IntakeConstants.k_nt_debugging:
+            SmartDashboard.putNumber(f'_wait_{self.event}_time', self.event_time if self.event_time is not None else -1)
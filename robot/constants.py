@@ -216,6 +216,9 @@ class IntakeConstants:
 
     k_tof_coral_port = 13
     k_max_tof_distance_where_we_have_coral = 70  # millimeters  engages at 60 and bottoms out at 26
+    k_min_tof_distance_where_we_have_coral = 4  # millimeters - it reads 0 when there is no signal
+    k_tof_median_window = 3  # loops - one bad reading can't flip has_coral
+    k_tof_hysteresis = 10  # millimeters past the max before we say the coral is gone
 
     k_sim_length = 0.25
 
@@ -225,6 +228,14 @@ class IntakeConstants:
     k_coral_scoring_voltage = 12
 
     k_seconds_to_stay_on_while_scoring = 0.5
+    k_release_settle_time = 0.1  # s to keep pushing after the TOF says the coral is gone, so it clears the intake
+
+    k_coral_intaking_current_limit = 5  # amps - the smart limit RunIntake sets while intaking coral
+    # a game piece stalling the rollers pins the current at that limit, while the free-spinning NEO550 draws about 1.4 A
+    # (DCMotor.NEO550 free current) - trip at 90% of the limit so only a stall counts, with room for the limit's ripple
+    k_current_spike_amps = 0.9 * k_coral_intaking_current_limit
+    k_current_spike_debounce_time = 0.06  # s above the threshold before we call it a spike
+    k_current_inrush_time = 0.25  # s after a new reference where the motor spinning up doesn't count
 
 
 class ClimberConstants:
@@ -332,6 +343,16 @@ class WristConstants:
     k_max_arm_angle_where_spinning_dangerous = math.radians(110)
 
     k_max_elevator_height_where_spinning_dangerous = inchesToMeters(35)
+    # the three limits above build safe_region.default_region(), which trajectories are checked against too
+    k_enforce_safe_region = False  # CJH 20250302 turned the check off - is_safe_to_move always says True unless this is set
+
+    # only used to plan coordinated moves (motion_planner) - the spark's position loop still decides how fast it really goes
+    # worked out from the motor and the config above, then halved so the position loop always has margin to keep up:
+    #   speed is free speed at the outputRange(-0.5, 0.5) cap through the gearbox - 14.6 rad/s before the margin
+    #   acceleration is the torque at smartCurrentLimit(40) less holding the wrist out level - 238 rad/s^2 before the margin
+    k_planning_margin = 0.5
+    k_max_velocity_rad_per_second = k_planning_margin * 0.5 * k_plant.freeSpeed / k_gear_ratio
+    k_max_acceleration_rad_per_sec_squared = k_planning_margin * (k_plant.Kt * 40 * k_gear_ratio - k_mass_kg * 9.81 * k_center_of_mass_to_axis_of_rotation_dist_meters) / k_moi
 
     k_stowed_min_angle = math.radians(-15)
     k_stowed_max_angle = math.radians(15)
@@ -368,8 +389,20 @@ class ShoulderConstants:
     k_min_angle = math.radians(-45)
     k_max_angle = math.radians(225)
     k_tolerance = math.radians(2.5)
+    k_settle_velocity = math.radians(45)  # rad/s - slower than this and inside k_tolerance counts as settled (rules out swinging through)
+    k_settle_debounce_time = 0.02  # s settled before at_goal goes true - two loops in a row
     k_starting_angle = math.radians(90) # until we have an abs encoder this is where we expect it to start
 
+    # gravity feedforward over (pivot, wrist) instead of kG * cos(pivot) alone - see gravity_table.py
+    # off on purpose, like the power arbiter: with no holding voltages fitted yet the table is only the geometry of the
+    # empty arm, within 0.07 V of kG * cos(pivot) (tools/build_gravity_table.py). Fit k_gravity_coefficients, then turn it on
+    k_use_gravity_table = False
+    k_gravity_table_step = math.radians(5)
+    k_gravity_loads = {'empty': (0, 0)}  # load: (kg, m past the wrist axis) for the geometry model - only what we have measured
+    # load: six fitted coefficients from tools/build_gravity_table.py - replaces the geometry model for that load, and is
+    # how 'coral' and 'algae' get into the table; until then they use 'empty'
+    k_gravity_coefficients = {}
+
     k_config = SparkFlexConfig()
     k_config.voltageCompensation(12)
     k_config.inverted(False)
@@ -393,8 +426,15 @@ class ShoulderConstants:
     k_config.closedLoop.IZone(iZone=0, slot=ClosedLoopSlot(2))
     k_config.closedLoop.IMaxAccum(0, slot=ClosedLoopSlot(2))
     k_config.closedLoop.outputRange(-1, 1, ClosedLoopSlot(2))
-    # k_config.closedLoop.maxMotion.maxAcceleration(1)
-    # k_config.closedLoop.maxMotion.maxVelocity(1000)
+
+    # slot 1 is MAXMotion - the spark runs the trapezoid itself from one goal frame (units are rad and rad/s from the conversion factors)
+    k_control_mode = 'trapezoid'  # 'trapezoid' profiles on the rio every loop, 'maxmotion' profiles on the spark
+    # P from tools/tune_maxmotion.py - slot 0's 0.85 never settles in sim with only gravity as arbFF, 1.5 is the knee
+    k_config.closedLoop.pid(p=1.5, i=0, d=0, slot=ClosedLoopSlot(1))
+    k_config.closedLoop.outputRange(-1, 1, ClosedLoopSlot(1))
+    k_config.closedLoop.maxMotion.maxVelocity(k_max_velocity_rad_per_second, ClosedLoopSlot(1))
+    k_config.closedLoop.maxMotion.maxAcceleration(k_max_acceleration_rad_per_sec_squared, ClosedLoopSlot(1))
+    k_config.closedLoop.maxMotion.allowedClosedLoopError(k_tolerance / 2, ClosedLoopSlot(1))
         
     k_config.softLimit.forwardSoftLimit(k_max_angle)
     k_config.softLimit.reverseSoftLimit(k_min_angle)
@@ -439,6 +479,8 @@ class ElevatorConstants:
     k_min_height = inchesToMeters(8)
     k_max_height = inchesToMeters(64)
     k_tolerance = 2 / 100 # 2 cm
+    k_settle_velocity = 0.5  # m/s - slower than this and inside the tolerance counts as settled (rules out overshooting through)
+    k_settle_debounce_time = 0.02  # s settled before at_goal goes true - two loops in a row
 
     k_sim_starting_height = 2
 
@@ -454,6 +496,22 @@ class ElevatorConstants:
     k_config.closedLoop.IZone(iZone=0, slot=ClosedLoopSlot(0))
     k_config.closedLoop.IMaxAccum(0, slot=ClosedLoopSlot(0))
     k_config.closedLoop.outputRange(-1, 1)
+
+    # slot 1 is MAXMotion - the spark runs the trapezoid itself from one goal frame (units are m and m/s from the conversion factors)
+    k_control_mode = 'trapezoid'  # 'trapezoid' profiles on the rio every loop, 'maxmotion' profiles on the spark, 'state_space' is LQR + Kalman
+    # state space - same plant as the ElevatorSim in physics.py.  Q and R are the usual Bryson's rule "how much error is too much"
+    k_lqr_position_tolerance = 0.02  # m
+    k_lqr_velocity_tolerance = 0.4  # m/s
+    k_lqr_max_volts = 12
+    k_kalman_model_std_devs = (0.03, 0.6)  # m, m/s - how much we trust the model
+    k_kalman_encoder_std_dev = 0.002  # m - how much we trust the encoder
+    k_state_space_latency = 0.025  # s from the encoder reading to the voltage taking effect (status frame + CAN)
+    # P from tools/tune_maxmotion.py - with only kG as arbFF, P has to drag the carriage along; 6 is the knee (1.04 s worst settle vs 2.3 s at slot 0's 1.4)
+    k_config.closedLoop.pid(p=6, i=0, d=0, slot=ClosedLoopSlot(1))
+    k_config.closedLoop.outputRange(-1, 1, ClosedLoopSlot(1))
+    k_config.closedLoop.maxMotion.maxVelocity(k_max_velocity_meter_per_second, ClosedLoopSlot(1))
+    k_config.closedLoop.maxMotion.maxAcceleration(k_max_acceleration_meter_per_sec_squared, ClosedLoopSlot(1))
+    k_config.closedLoop.maxMotion.allowedClosedLoopError(k_tolerance / 2, ClosedLoopSlot(1))
         
     k_config.softLimit.forwardSoftLimit(k_max_height)
     k_config.softLimit.reverseSoftLimit(k_min_height)
@@ -516,3 +574,63 @@ class DrivetrainConstants:
     k_pose_stdevs_large = (1, 1, 10)  # use when you don't trust the april tags - stdev x, stdev y, stdev theta
     k_pose_stdevs_disabled = (1, 1, 2)  # use when we are disabled to quickly get updates
     k_pose_stdevs_small = (0.1, 0.1, 10)  # use when you do trust the tags
+
+class PowerConstants:
+
+    k_counter_offset = 0
+    k_nt_debugging = False  # print extra values to NT for debugging
+    k_pdh_CAN_id = 1
+    k_sample_period = 0.02  # seconds between PDH samples on the background notifier
+    k_history_length = 250  # samples kept in the ring buffer - 5 s at 50 Hz
+    k_top_channel_count = 4  # how many of the hungriest channels to publish
+
+    # which PDH channels feed which subsystem. This is the wiring plan - swerve on the four corners, mechanisms in CAN order -
+    # not a measured list. Only the per-subsystem numbers and the arbiter's unmanaged-load estimate read it.
+    # To check a channel, run one mechanism on its own with k_nt_debugging on: its channels should top _pdh_top_channels and
+    # its _pdh_<name>_avg_current should match. A wrong entry reads near 0 A while that mechanism moves
+    k_subsystem_channels = {
+        'drive': [0, 2, 17, 19],
+        'turning': [1, 3, 16, 18],
+        'elevator': [4, 5],
+        'pivot': [6, 7],
+        'climber': [8, 9],
+        'wrist': [10],
+        'intake': [11],
+    }
+
+class PowerArbiterConstants:
+
+    k_counter_offset = 1
+    k_nt_debugging = False  # print extra values to NT for debugging
+    k_enabled = False  # leave off until we have run it on the real robot - then limits fall back to the static configs
+    k_update_period_cycles = 5  # recompute the budget every 5 loops (10 Hz)
+    k_min_voltage = 8.0  # volts - keep the battery above this under load (rio browns out at 6.8)
+    k_model_window = 2.0  # seconds of PDH history used to fit the battery model
+    k_default_open_circuit_voltage = 12.6
+    k_default_internal_resistance = 0.020  # ohms - battery plus wiring, refit from data when we have enough spread
+    k_min_current_spread = 20  # amps of spread in the window before we trust a new resistance fit
+
+    # rate limiting so reconfiguring never floods the CAN bus
+    k_limit_hysteresis = 5  # amps per motor - smaller changes are ignored
+    k_min_reconfigure_interval = 0.25  # seconds between changes to the same group
+    k_max_configs_per_cycle = 2  # spark configure calls allowed per robot loop
+
+    k_drivetrain_priority = 3  # weight of the drivetrain when the leftover budget gets split up
+    # per motor smart current limits in amps while the arbiter is running - min is what a group keeps no matter what,
+    # max is the most it will hand out. The static limits are not repeated here: register() reads them off each spark
+    # (drive stallLimit=0 in swerve_constants, elevator and pivot 40, climber the REV default) and disabling puts them back
+    k_groups = {
+        'drive': {'min_limit': 30, 'max_limit': 60, 'priority': k_drivetrain_priority},
+        'elevator': {'min_limit': 20, 'max_limit': 40, 'priority': 1},
+        'pivot': {'min_limit': 20, 'max_limit': 40, 'priority': 1},
+        'climber': {'min_limit': 20, 'max_limit': 40, 'priority': 1},
+    }
+
+class FastLoopConstants:
+
+    k_counter_offset = 2
+    k_nt_debugging = False  # print extra values to NT for debugging
+    k_enabled = False  # off until we see the timing numbers on the real rio - everything stays in the 20 ms loop
+    k_period = 0.005  # seconds - 200 Hz
+    k_run_swerve_turning = True  # turning PIDs (only in the 'rio' turning mode - the sparks are already faster)
+    k_run_elevator_profile = True  # elevator trapezoid profile steps at k_period instead of 20 ms
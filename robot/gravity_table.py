@@ -0,0 +1,106 @@
+"""
+Gravity feedforward for the shoulder pivot as a lookup over (pivot angle, wrist angle), one grid per load
+The single ArmFeedforward kG only knows the pivot angle - the wrist and whatever is in the intake move the center of mass
+Gravity torque on a two joint chain is linear in cos/sin(pivot) times (1, cos(wrist), sin(wrist)), so each load is six
+coefficients (from geometry, or fit to logged holding voltages) that get tabulated once and read back with bilinear interpolation
+numpy only to build - lookups are plain python floats so they are cheap enough to run every loop on the rio
+"""
+import math
+import numpy as np
+
+k_gravity = 9.81
+
+
+def basis(pivot_angles, wrist_angles):
+    """ the six gravity terms at each (pivot, wrist) pair - stacked on the last axis """
+    pivot_angles, wrist_angles = np.broadcast_arrays(np.asarray(pivot_angles, dtype=float), np.asarray(wrist_angles, dtype=float))
+    cos_p, sin_p = np.cos(pivot_angles), np.sin(pivot_angles)
+    cos_w, sin_w = np.cos(wrist_angles), np.sin(wrist_angles)
+    return np.stack([cos_p, sin_p, cos_p * cos_w, sin_p * cos_w, cos_p * sin_w, sin_p * sin_w], axis=-1)
+
+
+def model_coefficients(kG, arm_length, arm_mass, wrist_mass, wrist_offset, piece_mass=0.0, piece_offset=0.0):
+    """ coefficients from geometry, scaled so an empty arm level with the wrist's offset out of the way needs exactly kG
+    Arm mass at half its length, wrist and piece at its end.  The wrist spins about the arm: at wrist 0 its center of mass
+    sits wrist_offset out from the arm, in the arm's plane, so its lever is arm_length * cos(p) - wrist_offset * sin(p) * cos(w)
+    """
+    volts_per_newton_meter = kG / (k_gravity * (arm_mass * arm_length / 2 + wrist_mass * arm_length))
+    along = k_gravity * (arm_mass * arm_length / 2 + (wrist_mass + piece_mass) * arm_length)
+    across = k_gravity * (wrist_mass * wrist_offset + piece_mass * piece_offset)
+    return volts_per_newton_meter * np.array([along, 0, 0, -across, 0, 0])
+
+
+def fit_coefficients(pivot_angles, wrist_angles, volts):
+    """ least squares coefficients from steady-state holding voltages (pivot still, so there is no kS / kV in them)
+    Returns (coefficients, rms residual in volts)
+    """
+    terms = basis(pivot_angles, wrist_angles).reshape(-1, 6)
+    volts = np.asarray(volts, dtype=float).ravel()
+    coefficients, *_ = np.linalg.lstsq(terms, volts, rcond=None)
+    residual = volts - terms @ coefficients
+    return coefficients, float(np.sqrt(np.mean(residual ** 2)))
+
+
+class GravityTable:
+    """ volts[load][i, j] holds the pivot at pivot_angles[i] (rad) with the wrist at wrist_angles[j] (rad)
+    Lookups interpolate between the four surrounding cells and clamp outside the grid, so any input gives an answer
+    """
+
+    def __init__(self, pivot_angles, wrist_angles, volts) -> None:
+        self.pivot_angles = np.asarray(pivot_angles, dtype=float)
+        self.wrist_angles = np.asarray(wrist_angles, dtype=float)
+        self.volts = {load: np.asarray(grid, dtype=float) for load, grid in volts.items()}
+        for load, grid in self.volts.items():
+            if grid.shape != (len(self.pivot_angles), len(self.wrist_angles)):
+                raise ValueError(f'{load} grid is {grid.shape}, expected {(len(self.pivot_angles), len(self.wrist_angles))}')
+        # evenly spaced, so a cell index is one division - and python lists because numpy is slow one scalar at a time
+        self.pivot_start, self.pivot_step = float(self.pivot_angles[0]), float(self.pivot_angles[1] - self.pivot_angles[0])
+        self.wrist_start, self.wrist_step = float(self.wrist_angles[0]), float(self.wrist_angles[1] - self.wrist_angles[0])
+        self.max_row, self.max_col = len(self.pivot_angles) - 2, len(self.wrist_angles) - 2
+        self.rows = {load: grid.tolist() for load, grid in self.volts.items()}
+
+    @classmethod
+    def from_coefficients(cls, coefficients, pivot_range, wrist_range, step=math.radians(5)):
+        """ tabulate {load: six coefficients} over the two ranges (rad) """
+        pivot_angles = np.arange(pivot_range[0], pivot_range[1] + step / 2, step)
+        wrist_angles = np.arange(wrist_range[0], wrist_range[1] + step / 2, step)
+        terms = basis(pivot_angles[:, None], wrist_angles[None, :])
+        return cls(pivot_angles, wrist_angles, {load: terms @ np.asarray(c, dtype=float) for load, c in coefficients.items()})
+
+    def lookup(self, pivot_angle, wrist_angle, load='empty') -> float:
+        """ volts to hold the pivot still - an unknown load falls back to 'empty' """
+        rows = self.rows.get(load, self.rows['empty'])
+        x = min(max((pivot_angle - self.pivot_start) / self.pivot_step, 0.0), self.max_row + 1.0)
+        y = min(max((wrist_angle - self.wrist_start) / self.wrist_step, 0.0), self.max_col + 1.0)
+        i, j = min(int(x), self.max_row), min(int(y), self.max_col)
+        fx, fy = x - i, y - j
+        low, high = rows[i], rows[i + 1]
+        return ((low[j] * (1 - fy) + low[j + 1] * fy) * (1 - fx) +
+                (high[j] * (1 - fy) + high[j + 1] * fy) * fx)
+
+    def volts_for(self, pivot_angle, wrist_angle, load='empty', elevator_acceleration=0.0) -> float:
+        """ lookup, scaled for the carriage accelerating under us - going up is the same as heavier gravity """
+        return self.lookup(pivot_angle, wrist_angle, load) * (1 + elevator_acceleration / k_gravity)
+
+
+_default_table = None
+
+
+def default_table() -> GravityTable:
+    """ the table from ShoulderConstants / WristConstants - built once, on first use
+    Loads with fitted coefficients in ShoulderConstants.k_gravity_coefficients use those, the rest of k_gravity_loads
+    come from geometry.  A fitted load doesn't need a geometry entry
+    """
+    global _default_table
+    if _default_table is None:
+        from constants import ShoulderConstants, WristConstants  # here so numpy-only users can still import this module
+        coefficients = dict(ShoulderConstants.k_gravity_coefficients)
+        for load, (piece_mass, piece_offset) in ShoulderConstants.k_gravity_loads.items():
+            if load not in coefficients:
+                coefficients[load] = model_coefficients(
+                    ShoulderConstants.k_kG_volts, ShoulderConstants.k_length_meters, ShoulderConstants.k_mass_kg, WristConstants.k_mass_kg,
+                    WristConstants.k_center_of_mass_to_axis_of_rotation_dist_meters, piece_mass, piece_offset)
+        _default_table = GravityTable.from_coefficients(
+            coefficients, (ShoulderConstants.k_min_angle, ShoulderConstants.k_max_angle),
+            (WristConstants.k_min_angle, WristConstants.k_max_angle), ShoulderConstants.k_gravity_table_step)
+    return _default_table
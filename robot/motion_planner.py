@@ -0,0 +1,148 @@
+"""
+Coordinated elevator / pivot / wrist moves - one plan for all three axes instead of three independent trapezoids
+The elevator and pivot are stretched so they finish together, and the wrist is slotted into the earliest window where
+the safe region lets it spin for its whole move (then stretched to finish with the others if that window allows it)
+plan_move hands back an ordinary CustomTrajectory with analytic velocity and acceleration, so FollowTrajectory can run it
+(its intake column is always 0 - run it with use_intake=False so the intake is left alone)
+numpy only - poses are in m and rad like k_positions, the trajectory it returns is in trajectory units (pivot and wrist in degrees)
+"""
+import math
+import numpy as np
+
+from trajectory import CustomTrajectory
+
+k_arm_axes = ['elevator', 'pivot']
+k_axes = k_arm_axes + ['wrist']
+
+
+def trapezoid_time(distance, max_velocity, max_acceleration) -> float:
+    """ shortest time to cover distance from rest to rest - triangular if we never reach max_velocity """
+    distance = abs(distance)
+    if distance < max_velocity ** 2 / max_acceleration:
+        return 2 * math.sqrt(distance / max_acceleration)
+    return distance / max_velocity + max_velocity / max_acceleration
+
+
+def synchronized_velocity(distance, duration, max_acceleration) -> float:
+    """ cruise velocity that covers distance in exactly duration at max_acceleration: d = v * (T - v / a) """
+    distance = abs(distance)
+    if distance == 0 or duration <= 0:
+        return 0.0
+    discriminant = max((max_acceleration * duration) ** 2 - 4 * max_acceleration * distance, 0)
+    return (max_acceleration * duration - math.sqrt(discriminant)) / 2
+
+
+def trapezoid_samples(distance, cruise_velocity, max_acceleration, times):
+    """ (position, velocity, acceleration) of a rest to rest trapezoid at times, measured from its start - clamps outside """
+    sign = math.copysign(1, distance)
+    distance = abs(distance)
+    times = np.asarray(times, dtype=float)
+    if distance == 0 or cruise_velocity == 0:
+        zeros = np.zeros_like(times)
+        return zeros, zeros.copy(), zeros.copy()
+    ramp_time = cruise_velocity / max_acceleration
+    duration = ramp_time + distance / cruise_velocity
+    t = np.clip(times, 0, duration)
+    remaining = duration - t
+    ramping_up = t < ramp_time
+    ramping_down = remaining < ramp_time
+    position = np.where(ramping_up, 0.5 * max_acceleration * t ** 2,
+                        np.where(ramping_down, distance - 0.5 * max_acceleration * remaining ** 2,
+                                 0.5 * max_acceleration * ramp_time ** 2 + cruise_velocity * (t - ramp_time)))
+    velocity = np.where(ramping_up, max_acceleration * t, np.where(ramping_down, max_acceleration * remaining, cruise_velocity))
+    acceleration = np.where(ramping_up, max_acceleration, np.where(ramping_down, -max_acceleration, 0.0))
+    moving = (times > 0) & (times < duration)
+    return sign * position, sign * velocity * moving, sign * acceleration * moving
+
+
+def _safe_windows(safe, length):
+    """ windows[..., k] is True when safe[..., k:k + length + 1] is all True - where a move of length samples can start """
+    unsafe_count = np.concatenate([np.zeros(safe.shape[:-1] + (1,), dtype=int), np.cumsum(~safe, axis=-1)], axis=-1)
+    return unsafe_count[..., length + 1:] - unsafe_count[..., :safe.shape[-1] - length] == 0
+
+
+def plan_move(start, target, velocity_limits, acceleration_limits, region=None, time_step=0.01, synchronize=True, name='coordinated'):
+    """ Plan start -> target for elevator, pivot and wrist as one trajectory
+    start and target are {'elevator': m, 'pivot': rad, 'wrist': rad}, the limits are in the same units per second (squared)
+    region is a SafeRegion (or None to ignore it) - the wrist only moves while (elevator, pivot) is inside it
+    If the wrist can't spin anywhere along the way it stays where it is and the report says wrist_safe is False
+    Returns (trajectory, report) - the report has the timing and whether the wrist could be moved safely
+    """
+    distances = {axis: target[axis] - start[axis] for axis in k_axes}
+    min_times = {axis: trapezoid_time(distances[axis], velocity_limits[axis], acceleration_limits[axis]) for axis in k_axes}
+    arm_time = max(min_times[axis] for axis in k_arm_axes)
+
+    def arm_profiles(stretch):
+        """ cruise velocity per arm axis - stretched so they finish together, or as fast as each can go """
+        return {axis: synchronized_velocity(distances[axis], arm_time if stretch else min_times[axis], acceleration_limits[axis])
+                for axis in k_arm_axes}
+
+    def arm_state(cruise, times, delay=0.0):
+        return {axis: start[axis] + trapezoid_samples(distances[axis], cruise[axis], acceleration_limits[axis], times - delay)[0]
+                for axis in k_arm_axes}
+
+    wrist_steps = int(math.ceil(min_times['wrist'] / time_step))
+    search_times = np.arange(0, arm_time + 2 * (wrist_steps + 1) * time_step, time_step)[None, :]
+    lower_bound = max(arm_time, min_times['wrist'])
+
+    def fit_wrist(cruise, delays):
+        """ hold the arm back by each delay (rows) and spin the wrist at the first safe window - best (total, start, delay) """
+        arm = arm_state(cruise, search_times, delays)
+        windows = _safe_windows(region.is_safe(arm['elevator'], arm['pivot']), wrist_steps)
+        feasible = windows.any(axis=1)
+        wrist_starts = search_times[0, np.argmax(windows, axis=1)]
+        totals = np.where(feasible, np.maximum(delays[:, 0] + arm_time, wrist_starts + min_times['wrist']), np.inf)
+        best = int(np.argmin(totals))
+        return (float(totals[best]), float(wrist_starts[best]), float(delays[best, 0])) if feasible[best] else None
+
+    options = []  # (total time, wrist start, arm delay, stretched arm)
+    for stretch in ([True, False] if synchronize else [False]):
+        cruise = arm_profiles(stretch)
+        if wrist_steps == 0 or region is None:
+            options.append((lower_bound, 0.0, 0.0, stretch))
+            break
+        # no delay is the usual answer - only search the delays when it isn't already as fast as the slowest axis
+        option = fit_wrist(cruise, np.zeros((1, 1)))
+        if option is None or option[0] > lower_bound + time_step:
+            option = fit_wrist(cruise, np.arange(wrist_steps + 1)[:, None] * time_step)
+        if option is not None:
+            options.append(option + (stretch,))
+            if option[0] <= lower_bound + time_step:
+                break
+    # prefer the synchronized arm when it is just as fast - it is the smoother move
+    options.sort(key=lambda option: (round(option[0] / time_step), not option[3]))
+    wrist_safe = len(options) > 0
+    if not wrist_safe:  # nowhere along the way is safe - leave the wrist where it is and say so
+        distances['wrist'] = 0.0
+        options = [(arm_time, 0.0, 0.0, synchronize)]
+    total_time, wrist_start, arm_delay, stretched = options[0]
+
+    time_steps = np.linspace(0, total_time, int(total_time / time_step) + 1)
+    cruise = arm_profiles(stretched)
+    # finish the wrist with everyone else when the rest of the window is safe too
+    wrist_duration = min_times['wrist'] if wrist_safe else 0.0
+    if wrist_safe and wrist_steps > 0 and wrist_start + wrist_duration < total_time:
+        window = time_steps >= wrist_start - 1e-9
+        arm = arm_state(cruise, time_steps[window], arm_delay)
+        if region is None or np.all(region.is_safe(arm['elevator'], arm['pivot'])):
+            wrist_duration = total_time - wrist_start
+    wrist_cruise = synchronized_velocity(distances['wrist'], wrist_duration, acceleration_limits['wrist'])
+
+    data, velocity, acceleration = (np.zeros((len(time_steps), 4)) for _ in range(3))  # the intake column stays at 0
+    for col, axis in enumerate(k_axes):
+        if axis == 'wrist':
+            p, v, a = trapezoid_samples(distances[axis], wrist_cruise, acceleration_limits[axis], time_steps - wrist_start)
+        else:
+            p, v, a = trapezoid_samples(distances[axis], cruise[axis], acceleration_limits[axis], time_steps - arm_delay)
+        scale = 1 if axis == 'elevator' else 180 / math.pi  # trajectories keep angles in degrees
+        data[:, col], velocity[:, col], acceleration[:, col] = scale * (start[axis] + p), scale * v, scale * a
+
+    def pose(values):
+        return {'elevator': values['elevator'], 'pivot': math.degrees(values['pivot']), 'wrist': math.degrees(values['wrist']), 'intake': 0}
+
+    waypoints = {0: pose(start), total_time: pose(target)}
+    trajectory = CustomTrajectory.from_arrays(waypoints, total_time, data, velocity=velocity, acceleration=acceleration,
+                                              interpolation_type='trapezoid', name=name, time_step=time_step)
+    report = {'duration': total_time, 'arm_time': arm_time, 'min_times': min_times, 'wrist_start': wrist_start,
+              'wrist_duration': wrist_duration, 'arm_delay': arm_delay, 'synchronized': stretched, 'wrist_safe': wrist_safe}
+    return trajectory, report
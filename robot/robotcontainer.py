@@ -37,6 +37,7 @@ from commands.move_wrist import MoveWrist
 from commands.run_intake import RunIntake
 from commands.set_leds import SetLEDs
 from commands.reset_field_centric import ResetFieldCentric
+from commands.calibrate_joystick import CalibrateJoystick
 
 from subsystems import swerve_constants
 from subsystems.robot_state import RobotState
@@ -48,6 +49,9 @@ from subsystems.led import Led
 from subsystems.wrist import Wrist
 from subsystems.climber import Climber
 from subsystems.vision import Vision
+from subsystems.power import PowerMonitor
+from subsystems.power_arbiter import PowerArbiter
+from subsystems.fast_loop import FastLoop
 
 from autonomous.leave_then_score_1 import LeaveThenScore
 from commands.drive_by_joystick_swerve import DriveByJoystickSwerve
@@ -59,14 +63,16 @@ from commands.set_leds import SetLEDs
 from commands.move_climber import MoveClimber
 
 from commands.go_to_position import GoToPosition
+from commands.go_to_position_coordinated import GoToPositionCoordinated
 from commands.follow_trajectory import FollowTrajectory
 from commands.intake_sequence import IntakeSequence
 from commands.reset_field_centric import ResetFieldCentric
 from commands.move_wrist_swap import MoveWristSwap
 
 from commands.can_status import CANStatus
+from commands.characterize import Characterize
 
-from trajectory import CustomTrajectory
+import trajectory_library
 # from commands.score import Score
 # from commands.drive_by_joystick_subsystem import DriveByJoystickSubsystem
 
@@ -93,14 +99,19 @@ class RobotContainer:
     def is_robot_mode(self, mode: RobotMode) -> bool:
         return self.robot_mode == mode
 
+    def get_pivot_load(self):  # what the pivot's gravity table needs to know - uses robot_mode so overrides count here too
+        load = {self.RobotMode.HAS_CORAL: 'coral', self.RobotMode.HAS_ALGAE: 'algae'}.get(self.robot_mode, 'empty')
+        return self.wrist.get_angle(), load, self.elevator.get_acceleration()
+
     # set scoring mode
 
     def __init__(self) -> None:
 
-        self.start_time = time.time()
+        self.start_time = wpilib.Timer.getFPGATimestamp()
 
         # The robot's subsystems
         # self.lower_crank = LowerCrank(container=self) # I don't want to test without a sim yet
+        self.power = PowerMonitor()  # first, so everyone else can ask it about current draw
         self.swerve = Swerve()
         self.elevator = Elevator()
         self.pivot = Pivot()
@@ -110,6 +121,22 @@ class RobotContainer:
         self.vision = Vision()
         self.robot_state = RobotState(self)  # currently has a callback that LED can register, but
         self.led = Led(self)  # may want LED last because it may want to know about other systems
+        self.pivot.set_load_supplier(self.get_pivot_load)  # the pivot is built before the wrist and intake it depends on
+
+        # redistribute smart current limits when everything pulls at once - see PowerArbiterConstants
+        self.power_arbiter = PowerArbiter(self.power)
+        self.power_arbiter.register('drive', [module.drivingSparkFlex for module in self.swerve.swerve_modules])
+        self.power_arbiter.register('elevator', self.elevator.sparks)
+        self.power_arbiter.register('pivot', self.pivot.sparks)
+        self.power_arbiter.register('climber', [self.climber.sparkmax, self.climber.follower])
+
+        # 5 ms notifier for the loops that care about latency - see FastLoopConstants
+        if constants.FastLoopConstants.k_enabled:
+            self.fast_loop = FastLoop()
+            if constants.FastLoopConstants.k_run_swerve_turning:
+                self.swerve.attach_fast_loop(self.fast_loop)
+            if constants.FastLoopConstants.k_run_elevator_profile:
+                self.elevator.attach_fast_loop(self.fast_loop)
 
         self.configure_joysticks()
         self.bind_driver_buttons()
@@ -139,10 +166,11 @@ class RobotContainer:
         self.robot_mode = self.RobotMode.EMPTY
 
     def set_start_time(self):  # call in teleopInit and autonomousInit in the robot
-        self.start_time = time.time()
+        self.start_time = wpilib.Timer.getFPGATimestamp()
 
     def get_enabled_time(self):  # call when we want to know the start/elapsed time for status and debug messages
-        return time.time() - self.start_time
+        # FPGA time, not the wall clock, so messages line up with the sim when it runs faster than real time
+        return wpilib.Timer.getFPGATimestamp() - self.start_time
 
     def configure_joysticks(self):
         """
@@ -258,48 +286,16 @@ class RobotContainer:
         wpilib.SmartDashboard.putData('move wrist to 0 deg', MoveWrist(container=self, radians=math.radians(0), timeout=4))
         wpilib.SmartDashboard.putData('move wrist to 90 deg', MoveWrist(container=self, radians=math.radians(90), timeout=4))
 
-        waypoints = {
-            0: {'elevator': 0.21, 'pivot': 90, 'wrist': 0, 'intake': 0},  # start 
-            1: {'elevator': 1.1, 'pivot': 90, 'wrist': 0, 'intake': 0},  # get to scoring wrist
-            2: {'elevator': 0.8, 'pivot': 50, 'wrist': 90, 'intake': 3},  # return home with wrist safe
-        }
-
-        # WAYPOINTS FOR 67 SCORING STYLE FOR L2, L3, and L4 - TODO: TUNE + PUT IN CONSTANTS
-        waypoints_l2_score_67 = {
-            0: {'elevator': constants.k_positions["l2"]["elevator"] + 0.035, 'pivot': constants.k_positions["l2"]["shoulder_pivot"], 'wrist': constants.k_positions["l2"]["wrist_pivot"], 'intake': 0},
-            0.8: {'elevator': constants.k_positions["l2"]["elevator"] + 0.035, 'pivot': math.degrees(constants.k_positions["l2"]["shoulder_pivot"]) + 14.5, 'wrist': constants.k_positions["l2"]["wrist_pivot"], 'intake': 0}
-            
-            #1.4 : {'elevator': constants.k_positions["l2"]["elevator"] + 0.1, 'pivot': constants.k_positions["l2"]["shoulder_pivot"] + math.radians(10), 'wrist': constants.k_positions["l2"]["wrist_pivot"], 'intake': 3}, #FOR DRIVERS; PULL BACK WHEN CORAL IS CLIPPED AFTER ~0.8 SECONDS SO THAT WHEN INTAKE IS ACTIVATED ROBOT CAN BE PULLED BACK AND PIECE RELEASED
-        }
-
-        waypoints_l3_score_67 = {
-            0: {'elevator': constants.k_positions["l3"]["elevator"] + 0.035, 'pivot': constants.k_positions["l3"]["shoulder_pivot"], 'wrist': constants.k_positions["l3"]["wrist_pivot"], 'intake': 0},
-            0.8: {'elevator': constants.k_positions["l3"]["elevator"] + 0.035, 'pivot': math.degrees(constants.k_positions["l2"]["shoulder_pivot"]) + 14.5, 'wrist': constants.k_positions["l3"]["wrist_pivot"], 'intake': 0}
-        }
-
-        waypoints_l4_score_67 = {
-            0: {'elevator': constants.k_positions["l4"]["elevator"] + 0.035, 'pivot': constants.k_positions["l4"]["shoulder_pivot"], 'wrist': constants.k_positions["l4"]["wrist_pivot"], 'intake': 0},
-            1.2: {'elevator': constants.k_positions["l4"]["elevator"] + 0.035, 'pivot': math.degrees(constants.k_positions["l2"]["shoulder_pivot"]) + 7.5, 'wrist': constants.k_positions["l4"]["wrist_pivot"], 'intake': 0}
-
-            #NOTE: DRIVERS HAVE ~1 SECOND TO MOVE ROBOT BACK WHILE PIVOT IS MOVING - THIS IS REQUIRED DUE TO GEOMETRY OF OUTTAKE + REEF!
-        }
-
-        # waypoints = {
-        #     0: {'elevator': 0.21, 'pivot': 90, 'wrist': 0, 'intake': 2},  # start
-        #     0.25: {'elevator': 0.3, 'pivot': 90, 'wrist': 0, 'intake': 2},  # start
-        #     0.5: {'elevator': 0.5, 'pivot': 70, 'wrist': 0, 'intake': 2},  # get to safe wrist
-        #     1: {'elevator': 1.2, 'pivot': 50, 'wrist': 90, 'intake': 2},  # get to scoring wrist while raising elevator
-        #     1.5: {'elevator': 1.17, 'pivot': 40, 'wrist': 90, 'intake': -3},  # move pivot while scoring
-        #     2.5: {'elevator': 0.2, 'pivot': 70, 'wrist': 0, 'intake': 0},  # return home with wrist safe
-        #     3.0: {'elevator': 0.2, 'pivot': 90, 'wrist': 0, 'intake': 0},  # come down to bottom
-        # }
-        #
-        l3_trajectory = CustomTrajectory(waypoints, 2)
+        # trajectories come pre-generated from deploy/trajectories.bin - specs live in trajectory_library
+        library_start = time.perf_counter()
+        l3_trajectory = trajectory_library.load_trajectory('l3')
         wpilib.SmartDashboard.putData('l3 trajectory', FollowTrajectory(container=self, current_trajectory=l3_trajectory, wait_to_finish=True))
 
-        l2_score_67 = CustomTrajectory(waypoints_l2_score_67, 0.8)
-        l3_score_67 = CustomTrajectory(waypoints_l3_score_67, 0.8)
-        l4_score_67 = CustomTrajectory(waypoints_l4_score_67, 1.2)
+        l2_score_67 = trajectory_library.load_trajectory('l2_score_67')
+        l3_score_67 = trajectory_library.load_trajectory('l3_score_67')
+        l4_score_67 = trajectory_library.load_trajectory('l4_score_67')
+        print(f'Loaded trajectories in {1000 * (time.perf_counter() - library_start):.1f} ms '
+              f'({trajectory_library.get_library().fallbacks} generated at runtime)')
 
         wpilib.SmartDashboard.putData('l2 67 score trajectory', FollowTrajectory(container=self, current_trajectory=l2_score_67, wait_to_finish=True))
         wpilib.SmartDashboard.putData('l3 67 score trajectory', FollowTrajectory(container=self, current_trajectory=l3_score_67, wait_to_finish=True))
@@ -321,12 +317,24 @@ class RobotContainer:
 
         wpilib.SmartDashboard.putData('GoToScore', Score(container=self))
         wpilib.SmartDashboard.putData('GoToStow', GoToStow(container=self))
+        wpilib.SmartDashboard.putData('GoToStowCoordinated', GoToPositionCoordinated(container=self, position='stow'))
+        wpilib.SmartDashboard.putData('GoToL4Coordinated', GoToPositionCoordinated(container=self, position='l4'))
 
         wpilib.SmartDashboard.putData('Move climber up', MoveClimber(self, self.climber, 'incremental', math.radians(5)))
         wpilib.SmartDashboard.putData('Move climber down', MoveClimber(self, self.climber, 'incremental', math.radians(-5)))
 
         SmartDashboard.putData("Go to 60 deg pid", commands2.cmd.runOnce(lambda: self.pivot.set_goal(math.radians(60), False), self.pivot))
         SmartDashboard.putData("Go to 90 deg pid", commands2.cmd.runOnce(lambda: self.pivot.set_goal(math.radians(90), False), self.pivot))
+        # flip elevator and pivot between rio and spark profiling to compare settle time and rio cpu (see their _settle_s and _periodic_ms)
+        SmartDashboard.putData("Profile on rio", commands2.cmd.runOnce(
+            lambda: [mechanism.set_control_mode('trapezoid') for mechanism in [self.elevator, self.pivot]], self.elevator, self.pivot).ignoringDisable(True))
+        SmartDashboard.putData("Profile on spark", commands2.cmd.runOnce(
+            lambda: [mechanism.set_control_mode('maxmotion') for mechanism in [self.elevator, self.pivot]], self.elevator, self.pivot).ignoringDisable(True))
+        # feedforward characterization - each one stops itself short of the end of travel and saves an .npz for tools/fit_feedforward.py
+        for mechanism in ['elevator', 'pivot']:
+            for test in ['quasistatic', 'dynamic']:
+                for direction, label in [(1, 'forward'), (-1, 'reverse')]:
+                    SmartDashboard.putData(f'Characterize {mechanism} {test} {label}', Characterize(self, mechanism, test, direction))
 
         # quick way to test all scoring positions from dashboard
         self.score_test_chooser = wpilib.SendableChooser()
@@ -0,0 +1,56 @@
+"""
+Where the wrist is allowed to spin, as a boolean grid over (elevator height, pivot angle)
+Shared by CustomTrajectory (checking and repairing trajectories offline) and Wrist.is_safe_to_move (on the robot)
+numpy only - the default region reads its limits from WristConstants, everything else can be built without wpilib
+"""
+import math
+import numpy as np
+
+
+class SafeRegion:
+    """ safe[i, j] is True when the wrist may move with the elevator at heights[i] (m) and the pivot at angles[j] (rad)
+    Lookups snap to the nearest cell and clamp outside the grid, so any input gives an answer
+    """
+
+    def __init__(self, heights, angles, safe) -> None:
+        self.heights = np.asarray(heights, dtype=float)
+        self.angles = np.asarray(angles, dtype=float)
+        self.safe = np.asarray(safe, dtype=bool)
+        if self.safe.shape != (len(self.heights), len(self.angles)):
+            raise ValueError(f'safe grid is {self.safe.shape}, expected {(len(self.heights), len(self.angles))}')
+        self.height_step = self.heights[1] - self.heights[0]
+        self.angle_step = self.angles[1] - self.angles[0]
+
+    @classmethod
+    def from_limits(cls, min_unsafe_angle, max_unsafe_angle, max_unsafe_height, height_range=(0.0, 1.8),
+                    angle_range=(-math.pi, 2 * math.pi), height_step=0.01, angle_step=math.radians(1)):
+        """ the rule we have always used: pivot between the two angles and elevator below the height means don't spin """
+        heights = np.arange(height_range[0], height_range[1] + height_step / 2, height_step)
+        angles = np.arange(angle_range[0], angle_range[1] + angle_step / 2, angle_step)
+        unsafe = (heights[:, None] < max_unsafe_height) & (angles[None, :] > min_unsafe_angle) & (angles[None, :] < max_unsafe_angle)
+        return cls(heights, angles, ~unsafe)
+
+    def _indices(self, heights, angles):
+        rows = np.clip(np.rint((np.asarray(heights, dtype=float) - self.heights[0]) / self.height_step), 0, len(self.heights) - 1).astype(int)
+        cols = np.clip(np.rint((np.asarray(angles, dtype=float) - self.angles[0]) / self.angle_step), 0, len(self.angles) - 1).astype(int)
+        return rows, cols
+
+    def is_safe(self, heights, angles):
+        """ heights in meters, angles in radians - scalars give a bool, arrays give a bool array """
+        rows, cols = self._indices(heights, angles)
+        result = self.safe[rows, cols]
+        return bool(result) if np.ndim(result) == 0 else result
+
+
+_default_region = None
+
+
+def default_region() -> SafeRegion:
+    """ the region from WristConstants - built once, on first use """
+    global _default_region
+    if _default_region is None:
+        from constants import WristConstants  # here so numpy-only users can still import this module
+        _default_region = SafeRegion.from_limits(WristConstants.k_min_arm_angle_where_spinning_dangerous,
+                                                 WristConstants.k_max_arm_angle_where_spinning_dangerous,
+                                                 WristConstants.k_max_elevator_height_where_spinning_dangerous)
+    return _default_region
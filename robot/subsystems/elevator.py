@@ -1,5 +1,11 @@
+import collections
+import threading
+import time
 import commands2
 import wpimath.controller
+import wpimath.estimator
+import wpimath.filter
+import wpimath.system
 import wpimath.trajectory
 import rev
 import wpilib
@@ -7,6 +13,33 @@ from wpimath.units import inchesToMeters
 import math
 
 from constants import ElevatorConstants
+from subsystems.fast_loop import SetpointBuffer
+
+
+def elevator_plant() -> wpimath.system.LinearSystem_2_1_1:
+    """ position / velocity model of the carriage, driven by volts - the same numbers physics.py gives ElevatorSim
+    (gearing halved because the cascade moves the carriage twice as fast as the chain)
+    This is what LinearSystemId.elevatorSystem builds, written out so we get exactly one output: position
+    """
+    motor = ElevatorConstants.k_plant
+    gearing = ElevatorConstants.k_gear_ratio / 2
+    radius = ElevatorConstants.k_effective_pulley_diameter / 2
+    mass = ElevatorConstants.k_mass_kg
+    a = -gearing ** 2 * motor.Kt / (motor.R * radius ** 2 * mass * motor.Kv)
+    b = gearing * motor.Kt / (motor.R * radius * mass)
+    return wpimath.system.LinearSystem_2_1_1([[0, 1], [0, a]], [[0], [b]], [[1, 0]], [[0]])
+
+
+def elevator_state_space_loop(period=0.02) -> wpimath.system.LinearSystemLoop_2_1_1:
+    """ LQR on the plant above, latency compensated, with a Kalman filter on the encoder """
+    plant = elevator_plant()
+    controller = wpimath.controller.LinearQuadraticRegulator_2_1(
+        plant, (ElevatorConstants.k_lqr_position_tolerance, ElevatorConstants.k_lqr_velocity_tolerance),
+        (ElevatorConstants.k_lqr_max_volts,), period)
+    controller.latencyCompensate(plant, period, ElevatorConstants.k_state_space_latency)
+    observer = wpimath.estimator.KalmanFilter_2_1_1(plant, ElevatorConstants.k_kalman_model_std_devs,
+                                                    (ElevatorConstants.k_kalman_encoder_std_dev,), period)
+    return wpimath.system.LinearSystemLoop_2_1_1(plant, controller, observer, ElevatorConstants.k_lqr_max_volts, period)
 
 
 class Elevator(commands2.TrapezoidProfileSubsystem):
@@ -38,6 +71,13 @@ class Elevator(commands2.TrapezoidProfileSubsystem):
         self.tolerance = 0.03  # meters - then we will be "at goal"
         self.goal = ElevatorConstants.k_min_height
         self.at_goal = True
+        # at_goal is worked out every loop, not with the telemetry - commands waiting on it shouldn't lose up to 10 loops
+        self.settle_debouncer = wpimath.filter.Debouncer(ElevatorConstants.k_settle_debounce_time, wpimath.filter.Debouncer.DebounceType.kRising)
+        self.position = self.goal
+        self.velocity = 0
+        self.acceleration = 0  # m/s^2 of the carriage, smoothed - the pivot's gravity feedforward leans on it
+        self.acceleration_filter = wpimath.filter.LinearFilter.movingAverage(5)
+        self.error = 0
 
         # initialize the motors and keep a list of them for configuration later
         self.motor = rev.SparkMax(ElevatorConstants.k_CAN_id, rev.SparkMax.MotorType.kBrushless)
@@ -58,18 +98,161 @@ class Elevator(commands2.TrapezoidProfileSubsystem):
         self.encoder = self.motor.getEncoder()
         self.encoder.setPosition(self.goal)
 
-        self.enable()
+        # optional 200 Hz profile on the fast loop - see attach_fast_loop
+        self.use_fast_loop = False
+        self.goal_buffer = SetpointBuffer(self.goal)
+        self.fast_profile = wpimath.trajectory.TrapezoidProfile(wpimath.trajectory.TrapezoidProfile.Constraints(
+            ElevatorConstants.k_max_velocity_meter_per_second, ElevatorConstants.k_max_acceleration_meter_per_sec_squared))
+        self.fast_state = wpimath.trajectory.TrapezoidProfile.State(self.goal, 0)
+        self.fast_period = 0.02
+        self.tracking = False  # True while something else (FollowTrajectory) supplies the whole state - see track_state
+        # run_profile is on the notifier thread - whoever holds this owns the motor, so the mode / tracking handoff and
+        # fast_state change in one piece and the two threads never both send a reference in the same cycle
+        self.control_lock = threading.RLock()
+
+        # instrumentation for comparing the control modes - how long moves take to settle and what periodic costs us
+        self.goal_time = None
+        self.settle_times = collections.deque(maxlen=50)  # s from set_goal to at_goal
+        self.periodic_times = collections.deque(maxlen=50)  # s of rio time per periodic call
+
+        self.state_space_loop = None  # built the first time we switch to state_space
+        self.control_mode = None
+        self.set_control_mode(ElevatorConstants.k_control_mode)
+
+    def set_control_mode(self, mode) -> None:
+        """ 'trapezoid': the rio steps the profile and sends a setpoint every loop
+        'maxmotion': the spark runs the profile itself - one frame per goal, with the gravity feedforward worked out then
+        'state_space': the rio steps the profile and an LQR + Kalman loop turns it into volts (kG still covers gravity)
+        """
+        if mode not in ['trapezoid', 'maxmotion', 'state_space']:
+            raise ValueError(f'{self.getName()}: unknown control mode {mode}')
+        with self.control_lock:
+            self.control_mode = mode
+            if self.tracking:
+                return  # stop_tracking hands back to whichever mode we are in
+            if mode == 'state_space':
+                self.reset_state_space()
+            if mode == 'maxmotion':
+                self.disable()  # the base profile keeps stepping (it's cheap) but never calls useState
+                self.send_maxmotion_goal()
+            elif mode == 'state_space' or not self.use_fast_loop:
+                self.setGoal(self.goal)
+                self.enable()
+            else:  # trapezoid on the fast loop - the base profile may still be enabled from state_space
+                self.disable()
+                self.fast_state = wpimath.trajectory.TrapezoidProfile.State(self.get_height(), 0)
+
+    def send_maxmotion_goal(self) -> None:
+        # only gravity - the spark's own profile has no velocity to feed forward from here
+        feedforward = self.feedforward.calculate(0)
+        self.controller.setReference(self.goal, rev.SparkMax.ControlType.kMAXMotionPositionControl, rev.ClosedLoopSlot.kSlot1,
+                                     arbFeedforward=feedforward)
+
+    def reset_state_space(self) -> None:
+        """ start the observer from where the carriage really is so the first output doesn't kick """
+        if self.state_space_loop is None:
+            self.state_space_loop = elevator_state_space_loop()
+        self.state_space_loop.reset([self.encoder.getPosition(), self.encoder.getVelocity()])
+
+    def run_state_space(self, setpoint: wpimath.trajectory.TrapezoidProfile.State) -> None:
+        self.state_space_loop.setNextR([setpoint.position, setpoint.velocity])
+        self.state_space_loop.correct([self.encoder.getPosition()])
+        self.state_space_loop.predict(0.02)
+        volts = self.state_space_loop.U(0) + self.feedforward.calculate(0)  # the model has no gravity - kG does that part
+        self.controller.setReference(volts, rev.SparkMax.ControlType.kVoltage)
+
+    def get_settle_stats(self):
+        """ (last, mean, max) seconds from set_goal to at_goal over the recent moves """
+        if len(self.settle_times) == 0:
+            return 0, 0, 0
+        return self.settle_times[-1], sum(self.settle_times) / len(self.settle_times), max(self.settle_times)
+
+    def get_periodic_stats(self):
+        """ (mean, max) ms of rio time spent in periodic over the last 50 loops """
+        if len(self.periodic_times) == 0:
+            return 0, 0
+        return 1000 * sum(self.periodic_times) / len(self.periodic_times), 1000 * max(self.periodic_times)
+
+    def attach_fast_loop(self, fast_loop) -> None:
+        """Step our own trapezoid profile on the fast loop - the base class keeps profiling but stops calling useState"""
+        if self.control_mode != 'trapezoid':
+            print(f'{self.getName()}: the fast loop only runs the trapezoid mode - not attaching in {self.control_mode} mode')
+            return
+        with self.control_lock:
+            self.fast_period = fast_loop.period
+            self.fast_state = wpimath.trajectory.TrapezoidProfile.State(self.get_height(), 0)
+            self.goal_buffer.set(self.goal)
+            self.disable()
+            self.use_fast_loop = True
+        fast_loop.register('elevator_profile', self.run_profile)
+
+    def run_profile(self) -> None:
+        """Fast loop callback - runs on the notifier thread, goal comes in through goal_buffer"""
+        goal = wpimath.trajectory.TrapezoidProfile.State(self.goal_buffer.get(), 0)
+        with self.control_lock:
+            if self.tracking or self.control_mode != 'trapezoid':
+                return  # track_state, the spark or the state space loop is driving us
+            self.fast_state = self.fast_profile.calculate(self.fast_period, self.fast_state, goal)
+            self.useState(self.fast_state)
 
     def useState(self, setpoint: wpimath.trajectory.TrapezoidProfile.State) -> None:
-        # Calculate the feedforward from the setpoint
-        # print("SETPOINT POSITION: " + str(math.degrees(setpoint.position)))
-        feedforward = self.feedforward.calculate(setpoint.velocity/2)  # the 2 corrects for the 2x carriage speed
+        with self.control_lock:  # the base profile calls this from the main thread, run_profile from the fast loop
+            if self.control_mode == 'state_space':
+                self.run_state_space(setpoint)
+                return
+            # Calculate the feedforward from the setpoint
+            # print("SETPOINT POSITION: " + str(math.degrees(setpoint.position)))
+            feedforward = self.feedforward.calculate(setpoint.velocity/2)  # the 2 corrects for the 2x carriage speed
 
-        # Add the feedforward to the PID output to get the motor output
-        # TODO - check if the feedforward is correct in units for the sparkmax - documentation says 32, not 12
-        self.controller.setReference(setpoint.position, rev.SparkMax.ControlType.kPosition, rev.ClosedLoopSlot.kSlot0, arbFeedforward=feedforward)
+            # Add the feedforward to the PID output to get the motor output
+            # TODO - check if the feedforward is correct in units for the sparkmax - documentation says 32, not 12
+            self.controller.setReference(setpoint.position, rev.SparkMax.ControlType.kPosition, rev.ClosedLoopSlot.kSlot0, arbFeedforward=feedforward)
         # self.goal = setpoint.position  # don't want this - unless we want to plot the trapezoid
 
+    def track_state(self, position, velocity, acceleration, dt=0.02) -> None:
+        """ Follow a setpoint that already has its own velocity and acceleration (e.g. from a CustomTrajectory)
+        No trapezoid - the profile is the caller's.  Feedforward uses the two-velocity form so kA sees the acceleration
+        """
+        position = min(max(position, ElevatorConstants.k_min_height), ElevatorConstants.k_max_height)
+        # the 2 corrects for the 2x carriage speed, same as useState
+        feedforward = self.feedforward.calculate(currentVelocity=velocity / 2, nextVelocity=(velocity + acceleration * dt) / 2)
+        with self.control_lock:
+            if not self.tracking:
+                self.disable()  # the base profile keeps running but stops calling useState
+                self.tracking = True
+            # keep the base profile following along so there is no jump when we hand back to it
+            self.goal = position
+            self.setGoal(position)
+            self.goal_buffer.set(position)
+            self.controller.setReference(position, rev.SparkMax.ControlType.kPosition, rev.ClosedLoopSlot.kSlot0, arbFeedforward=feedforward)
+        self.at_goal = False
+
+    def set_voltage(self, volts) -> None:
+        """ Open loop volts, e.g. for characterization - stop_tracking hands back to the profile, holding where we ended up """
+        position = min(max(self.encoder.getPosition(), ElevatorConstants.k_min_height), ElevatorConstants.k_max_height)
+        with self.control_lock:
+            if not self.tracking:
+                self.disable()
+                self.tracking = True  # also keeps the fast loop's run_profile out of the way
+            self.goal = position
+            self.setGoal(position)
+            self.goal_buffer.set(position)
+            self.controller.setReference(volts, rev.SparkMax.ControlType.kVoltage)
+        self.at_goal = False
+
+    def stop_tracking(self) -> None:
+        """ hand control back to the trapezoid profile, holding wherever we were last sent """
+        with self.control_lock:
+            if self.tracking:
+                self.tracking = False
+                self.fast_state = wpimath.trajectory.TrapezoidProfile.State(self.goal, 0)
+                if self.control_mode == 'maxmotion':
+                    self.send_maxmotion_goal()
+                elif self.control_mode == 'state_space' or not self.use_fast_loop:
+                    if self.control_mode == 'state_space':
+                        self.reset_state_space()
+                    self.enable()
+
     def set_brake_mode(self, mode='brake'):
         if mode == 'brake':
             ElevatorConstants.k_config.setIdleMode(rev.SparkBaseConfig.IdleMode.kBrake)
@@ -84,6 +267,9 @@ class Elevator(commands2.TrapezoidProfileSubsystem):
     def get_height(self):
         return self.encoder.getPosition()
 
+    def get_velocity(self):
+        return self.encoder.getVelocity()  # m/s
+
     def set_goal(self, goal):
         # make our own sanity-check on the subsystem's setGoal function
         goal = goal if goal < ElevatorConstants.k_max_height else ElevatorConstants.k_max_height
@@ -91,7 +277,12 @@ class Elevator(commands2.TrapezoidProfileSubsystem):
         self.goal = goal
         # print(f'setting goal to {self.goal}')
         self.setGoal(self.goal)
+        self.goal_buffer.set(self.goal)
+        with self.control_lock:
+            if self.control_mode == 'maxmotion' and not self.tracking:
+                self.send_maxmotion_goal()
         self.at_goal = False
+        self.goal_time = wpilib.Timer.getFPGATimestamp()
 
     def move_meters(self, delta_meters: float, silent=False) -> None:  # way to bump up and down for testing
         current_position = self.get_height()
@@ -101,24 +292,42 @@ class Elevator(commands2.TrapezoidProfileSubsystem):
             message = f'setting {self.getName()} from {current_position:.2f} to {self.goal:.2f}'
             print(message)
 
+    def get_acceleration(self):
+        return self.acceleration
+
     def get_at_goal(self):
         return self.at_goal
 
+    def update_at_goal(self) -> None:
+        """ every loop: settled means inside the tolerance and nearly stopped, and it has to stay that way for the debounce time """
+        self.position = self.encoder.getPosition()
+        velocity = self.encoder.getVelocity()
+        self.acceleration = self.acceleration_filter.calculate((velocity - self.velocity) / 0.02)
+        self.velocity = velocity
+        self.error = self.position - self.goal
+        settled = math.fabs(self.error) < self.tolerance and math.fabs(self.velocity) < ElevatorConstants.k_settle_velocity
+        self.at_goal = self.settle_debouncer.calculate(settled)
+        if self.at_goal and self.goal_time is not None:
+            self.settle_times.append(wpilib.Timer.getFPGATimestamp() - self.goal_time)
+            self.goal_time = None
+
     def periodic(self) -> None:
+        start_time = time.perf_counter()
         # What if we didn't call the below for a few cycles after we set the position?
         super().periodic()  # this does the automatic motion profiling in the background
         self.counter += 1
+        self.update_at_goal()
+        self.periodic_times.append(time.perf_counter() - start_time)
         if self.counter % 10 == 0:
-            self.position = self.encoder.getPosition()
-            self.at_goal = math.fabs(self.position - self.goal) < self.tolerance  # maybe we want to call this an error
-            self.error = self.position - self.goal
-
             if ElevatorConstants.k_nt_debugging:  # add additional info to NT for debugging
                 wpilib.SmartDashboard.putBoolean(f'{self.getName()}_at_goal', self.at_goal)
                 wpilib.SmartDashboard.putNumber(f'{self.getName()}_error', self.error)
                 wpilib.SmartDashboard.putNumber(f'{self.getName()}_goal', self.goal)
                 # wpilib.SmartDashboard.putNumber(f'{self.getName()}_curr_sp',) not sure how to ask for this - controller won't give it
                 wpilib.SmartDashboard.putNumber(f'{self.getName()}_output', self.motor.getAppliedOutput())
-            self.is_moving = abs(self.encoder.getVelocity()) > 0.001  # m per second
+                wpilib.SmartDashboard.putString(f'{self.getName()}_control_mode', self.control_mode)
+                wpilib.SmartDashboard.putNumberArray(f'{self.getName()}_settle_s', self.get_settle_stats())
+                wpilib.SmartDashboard.putNumberArray(f'{self.getName()}_periodic_ms', self.get_periodic_stats())
+            self.is_moving = abs(self.velocity) > 0.001  # m per second
             wpilib.SmartDashboard.putBoolean(f'{self.getName()}_is_moving', self.is_moving)
             wpilib.SmartDashboard.putNumber(f'{self.getName()}_spark_pos', self.position * 1000)  #  make it mm
\ No newline at end of file
@@ -0,0 +1,128 @@
+import threading
+import time
+import wpilib
+from commands2 import Subsystem
+
+import constants
+from constants import FastLoopConstants
+
+
+class SetpointBuffer:
+    """ Single-slot mailbox for handing a setpoint from the main loop to the fast loop
+    Writers overwrite, readers always get the newest value - nobody ever waits on anybody else
+    """
+
+    def __init__(self, value=None) -> None:
+        self.lock = threading.Lock()
+        self.value = value
+        self.timestamp = 0
+        self.version = 0  # bumps on every set so the reader can tell when something new arrived
+
+    def set(self, value) -> None:
+        with self.lock:
+            self.value = value
+            self.timestamp = wpilib.Timer.getFPGATimestamp()
+            self.version += 1
+
+    def get(self):
+        with self.lock:
+            return self.value
+
+    def get_with_version(self):
+        with self.lock:
+            return self.value, self.version
+
+
+class FastLoop(Subsystem):
+    """ Fast control loop
+    Runs registered callbacks on a wpilib.Notifier every k_period (5 ms) instead of in the 20 ms robot loop
+    Callbacks run on the notifier thread - only hand them data through a SetpointBuffer
+    Keeps per-callback timing (last, average, max) and counts overruns of the whole loop
+    """
+
+    def __init__(self, period=FastLoopConstants.k_period) -> None:
+        super().__init__()
+        self.setName('FastLoop')
+        self.counter = FastLoopConstants.k_counter_offset
+        self.period = period
+
+        self.callbacks = {}  # name -> callback, run in registration order
+        self.stats = {}  # name -> {'last', 'average', 'max', 'count'} in seconds
+        self.loop_count = 0
+        self.overruns = 0
+        self.lock = threading.Lock()  # protects callbacks and stats between the two threads
+
+        self.notifier = wpilib.Notifier(self._run)
+        self.notifier.setName('FastLoop')
+        self.running = False
+
+    def register(self, name, callback) -> None:
+        with self.lock:
+            self.callbacks[name] = callback
+            self.stats[name] = {'last': 0, 'average': 0, 'max': 0, 'count': 0}
+        if not self.running:
+            self.start()
+
+    def unregister(self, name) -> None:
+        with self.lock:
+            self.callbacks.pop(name, None)
+            self.stats.pop(name, None)
+
+    def start(self) -> None:
+        self.notifier.startPeriodic(self.period)
+        self.running = True
+
+    def stop(self) -> None:
+        self.notifier.stop()
+        self.running = False
+
+    def _run(self) -> None:
+        loop_start = time.perf_counter()
+        with self.lock:
+            callbacks = list(self.callbacks.items())
+
+        durations = []
+        for name, callback in callbacks:
+            start = time.perf_counter()
+            try:
+                callback()
+            except Exception as e:  # one bad callback should not take the others down with it
+                print(f'FastLoop callback {name} raised {e}')
+            durations.append((name, time.perf_counter() - start))
+
+        with self.lock:
+            for name, duration in durations:
+                stats = self.stats.get(name)
+                if stats is None:  # unregistered while we were running it
+                    continue
+                stats['last'] = duration
+                stats['average'] += 0.02 * (duration - stats['average'])  # slow moving average
+                stats['max'] = max(stats['max'], duration)
+                stats['count'] += 1
+            self.loop_count += 1
+            if time.perf_counter() - loop_start > self.period:
+                self.overruns += 1
+
+    def get_stats(self) -> dict:
+        """ copy of the timing stats so the caller can look at them without holding our lock """
+        with self.lock:
+            return {name: dict(stats) for name, stats in self.stats.items()}
+
+    def reset_stats(self) -> None:
+        with self.lock:
+            for stats in self.stats.values():
+                stats.update({'last': 0, 'average': 0, 'max': 0, 'count': 0})
+            self.overruns = 0
+
+    def periodic(self) -> None:
+        self.counter += 1
+
+        if self.counter % 10 == 0:
+            stats = self.get_stats()
+            wpilib.SmartDashboard.putNumber('_fast_loop_overruns', self.overruns)
+            for name, values in stats.items():  # milliseconds are easier to read on the dash
+                wpilib.SmartDashboard.putNumberArray(f'_fast_loop_{name}_ms',
+                                                     [1000 * values['last'], 1000 * values['average'], 1000 * values['max']])
+
+            if constants.FastLoopConstants.k_nt_debugging:
+                wpilib.SmartDashboard.putNumber('_fast_loop_count', self.loop_count)
@@ -4,6 +4,7 @@ import rev
 import wpilib
 from wpimath.system.plant import DCMotor
 from commands2 import Subsystem
+from wpimath.filter import Debouncer, MedianFilter
 from wpilib import SmartDashboard
 from rev import ClosedLoopSlot, SparkMax, SparkMaxConfig, SparkMaxSim, SparkMax
 from playingwithfusion import TimeOfFlight
@@ -32,21 +33,95 @@ class Intake(Subsystem):
 
         wpilib.SmartDashboard.putNumber("SET intake volts", 0)
 
+        # current spike detection - updated every loop in periodic
+        self.reference = 0
+        self.reference_time = 0
+        self.current = 0
+        self.current_spike = False
+        self.current_debouncer = Debouncer(constants.IntakeConstants.k_current_spike_debounce_time, Debouncer.DebounceType.kRising)
+
+        # the TOF is read once per loop in periodic - everyone else gets the cached, filtered answer
+        self.tof_filter = MedianFilter(constants.IntakeConstants.k_tof_median_window)
+        self.tof_raw = 0
+        self.tof_distance = 0
+        self.tof_timestamp = 0
+        self.coral_present = False
+        self.first_change_timestamp = None  # first raw sample that disagreed with coral_present - where latency starts
+        self.detection_latency = 0  # s from that sample to the filtered edge
+        self.listeners = {'acquired': [], 'released': []}
+
     def set_reference(self, value: float, control_type: SparkMax.ControlType = rev.SparkBase.ControlType.kVoltage):
+        if value != self.reference:  # the motor spins up again, so give the inrush time to pass
+            self.reference_time = wpilib.Timer.getFPGATimestamp()
+        self.reference = value
         self.controller.setReference(value, control_type)
 
+    def get_current(self) -> float:
+        return self.current
+
+    def has_current_spike(self) -> bool:
+        """ something is stalling the rollers - a piece coming in, or one jammed on the way out """
+        return self.current_spike
+
+    def has_algae(self) -> bool:
+        # no sensor for algae - a spike while pulling algae in is the best we have
+        return self.current_spike and self.reference == constants.IntakeConstants.k_algae_intaking_voltage
+
     def get_distance(self):
-        average_coral_distance = (self.TOFSensorCoral.getRange() + self.TOFSensorCoral.getRange()) / 2
-        average_coral_distance = 0 if average_coral_distance > 500 else average_coral_distance  # correct for weird stuff
-        return average_coral_distance
+        return self.tof_distance
 
     def has_coral(self) -> bool:
-        coral_distance = self.get_distance()
-        # reads 0 when no signal, so it has to be between 1 and the actual number of mm
-        coral_present = 4 < coral_distance <= constants.IntakeConstants.k_max_tof_distance_where_we_have_coral
-        return coral_present
+        return self.coral_present
+
+    def get_detection_latency(self) -> float:
+        """ s from the first TOF read that saw the change to the filtered edge - the sensor's own 50 ms sample time comes on top """
+        return self.detection_latency
+
+    def subscribe(self, event, callback) -> None:
+        """ callback(timestamp) runs from periodic on the loop the filtered TOF changes - event is 'acquired' or 'released' """
+        self.listeners[event].append(callback)
+
+    def unsubscribe(self, event, callback) -> None:
+        if callback in self.listeners[event]:
+            self.listeners[event].remove(callback)
+
+    def sample_tof(self) -> None:
+        """ one read per loop, median filtered, with hysteresis on the way out """
+        self.tof_timestamp = wpilib.Timer.getFPGATimestamp()
+        distance = self.TOFSensorCoral.getRange()
+        self.tof_raw = 0 if distance > 500 else distance  # correct for weird stuff
+        self.tof_distance = self.tof_filter.calculate(self.tof_raw)
+
+        # reads 0 when no signal, so it has to be between the min and the actual number of mm
+        min_distance = constants.IntakeConstants.k_min_tof_distance_where_we_have_coral
+        max_distance = constants.IntakeConstants.k_max_tof_distance_where_we_have_coral
+        if self.coral_present:
+            max_distance += constants.IntakeConstants.k_tof_hysteresis
+        raw_present = min_distance < self.tof_raw <= max_distance
+        present = min_distance < self.tof_distance <= max_distance
+
+        if raw_present == self.coral_present:
+            self.first_change_timestamp = None
+        elif self.first_change_timestamp is None:
+            self.first_change_timestamp = self.tof_timestamp
+
+        if present != self.coral_present:
+            self.coral_present = present
+            start = self.first_change_timestamp if self.first_change_timestamp is not None else self.tof_timestamp
+            self.detection_latency = self.tof_timestamp - start
+            self.first_change_timestamp = None
+            for callback in list(self.listeners['acquired' if present else 'released']):
+                callback(self.tof_timestamp)
+
+    def update_current(self) -> None:
+        self.current = self.sparkmax.getOutputCurrent()
+        spinning_up = wpilib.Timer.getFPGATimestamp() - self.reference_time < constants.IntakeConstants.k_current_inrush_time
+        over = self.reference != 0 and not spinning_up and self.current > constants.IntakeConstants.k_current_spike_amps
+        self.current_spike = self.current_debouncer.calculate(over)
 
     def periodic(self) -> None:
+        self.update_current()
+        self.sample_tof()
         # print(f"setting reserefsersf to {wpilib.SmartDashboard.getNumber('SET intake volts', 0)}")
         # self.controller.setReference(wpilib.SmartDashboard.getNumber("SET intake volts", 0), SparkMax.ControlType.kVoltage)
 
@@ -60,7 +135,10 @@ class Intake(Subsystem):
             wpilib.SmartDashboard.putNumber('intake_tof', self.get_distance())
 
             if constants.IntakeConstants.k_nt_debugging:  # extra debugging info for NT
-                pass
+                wpilib.SmartDashboard.putNumber('intake_current', self.current)
+                wpilib.SmartDashboard.putBoolean('intake_current_spike', self.current_spike)
+                wpilib.SmartDashboard.putNumber('intake_tof_raw', self.tof_raw)
+                wpilib.SmartDashboard.putNumber('intake_tof_latency_ms', 1000 * self.detection_latency)
 
         self.counter += 1
         return super().periodic()
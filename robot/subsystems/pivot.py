@@ -1,5 +1,8 @@
+import collections
+import time
 import commands2
 import wpimath.controller
+import wpimath.filter
 import wpimath.trajectory
 import rev
 import wpilib
@@ -7,6 +10,7 @@ from wpimath.units import inchesToMeters, radiansToDegrees, degreesToRadians
 import math
 
 import constants
+import gravity_table
 
 
 class Pivot(commands2.TrapezoidProfileSubsystem):
@@ -59,17 +63,86 @@ class Pivot(commands2.TrapezoidProfileSubsystem):
         self.setName(constants.ShoulderConstants.k_name)
         self.counter = constants.ShoulderConstants.k_counter_offset
         self.is_moving = False  # may want to keep track of if we are in motion
-        self.tolerance = 0.087  # rads equal to five degrees - then we will be "at goal"
+        self.tolerance = constants.ShoulderConstants.k_tolerance  # rads - then we will be "at goal" (same as MovePivot always used)
         self.goal = constants.ShoulderConstants.k_starting_angle
         self.at_goal = True
+        # at_goal is worked out every loop, not with the telemetry - commands waiting on it shouldn't lose up to 10 loops
+        self.settle_debouncer = wpimath.filter.Debouncer(constants.ShoulderConstants.k_settle_debounce_time, wpimath.filter.Debouncer.DebounceType.kRising)
+        self.angle = self.goal
+        self.velocity = 0
+        self.error = 0
+        self.tracking = False  # True while something else (FollowTrajectory) supplies the whole state - see track_state
 
-        self.enable()
+        # gravity from the (pivot, wrist) table instead of kG * cos(angle) - needs set_load_supplier to know the wrist and the piece
+        self.gravity_table = gravity_table.default_table() if constants.ShoulderConstants.k_use_gravity_table else None
+        self.load_supplier = None
+        self.gravity_volts = 0
+
+        # instrumentation for comparing the control modes - how long moves take to settle and what periodic costs us
+        self.goal_time = None
+        self.settle_times = collections.deque(maxlen=50)  # s from set_goal to at_goal
+        self.periodic_times = collections.deque(maxlen=50)  # s of rio time per periodic call
+
+        self.control_mode = None
+        self.set_control_mode(constants.ShoulderConstants.k_control_mode)
         # self.disable()
 
+    def set_control_mode(self, mode) -> None:
+        """ 'trapezoid': the rio steps the profile and sends a setpoint every loop
+        'maxmotion': the spark runs the profile itself - one frame per goal, with the gravity feedforward worked out then
+        """
+        if mode not in ['trapezoid', 'maxmotion']:
+            raise ValueError(f'{self.getName()}: unknown control mode {mode}')
+        self.control_mode = mode
+        if self.tracking:
+            return  # stop_tracking hands back to whichever mode we are in
+        if mode == 'maxmotion':
+            self.disable()  # the base profile keeps stepping (it's cheap) but never calls useState
+            self.send_maxmotion_goal()
+        else:
+            self.setGoal(self.goal)
+            self.enable()
+
+    def set_load_supplier(self, supplier) -> None:
+        """ supplier() -> (wrist angle in rad, load name from ShoulderConstants.k_gravity_loads, elevator acceleration in m/s^2)
+        We are built before the wrist and the intake, so the container hands this in afterwards
+        """
+        self.load_supplier = supplier
+
+    def get_feedforward(self, angle, velocity, next_velocity=None) -> float:
+        """ ArmFeedforward volts, with its kG * cos(angle) swapped for the gravity table when we have one """
+        if next_velocity is None:
+            feedforward = self.feedforward.calculate(angle, velocity)
+        else:
+            feedforward = self.feedforward.calculate(currentAngle=angle, currentVelocity=velocity, nextVelocity=next_velocity)
+        if self.gravity_table is not None and self.load_supplier is not None:
+            wrist_angle, load, elevator_acceleration = self.load_supplier()
+            self.gravity_volts = self.gravity_table.volts_for(angle, wrist_angle, load, elevator_acceleration)
+            feedforward += self.gravity_volts - constants.ShoulderConstants.k_kG_volts * math.cos(angle)
+        return feedforward
+
+    def send_maxmotion_goal(self) -> None:
+        # gravity at the goal angle only - the spark's own profile has no velocity to feed forward from here
+        feedforward = self.get_feedforward(self.goal, 0)
+        self.controller.setReference(self.goal, rev.SparkFlex.ControlType.kMAXMotionPositionControl, rev.ClosedLoopSlot.kSlot1,
+                                     arbFeedforward=feedforward)
+
+    def get_settle_stats(self):
+        """ (last, mean, max) seconds from set_goal to at_goal over the recent moves """
+        if len(self.settle_times) == 0:
+            return 0, 0, 0
+        return self.settle_times[-1], sum(self.settle_times) / len(self.settle_times), max(self.settle_times)
+
+    def get_periodic_stats(self):
+        """ (mean, max) ms of rio time spent in periodic over the last 50 loops """
+        if len(self.periodic_times) == 0:
+            return 0, 0
+        return 1000 * sum(self.periodic_times) / len(self.periodic_times), 1000 * max(self.periodic_times)
+
     def useState(self, setpoint: wpimath.trajectory.TrapezoidProfile.State) -> None:
         # Calculate the feedforward from the setpoint
         # print("SETPOINT POSITION: " + str(math.degrees(setpoint.position)))
-        feedforward = self.feedforward.calculate(setpoint.position, setpoint.velocity)  #
+        feedforward = self.get_feedforward(setpoint.position, setpoint.velocity)
 
         # Add the feedforward to the PID output to get the motor output
         # TODO - check if the feedforward is correct in units for the sparkmax - documentation says 32, not 12
@@ -94,13 +167,33 @@ class Pivot(commands2.TrapezoidProfileSubsystem):
     def get_angle(self):
         return self.encoder.getPosition()
 
+    def get_velocity(self):
+        return self.encoder.getVelocity()  # rad/s
+
+    def get_at_goal(self):
+        return self.at_goal
+
+    def update_at_goal(self) -> None:
+        """ every loop: settled means inside the tolerance and nearly stopped, and it has to stay that way for the debounce time """
+        self.angle = self.encoder.getPosition()
+        self.velocity = self.encoder.getVelocity()
+        self.error = self.angle - self.goal
+        settled = math.fabs(self.error) < self.tolerance and math.fabs(self.velocity) < constants.ShoulderConstants.k_settle_velocity
+        self.at_goal = self.settle_debouncer.calculate(settled)
+        if self.at_goal and self.goal_time is not None:
+            self.settle_times.append(wpilib.Timer.getFPGATimestamp() - self.goal_time)
+            self.goal_time = None
+
     def set_goal(self, goal, use_trapezoid=True):
         # make our own sanity-check on the subsystem's setGoal function
         goal = goal if goal < constants.ShoulderConstants.k_max_angle else constants.ShoulderConstants.k_max_angle
         goal = goal if goal > constants.ShoulderConstants.k_min_angle else constants.ShoulderConstants.k_min_angle
         self.goal = goal
         # print(f'setting goal to {self.goal}')
-        if use_trapezoid:
+        if use_trapezoid and self.control_mode == 'maxmotion':
+            self.setGoal(self.goal)  # keep the (disabled) base profile headed the same way
+            self.send_maxmotion_goal()
+        elif use_trapezoid:
             self.enable()
             self.setGoal(self.goal)
         else:
@@ -108,6 +201,42 @@ class Pivot(commands2.TrapezoidProfileSubsystem):
             self.controller.setReference(goal, rev.SparkMax.ControlType.kPosition, slot=rev.ClosedLoopSlot(2))
 
         self.at_goal = False
+        self.goal_time = wpilib.Timer.getFPGATimestamp()
+
+    def track_state(self, angle, velocity, acceleration, dt=0.02) -> None:
+        """ Follow a setpoint that already has its own velocity and acceleration (e.g. from a CustomTrajectory)
+        No trapezoid - the profile is the caller's.  Feedforward uses the two-velocity form so kA sees the acceleration
+        """
+        if not self.tracking:
+            self.disable()  # the base profile keeps running but stops calling useState
+            self.tracking = True
+        angle = min(max(angle, constants.ShoulderConstants.k_min_angle), constants.ShoulderConstants.k_max_angle)
+        # keep the base profile following along so there is no jump when we hand back to it
+        self.goal = angle
+        self.setGoal(angle)
+        feedforward = self.get_feedforward(angle, velocity, next_velocity=velocity + acceleration * dt)
+        self.controller.setReference(angle, rev.SparkFlex.ControlType.kPosition, rev.ClosedLoopSlot.kSlot0, arbFeedforward=feedforward)
+        self.at_goal = False
+
+    def set_voltage(self, volts) -> None:
+        """ Open loop volts, e.g. for characterization - stop_tracking hands back to the profile, holding where we ended up """
+        if not self.tracking:
+            self.disable()
+            self.tracking = True
+        angle = min(max(self.encoder.getPosition(), constants.ShoulderConstants.k_min_angle), constants.ShoulderConstants.k_max_angle)
+        self.goal = angle
+        self.setGoal(angle)
+        self.controller.setReference(volts, rev.SparkFlex.ControlType.kVoltage)
+        self.at_goal = False
+
+    def stop_tracking(self) -> None:
+        """ hand control back to the trapezoid profile, holding wherever we were last sent """
+        if self.tracking:
+            self.tracking = False
+            if self.control_mode == 'maxmotion':
+                self.send_maxmotion_goal()
+            else:
+                self.enable()
 
     def move_degrees(self, delta_degrees: float, silent=True) -> None:  # way to bump up and down for testing
         current_angle = self.get_angle()
@@ -118,20 +247,23 @@ class Pivot(commands2.TrapezoidProfileSubsystem):
             print(message)
 
     def periodic(self) -> None:
+        start_time = time.perf_counter()
         # What if we didn't call the below for a few cycles after we set the position?
         super().periodic()  # this does the automatic motion profiling in the background
         self.counter += 1
+        self.update_at_goal()
+        self.periodic_times.append(time.perf_counter() - start_time)
         if self.counter % 10 == 0:
-            self.angle = self.encoder.getPosition()
-            self.at_goal = math.fabs(self.angle - self.goal) < self.tolerance  # maybe we want to call this an error
-            self.error = self.angle - self.goal
-
             if constants.ShoulderConstants.k_nt_debugging:  # extra debugging info for NT
                 wpilib.SmartDashboard.putBoolean(f'{self.getName()}_at_goal', self.at_goal)
                 wpilib.SmartDashboard.putNumber(f'{self.getName()}_error', self.error)
                 wpilib.SmartDashboard.putNumber(f'{self.getName()}_goal', self.goal)
                 # wpilib.SmartDashboard.putNumber(f'{self.getName()}_curr_sp',) not sure how to ask for this - controller won't give it
                 wpilib.SmartDashboard.putNumber(f'{self.getName()}_output', self.motor.getAppliedOutput())
-            self.is_moving = abs(self.encoder.getVelocity()) > 0.001  # m per second
+                wpilib.SmartDashboard.putString(f'{self.getName()}_control_mode', self.control_mode)
+                wpilib.SmartDashboard.putNumber(f'{self.getName()}_gravity_volts', self.gravity_volts)
+                wpilib.SmartDashboard.putNumberArray(f'{self.getName()}_settle_s', self.get_settle_stats())
+                wpilib.SmartDashboard.putNumberArray(f'{self.getName()}_periodic_ms', self.get_periodic_stats())
+            self.is_moving = abs(self.velocity) > 0.001  # rad per second
             wpilib.SmartDashboard.putBoolean(f'{self.getName()}_is_moving', self.is_moving)
             wpilib.SmartDashboard.putNumber(f'{self.getName()}_spark_angle', radiansToDegrees(self.angle))
@@ -0,0 +1,137 @@
+import threading
+import numpy as np
+import wpilib
+from commands2 import Subsystem
+
+import constants
+from constants import PowerConstants
+
+
+class PowerMonitor(Subsystem):
+    """ Power monitor
+    Samples the PDH on a background notifier so the main loop never waits on the CAN reads
+    Keeps the last k_history_length samples of voltage, total current and every channel current in a ring buffer
+    Any subsystem can ask for recent peak or average current on its channels without touching the PDH itself
+    Publishes voltage, total current and the top consuming channels to the dash 5 times per second
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.setName('Power')
+        self.counter = PowerConstants.k_counter_offset
+
+        self.pdh = wpilib.PowerDistribution(PowerConstants.k_pdh_CAN_id, wpilib.PowerDistribution.ModuleType.kRev)
+        self.channel_count = self.pdh.getNumChannels()
+
+        # ring buffer - one row per sample.  index always points at the next row to write
+        self.history_length = PowerConstants.k_history_length
+        self.timestamps = np.zeros(self.history_length)
+        self.voltages = np.zeros(self.history_length)
+        self.total_currents = np.zeros(self.history_length)
+        self.channel_currents = np.zeros((self.history_length, self.channel_count))
+        self.index = 0
+        self.sample_count = 0
+        self.lock = threading.Lock()  # the notifier runs on its own thread
+
+        # subsystems register by name so they can ask for their own current later
+        self.subsystem_channels = dict(PowerConstants.k_subsystem_channels)
+
+        self.notifier = wpilib.Notifier(self._sample)
+        self.notifier.setName('PowerMonitor')
+        self.notifier.startPeriodic(PowerConstants.k_sample_period)
+
+    def _sample(self) -> None:
+        # do all the CAN reads before taking the lock so readers never wait on the bus
+        timestamp = wpilib.Timer.getFPGATimestamp()
+        voltage = self.pdh.getVoltage()
+        total_current = self.pdh.getTotalCurrent()
+        currents = self.pdh.getAllCurrents()
+
+        with self.lock:
+            self.timestamps[self.index] = timestamp
+            self.voltages[self.index] = voltage
+            self.total_currents[self.index] = total_current
+            self.channel_currents[self.index, :] = currents
+            self.index = (self.index + 1) % self.history_length
+            self.sample_count += 1
+
+    def _recent_rows(self, window) -> np.ndarray:
+        """ indices of the last window seconds of samples, oldest first - call with the lock held """
+        filled = min(self.sample_count, self.history_length)
+        if filled == 0:
+            return np.zeros(0, dtype=int)
+        rows = (self.index - filled + np.arange(filled)) % self.history_length
+        if window is not None:
+            newest = self.timestamps[rows[-1]]
+            rows = rows[self.timestamps[rows] >= newest - window]
+        return rows
+
+    def get_channels(self, subsystem) -> list:
+        """ accepts a subsystem name from PowerConstants.k_subsystem_channels or a list of PDH channels """
+        if isinstance(subsystem, str):
+            return self.subsystem_channels[subsystem]
+        return list(subsystem)
+
+    def get_voltage(self) -> float:
+        with self.lock:
+            return float(self.voltages[(self.index - 1) % self.history_length])
+
+    def get_total_current(self) -> float:
+        with self.lock:
+            return float(self.total_currents[(self.index - 1) % self.history_length])
+
+    def get_min_voltage(self, window=1.0) -> float:
+        with self.lock:
+            rows = self._recent_rows(window)
+            return float(self.voltages[rows].min()) if len(rows) > 0 else 0.0
+
+    def get_peak_current(self, subsystem, window=1.0) -> float:
+        """ peak of the summed current on the subsystem's channels over the last window seconds """
+        channels = self.get_channels(subsystem)
+        with self.lock:
+            rows = self._recent_rows(window)
+            if len(rows) == 0:
+                return 0.0
+            return float(self.channel_currents[np.ix_(rows, channels)].sum(axis=1).max())
+
+    def get_average_current(self, subsystem, window=1.0) -> float:
+        """ mean of the summed current on the subsystem's channels over the last window seconds """
+        channels = self.get_channels(subsystem)
+        with self.lock:
+            rows = self._recent_rows(window)
+            if len(rows) == 0:
+                return 0.0
+            return float(self.channel_currents[np.ix_(rows, channels)].sum(axis=1).mean())
+
+    def get_history(self, window=None):
+        """ copies of (timestamps, voltages, total currents, channel currents), oldest first """
+        with self.lock:
+            rows = self._recent_rows(window)
+            return (self.timestamps[rows].copy(), self.voltages[rows].copy(),
+                    self.total_currents[rows].copy(), self.channel_currents[rows].copy())
+
+    def get_top_channels(self, count=PowerConstants.k_top_channel_count, window=1.0):
+        """ [(channel, average amps), ...] for the hungriest channels, biggest first """
+        with self.lock:
+            rows = self._recent_rows(window)
+            if len(rows) == 0:
+                return []
+            averages = self.channel_currents[rows].mean(axis=0)
+        top = np.argsort(averages)[::-1][:count]
+        return [(int(channel), float(averages[channel])) for channel in top]
+
+    def periodic(self) -> None:
+        self.counter += 1
+
+        if self.counter % 10 == 0:
+            wpilib.SmartDashboard.putNumber('_pdh_voltage', self.get_voltage())
+            wpilib.SmartDashboard.putNumber('_pdh_current', self.get_total_current())
+
+            top_channels = self.get_top_channels()
+            wpilib.SmartDashboard.putNumberArray('_pdh_top_channels', [channel for channel, _ in top_channels])
+            wpilib.SmartDashboard.putNumberArray('_pdh_top_currents', [current for _, current in top_channels])
+
+            if constants.PowerConstants.k_nt_debugging:  # extra debugging info for NT
+                wpilib.SmartDashboard.putNumber('_pdh_min_voltage', self.get_min_voltage())
+                for name in self.subsystem_channels:
+                    wpilib.SmartDashboard.putNumber(f'_pdh_{name}_avg_current', self.get_average_current(name))
@@ -0,0 +1,145 @@
+import collections
+import numpy as np
+import rev
+import wpilib
+from commands2 import Subsystem
+
+import constants
+from constants import PowerArbiterConstants as pac
+from subsystems.power import PowerMonitor
+
+
+class PowerArbiter(Subsystem):
+    """ Power arbiter
+    Splits a current budget among the big motor groups so everything running at once doesn't brown us out
+    The budget comes from a simple battery model V = Voc - R * I fit to recent PDH history:
+      the most current we can pull and stay above k_min_voltage is (Voc - k_min_voltage) / R
+    Whatever the unmanaged loads are using comes off the top, every group keeps its min_limit,
+    and the rest is handed out by priority (drivetrain weight is configurable) up to each group's max_limit
+    New smart current limits go into a queue and only k_max_configs_per_cycle sparks get reconfigured per loop
+    Turning it off puts back exactly the smart current limit each spark had when it was registered
+    """
+
+    def __init__(self, power: PowerMonitor) -> None:
+        super().__init__()
+        self.setName('PowerArbiter')
+        self.counter = pac.k_counter_offset
+        self.power = power
+        self.enabled = pac.k_enabled
+
+        self.groups = {}  # name -> dict of sparks, limits, priority and bookkeeping
+        self.pending = collections.deque()  # (spark, smartCurrentLimit arguments) waiting to be sent to the sparks
+        self.open_circuit_voltage = pac.k_default_open_circuit_voltage
+        self.internal_resistance = pac.k_default_internal_resistance
+        self.budget = 0
+
+    def register(self, name, sparks, min_limit=None, max_limit=None, priority=None) -> None:
+        """ sparks should include followers - limits are per motor, defaults come from PowerArbiterConstants.k_groups
+        call it after the subsystem has configured its sparks - the limits they have now are what set_enabled(False) restores
+        """
+        defaults = pac.k_groups.get(name, {})
+        sparks = list(sparks)
+        # (stall, free, rpm) straight from each spark's configuration, so the static configs stay the only source of truth
+        static_limits = [(spark.configAccessor.getSmartCurrentLimit(), spark.configAccessor.getSmartCurrentFreeLimit(),
+                          spark.configAccessor.getSmartCurrentRPMLimit()) for spark in sparks]
+        self.groups[name] = {
+            'sparks': sparks,
+            'static_limits': static_limits,
+            'min_limit': min_limit if min_limit is not None else defaults.get('min_limit', 20),
+            'max_limit': max_limit if max_limit is not None else defaults.get('max_limit', 40),
+            'priority': priority if priority is not None else defaults.get('priority', 1),
+            'limit': static_limits[0][0] if static_limits else 0,  # what we last asked the sparks for (stall amps)
+            'last_change_time': -1e6,
+        }
+
+    def set_enabled(self, enabled: bool) -> None:
+        self.enabled = enabled
+        if not enabled:  # hand every spark back the limit it was configured with
+            for name in self.groups:
+                self._restore_static_limits(name)
+
+    def update_battery_model(self) -> None:
+        """ least squares fit of V = Voc - R * I over the recent window - only refit when the current actually moved """
+        _, voltages, currents, _ = self.power.get_history(window=pac.k_model_window)
+        if len(currents) < 10 or np.ptp(currents) < pac.k_min_current_spread:
+            return
+        slope, intercept = np.polyfit(currents, voltages, 1)
+        if slope < 0:  # a positive slope is noise, not a battery
+            self.internal_resistance = -slope
+            self.open_circuit_voltage = intercept
+
+    def allocate(self, budget) -> dict:
+        """ per motor limits for each group: everyone gets min_limit, the rest is water-filled by priority """
+        names = list(self.groups.keys())
+        counts = np.array([len(self.groups[name]['sparks']) for name in names], dtype=float)
+        mins = np.array([self.groups[name]['min_limit'] for name in names], dtype=float) * counts
+        maxes = np.array([self.groups[name]['max_limit'] for name in names], dtype=float) * counts
+        weights = np.array([self.groups[name]['priority'] for name in names], dtype=float)
+
+        allocation = mins.copy()
+        remaining = budget - mins.sum()
+        while remaining > 1e-6:
+            active = allocation < maxes - 1e-6
+            if not active.any():
+                break
+            share = remaining * weights * active / (weights * active).sum()
+            added = np.minimum(share, maxes - allocation)
+            allocation += added
+            remaining -= added.sum()
+
+        return {name: allocation[idx] / counts[idx] for idx, name in enumerate(names)}
+
+    def _request_limit(self, name, limit, force=False) -> None:
+        group = self.groups[name]
+        now = wpilib.Timer.getFPGATimestamp()
+        if not force:
+            if abs(limit - group['limit']) < pac.k_limit_hysteresis:
+                return
+            if now - group['last_change_time'] < pac.k_min_reconfigure_interval:
+                return
+        group['limit'] = limit
+        group['last_change_time'] = now
+        self._queue(group['sparks'], [(int(limit),)] * len(group['sparks']))
+
+    def _restore_static_limits(self, name) -> None:
+        group = self.groups[name]
+        group['limit'] = group['static_limits'][0][0] if group['static_limits'] else 0
+        group['last_change_time'] = wpilib.Timer.getFPGATimestamp()
+        self._queue(group['sparks'], group['static_limits'])
+
+    def _queue(self, sparks, limits) -> None:
+        """ limits are smartCurrentLimit arguments, one tuple per spark - only the newest request for a spark matters """
+        self.pending = collections.deque((spark, value) for spark, value in self.pending if spark not in sparks)
+        self.pending.extend(zip(sparks, limits))
+
+    def _send_pending(self) -> None:
+        for _ in range(min(pac.k_max_configs_per_cycle, len(self.pending))):
+            spark, limits = self.pending.popleft()
+            config = rev.SparkFlexConfig() if isinstance(spark, rev.SparkFlex) else rev.SparkMaxConfig()
+            config.smartCurrentLimit(*limits)
+            # only the current limit changes - no reset and no flash burn
+            spark.configure(config, rev.SparkBase.ResetMode.kNoResetSafeParameters, rev.SparkBase.PersistMode.kNoPersistParameters)
+
+    def periodic(self) -> None:
+        self.counter += 1
+
+        if self.enabled and self.counter % pac.k_update_period_cycles == 0 and len(self.groups) > 0:
+            self.update_battery_model()
+            allowed_current = (self.open_circuit_voltage - pac.k_min_voltage) / self.internal_resistance
+            # loads we don't manage (rio, radio, wrist, intake, turning...) come off the top
+            managed_current = sum(self.power.get_average_current(name, window=0.2) for name in self.groups
+                                  if name in self.power.subsystem_channels)
+            unmanaged_current = max(self.power.get_total_current() - managed_current, 0)
+            self.budget = max(allowed_current - unmanaged_current, 0)
+
+            for name, limit in self.allocate(self.budget).items():
+                self._request_limit(name, limit)
+
+        self._send_pending()
+
+        if self.counter % 10 == 0 and constants.PowerArbiterConstants.k_nt_debugging:
+            wpilib.SmartDashboard.putNumber('_arbiter_budget', self.budget)
+            wpilib.SmartDashboard.putNumber('_arbiter_voc', self.open_circuit_voltage)
+            wpilib.SmartDashboard.putNumber('_arbiter_resistance', self.internal_resistance)
+            for name, group in self.groups.items():
+                wpilib.SmartDashboard.putNumber(f'_arbiter_{name}_limit', group['limit'])
@@ -35,7 +35,7 @@ class Swerve (Subsystem):
 
         self.counter = 0
 
-        self.pdh = wpilib.PowerDistribution(1, wpilib.PowerDistribution.ModuleType.kRev)  # check power and other issues
+        # PDH voltage and current now come from the PowerMonitor subsystem, which samples off the main loop
 
         # Create SwerveModules
         self.frontLeft = SwerveModule(
@@ -460,10 +460,23 @@ class Swerve (Subsystem):
         return [module.getDesiredState() for module in self.swerve_modules]
 
 
+    def attach_fast_loop(self, fast_loop) -> None:
+        # turning PIDs at 200 Hz - only does anything in the 'rio' turning mode
+        for module in self.swerve_modules:
+            module.attach_fast_loop(fast_loop)
+
     def periodic(self) -> None:
 
         self.counter += 1
 
+        # one absolute encoder read per module per loop - everything downstream uses this sample
+        for module in self.swerve_modules:
+            module.sample_turn_encoder()
+            module.update_settle_time()
+            # keep the spark's relative encoder honest against the absolute - once a second is plenty
+            if module.turning_control_mode == 'spark' and self.counter % 50 == 0:
+                module.reseed_turning_encoder()
+
         # send our current time to the dashboard
         ts = wpilib.Timer.getFPGATimestamp()
         wpilib.SmartDashboard.putNumber('_timestamp', ts)
@@ -613,18 +626,9 @@ class Swerve (Subsystem):
             ypr = [self.navx.getYaw(), self.get_pitch(), self.navx.getRoll(), self.navx.getRotation2d().degrees()]
             wpilib.SmartDashboard.putNumberArray('_navx_YPR', ypr)
 
-            # monitor power as well
-            if True: # wpilib.RobotBase.isReal():
-                # there's some kind of voltage simulation but idk if this covers it
-                voltage = self.pdh.getVoltage()
-                total_current = self.pdh.getTotalCurrent()
-            else:
-                # make up a current based on how fast we're going
-                total_current = 2 + 10 * sum([math.fabs(module.drivingEncoder.getVelocity()) for module in self.swerve_modules])
-                voltage = 12.5 - 0.02 * total_current
-
-            wpilib.SmartDashboard.putNumber('_pdh_voltage', voltage)
-            wpilib.SmartDashboard.putNumber('_pdh_current', total_current)
+            # azimuth settling time (last, mean, max) per module - compare 'rio' and 'spark' turning modes
+            for module in self.swerve_modules:
+                wpilib.SmartDashboard.putNumberArray(f'_{module.label}_azimuth_settle', list(module.get_settle_stats()))
 
             if constants.k_swerve_debugging_messages:  # this is just a bit much unless debugging the swerve
                 angles = [m.turningEncoder.getPosition() for m in self.swerve_modules]
@@ -59,6 +59,13 @@ class DriveConstants:
     k_analog_encoder_abs_max = 0.989  # determined by filtering and watching as it flips from 1 to 0
     # we pass this next one to the analog potentiometer object t0 determine the full range
     k_analog_encoder_scale_factor = 1 / k_analog_encoder_abs_max  # 1.011  #so have to scale back up to be b/w 0 and 1
+    # optional hardware oversampling / averaging on the analog inputs - the module samples the encoder once per loop
+    # and everything in that loop uses the same sample.  None leaves the HAL default, which is what we have always run:
+    # 7 average bits (AnalogPotentiometer reads the averaged voltage) and no oversampling.  careful: averaging right at
+    # the 0/2pi rollover blends the two ends together, so the sample can be garbage for a few ms while a wheel crosses it.
+    # bits are powers of 2 - 0 turns averaging off, 2 averages 4 samples
+    k_analog_encoder_average_bits = None
+    k_analog_encoder_oversample_bits = None
 
     # absolute encoder values when wheels facing forward  - 20230322 CJH
     # NOW IN RADIANS to feed right to the AnalogPotentiometer on the module
@@ -150,7 +157,19 @@ class ModuleConstants:
     k_driving_config.encoder.velocityConversionFactor((kWheelDiameterMeters * math.pi) / ( kDrivingMotorReduction * 60)) # meters per second
     # k_driving_config.closedLoop.pidf(0, 0, 0, 0.01)
 
-    # note: we don't use any spark pid or ff for turning
+    # who closes the turning loop: 'rio' is the original PIDController on the roborio at 50 Hz, sending duty cycle
+    # 'spark' seeds the absolute angle into the turning spark's encoder and lets its 1 kHz position loop do the work
+    k_turning_control_mode = 'rio'
+    kTurningSparkP = 0.3  # spark position loop is duty cycle per radian, same units as the rio PID
+    kTurningSparkD = 0.0
+    k_turning_reseed_tolerance = math.radians(2)  # re-seed the spark encoder from the absolute if they drift this far apart
+    k_turning_reseed_max_velocity = 0.05  # rad/s - only re-seed when the module is sitting still
+
+    # azimuth settling-time measurement - a commanded step bigger than the threshold starts the clock
+    k_azimuth_settle_step = math.radians(10)
+    k_azimuth_settle_tolerance = math.radians(2)
+
+    # note: we only use the spark pid for turning when k_turning_control_mode is 'spark'
     k_turning_config = SparkMaxConfig()
     k_turning_config.setIdleMode(SparkMaxConfig.IdleMode.kBrake)
     k_turning_config.smartCurrentLimit(stallLimit=0)
@@ -160,6 +179,11 @@ class ModuleConstants:
 
     k_turning_config.encoder.positionConversionFactor(math.tau/k_turning_motor_gear_ratio) # radian
     k_turning_config.encoder.velocityConversionFactor(math.tau/(k_turning_motor_gear_ratio * 60)) # radians per second
+    # onboard position loop with continuous wrapping, only used in 'spark' turning mode
+    k_turning_config.closedLoop.pid(p=kTurningSparkP, i=0, d=kTurningSparkD)
+    k_turning_config.closedLoop.outputRange(-1, 1)
+    k_turning_config.closedLoop.positionWrappingEnabled(True)
+    k_turning_config.closedLoop.positionWrappingInputRange(-math.pi, math.pi)
 
     kTurningP = 0.3 #  CJH tested this 3/19/2023  and 0.25 was good
     kTurningI = 0.0
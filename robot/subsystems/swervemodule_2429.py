@@ -2,13 +2,15 @@ import wpilib
 from rev import SparkFlexConfig, SparkFlex, SparkFlex
 from wpimath.geometry import Rotation2d
 from wpimath.kinematics import SwerveModuleState, SwerveModulePosition
-from wpilib import AnalogEncoder, AnalogPotentiometer, Spark
+from wpilib import AnalogEncoder, AnalogInput, AnalogPotentiometer, Spark
 from wpimath.controller import PIDController
+import collections
 import math
 
 import constants
 from .swerve_constants import ModuleConstants
 from .swerve_constants import DriveConstants as dc
+from .fast_loop import SetpointBuffer
 
 
 class SwerveModule:
@@ -63,17 +65,29 @@ class SwerveModule:
 
 
         # Setup encoders for the turning SPARKMAX - just to watch it if we need to for velocities, etc.
-        # WE DO NOT USE THIS FOR ANYTHING - THE ABSOLUTE ENCODER IS USED FOR TURNING AND GOES INTO THE RIO ANALOG PORT
+        # in 'rio' mode WE DO NOT USE THIS FOR ANYTHING - THE ABSOLUTE ENCODER IS USED FOR TURNING AND GOES INTO THE RIO ANALOG PORT
+        # in 'spark' mode it is seeded from the absolute encoder and the spark's own position loop runs on it
         self.turningEncoder = self.turningSparkFlex.getEncoder()
+        self.turningClosedLoopController = self.turningSparkFlex.getClosedLoopController()
+        self.turning_control_mode = ModuleConstants.k_turning_control_mode
 
         #  ---------------- ABSOLUTE ENCODER AND PID FOR TURNING  ------------------
         # create the AnalogPotentiometer with the offset.  TODO: this probably has to be 5V hardware but need to check
         # automatically always in radians and the turnover offset is built in, so the PID is easier
         # TODO: double check that the scale factor is the same on the new thrifty potentiometers
-        self.absolute_encoder = AnalogPotentiometer(encoder_analog_port,
+        self.analog_input = AnalogInput(encoder_analog_port)
+        if dc.k_analog_encoder_average_bits is not None:  # None keeps the HAL default of 7
+            self.analog_input.setAverageBits(dc.k_analog_encoder_average_bits)
+        if dc.k_analog_encoder_oversample_bits is not None:
+            self.analog_input.setOversampleBits(dc.k_analog_encoder_oversample_bits)
+        self.absolute_encoder = AnalogPotentiometer(self.analog_input,
                                                     dc.k_analog_encoder_scale_factor * math.tau, -turning_encoder_offset)
+        self.turn_encoder_sample = 0
+        self.sample_turn_encoder()  # so we have a value before the first periodic
         self.turning_PID_controller = PIDController(Kp=ModuleConstants.kTurningP, Ki=ModuleConstants.kTurningI, Kd=ModuleConstants.kTurningD)
         self.turning_PID_controller.enableContinuousInput(minimumInput=-math.pi, maximumInput=math.pi)
+        self.turning_setpoint = SetpointBuffer()  # only used when the turning PID runs on the fast loop
+        self.use_fast_loop = False
 
         # TODO: use the absolute encoder to set this - need to check the math carefully
         self.drivingEncoder.setPosition(0)
@@ -82,11 +96,78 @@ class SwerveModule:
         # self.chassisAngularOffset = chassisAngularOffset  # not yet
         self.desiredState.angle = Rotation2d(self.get_turn_encoder())
 
-    def get_turn_encoder(self):
+        # azimuth settling time - how long from a big angle step until we are back within tolerance
+        self.turning_target = self.get_turn_encoder()
+        self.settle_start_time = None  # FPGA time of the step we are currently timing, None if we are settled
+        self.settle_times = collections.deque(maxlen=50)
+
+    def read_turn_encoder(self) -> float:
+        """Fresh analog read - only the fast loop should need this, everyone else uses get_turn_encoder"""
         # how we invert the absolute encoder if necessary (which it probably isn't in the standard mk4i config)
         analog_reverse_multiplier = -1 if dc.k_reverse_analog_encoders else 1
         return analog_reverse_multiplier * self.absolute_encoder.get()
 
+    def sample_turn_encoder(self) -> float:
+        """Reads the absolute encoder once - Swerve.periodic calls this at the top of every loop
+        so odometry, optimize, the turning PID and telemetry all agree on one sample.
+        """
+        self.turn_encoder_sample = self.read_turn_encoder()
+        return self.turn_encoder_sample
+
+    def get_turn_encoder(self):
+        # this cycle's sample - no analog read here
+        return self.turn_encoder_sample
+
+    def attach_fast_loop(self, fast_loop) -> None:
+        """Move the rio turning PID onto the fast loop - setDesiredState then only posts the target angle"""
+        if self.turning_control_mode != 'rio':
+            return  # the spark is already closing the loop at 1 kHz
+        self.turning_PID_controller = PIDController(Kp=ModuleConstants.kTurningP, Ki=ModuleConstants.kTurningI,
+                                                    Kd=ModuleConstants.kTurningD, period=fast_loop.period)
+        self.turning_PID_controller.enableContinuousInput(minimumInput=-math.pi, maximumInput=math.pi)
+        self.turning_setpoint.set(self.turning_target)
+        self.use_fast_loop = True
+        fast_loop.register(f'turning_{self.label}', self.run_turning_loop)
+
+    def run_turning_loop(self) -> None:
+        """Fast loop callback - runs on the notifier thread, so it reads its own encoder value"""
+        target = self.turning_setpoint.get()
+        if target is None:
+            return
+        output = self.turning_PID_controller.calculate(self.read_turn_encoder(), target)
+        # clean up the turning Spark LEDs by cleaning out the noise - 20240226 CJH
+        output = 0 if math.fabs(output) < 0.01 else output
+        self.turningSparkFlex.set(output)
+        self.turning_output = output
+
+    def reseed_turning_encoder(self, force=False) -> bool:
+        """Copies the absolute angle into the turning spark's relative encoder if they have drifted apart.
+        Only done while the module is still, since the two sensors are not sampled at the same instant.
+        :returns: True if the encoder was re-seeded
+        """
+        absolute = self.get_turn_encoder()
+        error = math.remainder(self.turningEncoder.getPosition() - absolute, math.tau)
+        still = math.fabs(self.turningEncoder.getVelocity()) < ModuleConstants.k_turning_reseed_max_velocity
+        if force or (math.fabs(error) > ModuleConstants.k_turning_reseed_tolerance and still):
+            self.turningEncoder.setPosition(absolute)
+            return True
+        return False
+
+    def update_settle_time(self) -> None:
+        """Called once per loop - stops the clock on the current azimuth step once we are within tolerance"""
+        if self.settle_start_time is None:
+            return
+        error = math.remainder(self.get_turn_encoder() - self.turning_target, math.tau)
+        if math.fabs(error) < ModuleConstants.k_azimuth_settle_tolerance:
+            self.settle_times.append(wpilib.Timer.getFPGATimestamp() - self.settle_start_time)
+            self.settle_start_time = None
+
+    def get_settle_stats(self):
+        """(last, mean, max) azimuth settling time in seconds over the recent steps"""
+        if len(self.settle_times) == 0:
+            return 0, 0, 0
+        return self.settle_times[-1], sum(self.settle_times) / len(self.settle_times), max(self.settle_times)
+
     def getState(self) -> SwerveModuleState:
         """Returns the current state of the module.
         :returns: The current state of the module.
@@ -130,12 +211,24 @@ class SwerveModule:
         # Command driving and turning SPARKS MAX towards their respective setpoints.
         self.drivingClosedLoopController.setReference(correctedDesiredState.speed, dc.k_drive_controller_type.ControlType.kVelocity)
 
-        # calculate the PID value for the turning motor  - use the roborio instead of the sparkflex. todo: explain why
-        # self.turningPIDController.setReference(optimizedDesiredState.angle.radians(), CANSparkFlex.ControlType.kPosition)
-        self.turning_output = self.turning_PID_controller.calculate(self.get_turn_encoder(), correctedDesiredState.angle.radians())
-        # clean up the turning Spark LEDs by cleaning out the noise - 20240226 CJH
-        self.turning_output = 0 if math.fabs(self.turning_output) < 0.01 else self.turning_output
-        self.turningSparkFlex.set(self.turning_output)
+        # start timing if this is a real step in the azimuth target
+        target = correctedDesiredState.angle.radians()
+        if math.fabs(math.remainder(target - self.turning_target, math.tau)) > ModuleConstants.k_azimuth_settle_step:
+            self.settle_start_time = wpilib.Timer.getFPGATimestamp()
+        self.turning_target = target
+
+        if self.turning_control_mode == 'spark':
+            # the spark wraps at +/- pi itself (positionWrappingEnabled in k_turning_config), so just send the angle
+            self.turningClosedLoopController.setReference(target, SparkFlex.ControlType.kPosition)
+            self.turning_output = self.turningSparkFlex.getAppliedOutput()
+        elif self.use_fast_loop:
+            self.turning_setpoint.set(target)  # run_turning_loop picks it up within 5 ms
+        else:
+            # calculate the PID value for the turning motor  - use the roborio instead of the sparkflex. todo: explain why
+            self.turning_output = self.turning_PID_controller.calculate(self.get_turn_encoder(), target)
+            # clean up the turning Spark LEDs by cleaning out the noise - 20240226 CJH
+            self.turning_output = 0 if math.fabs(self.turning_output) < 0.01 else self.turning_output
+            self.turningSparkFlex.set(self.turning_output)
 
         if False: # wpilib.RobotBase.isSimulation():
             wpilib.SmartDashboard.putNumberArray(f'{self.label}_target_vel_angle',
@@ -5,6 +5,7 @@ import wpilib
 from rev import ClosedLoopSlot, SparkMax
 from constants import WristConstants
 import constants
+import safe_region
 from subsystems.elevator import Elevator
 from subsystems.pivot import Pivot
 
@@ -93,17 +94,17 @@ class Wrist(Subsystem):
         return self.encoder.getPosition()
         # return self.abs_encoder.getPosition()
 
+    def get_velocity(self) -> float:
+        return self.encoder.getVelocity()  # rad/s
+
     def get_at_setpoint(self) -> bool:
         return abs(self.encoder.getPosition() - self.setpoint) < WristConstants.k_tolerance
 
     def is_safe_to_move(self) -> bool:
-        pivot_in_safe_position = (self.pivot.get_angle() > WristConstants.k_max_arm_angle_where_spinning_dangerous or
-                                   self.pivot.get_angle() < WristConstants.k_min_arm_angle_where_spinning_dangerous)
-
-        elevator_in_safe_position = self.elevator.get_height() > WristConstants.k_max_elevator_height_where_spinning_dangerous
-
-        # return pivot_in_safe_position or elevator_in_safe_position
-        return True  # CJH 20250302  - always True now
+        if not WristConstants.k_enforce_safe_region:
+            return True  # CJH 20250302  - always True now
+        # same grid the trajectories are checked against
+        return safe_region.default_region().is_safe(self.elevator.get_height(), self.pivot.get_angle())
 
     def periodic(self) -> None:
 
@@ -0,0 +1,8 @@
+"""
+Offline tests - run from the robot directory:  python -m pytest tests
+They import the robot's modules directly, so the robot directory goes on the path first
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
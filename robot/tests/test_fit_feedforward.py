@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from tools import fit_feedforward
+
+k_gains = {'elevator': (0.12, 0.45, 3.1, 0.25), 'pivot': (0.2, 0.6, 1.8, 0.12)}  # kS, kG, kV, kA
+
+
+def simulate(mechanism, volts_at, duration, start=0.0):
+    """ the mechanism the fit assumes, integrated at 1 ms and logged at 20 ms in float32 like Characterize """
+    ks, kg, kv, ka = k_gains[mechanism]
+    position, velocity, rows = start, 0.0, []
+    for step in range(int(duration / 0.001)):
+        t = step * 0.001
+        volts = volts_at(t)
+        if step % 20 == 0:
+            rows.append((t, volts, position, velocity))
+        gravity = 1.0 if mechanism == 'elevator' else np.cos(position)
+        friction = ks * np.sign(velocity) if velocity != 0 else np.clip(volts - kg * gravity, -ks, ks)
+        acceleration = (volts - friction - kg * gravity - kv * velocity) / ka
+        velocity += acceleration * 0.001
+        position += velocity * 0.001
+    return np.array(rows, dtype=np.float32)
+
+
+@pytest.fixture
+def run_files(tmp_path):
+    filenames = []
+    for mechanism in k_gains:
+        runs = {'quasistatic_up': (lambda t: 0.9 + 0.5 * t, 3.0, 0.0), 'quasistatic_down': (lambda t: 0.3 - 0.5 * t, 3.0, 1.2),
+                'dynamic_up': (lambda t: 3.0, 0.8, 0.0), 'dynamic_down': (lambda t: -2.0, 0.8, 1.2)}
+        for test, (volts_at, duration, start) in runs.items():
+            filename = tmp_path / f'{mechanism}_{test}.npz'
+            np.savez(filename, data=simulate(mechanism, volts_at, duration, start), columns=['time', 'volts', 'position', 'velocity'],
+                     mechanism=mechanism, test=test.split('_')[0])
+            filenames.append(str(filename))
+    return filenames
+
+
+@pytest.mark.parametrize('mechanism', list(k_gains))
+def test_fit_recovers_the_gains(run_files, mechanism):
+    runs = fit_feedforward.load_runs(run_files)
+    assert {run['test'] for run in runs[mechanism]} == {'quasistatic', 'dynamic'}
+    gains, r_squared, rmse, per_run = fit_feedforward.fit(runs[mechanism], mechanism)
+    np.testing.assert_allclose(gains, k_gains[mechanism], rtol=0.1, atol=0.02)
+    assert r_squared > 0.99
+    assert len(per_run) == 4 and all(samples > 0 for _, samples, _ in per_run)
+
+
+def test_slow_and_early_samples_are_dropped():
+    time = np.arange(0, 1, 0.02)
+    velocity = np.where(time < 0.5, 0.01, 1.0)
+    run = {'time': time, 'velocity': velocity, 'position': np.zeros_like(time), 'volts': np.ones_like(time)}
+    regressors, volts = fit_feedforward.design_rows(run, 'pivot')
+    assert len(volts) == np.sum(time >= 0.5)
+    np.testing.assert_array_equal(regressors[:, 1], 1.0)  # cos(0)
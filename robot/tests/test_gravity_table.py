@@ -0,0 +1,52 @@
+import math
+
+import numpy as np
+import pytest
+
+from gravity_table import GravityTable, basis, fit_coefficients, model_coefficients
+
+k_coefficients = np.array([0.6, 0.05, 0.1, -0.2, 0.03, 0.08])
+k_pivot_range = (math.radians(-10), math.radians(190))
+k_wrist_range = (math.radians(-100), math.radians(100))
+
+
+def test_fit_recovers_the_coefficients():
+    rng = np.random.default_rng(46)
+    pivot = rng.uniform(*k_pivot_range, 400)
+    wrist = rng.uniform(*k_wrist_range, 400)
+    volts = basis(pivot, wrist) @ k_coefficients + rng.normal(0, 0.01, 400)
+    coefficients, rms = fit_coefficients(pivot, wrist, volts)
+    np.testing.assert_allclose(coefficients, k_coefficients, atol=0.005)
+    assert rms == pytest.approx(0.01, rel=0.2)
+
+
+def test_model_needs_kG_with_the_arm_level():
+    coefficients = model_coefficients(0.5, 0.6, 3.0, 1.5, 0.1)
+    assert basis(0.0, math.pi / 2) @ coefficients == pytest.approx(0.5)  # level, wrist offset pointing out of the way
+    assert basis(math.pi / 2, math.pi / 2) @ coefficients == pytest.approx(0.0, abs=1e-12)  # straight up
+    heavier = model_coefficients(0.5, 0.6, 3.0, 1.5, 0.1, piece_mass=0.5)
+    assert basis(0.0, 0.0) @ heavier > basis(0.0, 0.0) @ coefficients
+
+
+def test_lookup_interpolates_the_model():
+    table = GravityTable.from_coefficients({'empty': k_coefficients, 'coral': 1.2 * k_coefficients}, k_pivot_range, k_wrist_range)
+    rng = np.random.default_rng(47)
+    for pivot, wrist in zip(rng.uniform(*k_pivot_range, 200), rng.uniform(*k_wrist_range, 200)):
+        exact = float(basis(pivot, wrist) @ k_coefficients)
+        assert table.lookup(pivot, wrist) == pytest.approx(exact, abs=0.005)  # 5 degree cells
+        assert table.lookup(pivot, wrist, 'coral') == pytest.approx(1.2 * table.lookup(pivot, wrist))
+        assert table.lookup(pivot, wrist, 'unknown') == table.lookup(pivot, wrist)
+
+
+def test_lookup_hits_the_grid_and_clamps_outside_it():
+    table = GravityTable.from_coefficients({'empty': k_coefficients}, k_pivot_range, k_wrist_range)
+    i, j = 7, 11
+    assert table.lookup(table.pivot_angles[i], table.wrist_angles[j]) == pytest.approx(table.volts['empty'][i, j])
+    assert table.lookup(-5.0, -5.0) == pytest.approx(table.volts['empty'][0, 0])
+    assert table.lookup(10.0, 10.0) == pytest.approx(table.volts['empty'][-1, -1])
+    assert table.volts_for(0.3, 0.2, elevator_acceleration=9.81) == pytest.approx(2 * table.lookup(0.3, 0.2))
+
+
+def test_grid_shape_mismatch_raises():
+    with pytest.raises(ValueError):
+        GravityTable([0, 1], [0, 1, 2], {'empty': np.zeros((2, 2))})
@@ -0,0 +1,66 @@
+import math
+
+import numpy as np
+import pytest
+
+from motion_planner import plan_move, synchronized_velocity, trapezoid_samples, trapezoid_time
+from safe_region import SafeRegion
+
+k_velocity_limits = {'elevator': 1.5, 'pivot': 3.0, 'wrist': 7.0}
+k_acceleration_limits = {'elevator': 8.0, 'pivot': 20.0, 'wrist': 100.0}
+k_start = {'elevator': 0.2, 'pivot': math.radians(90), 'wrist': 0.0}
+k_target = {'elevator': 1.2, 'pivot': math.radians(50), 'wrist': math.radians(90)}
+
+
+@pytest.mark.parametrize('distance', [0.05, 1.0, -2.0])
+def test_trapezoid_covers_the_distance_in_its_time(distance):
+    max_velocity, max_acceleration = 1.5, 8.0
+    duration = trapezoid_time(distance, max_velocity, max_acceleration)
+    cruise = synchronized_velocity(distance, duration, max_acceleration)
+    assert cruise == pytest.approx(min(max_velocity, math.sqrt(abs(distance) * max_acceleration)))
+    times = np.linspace(0, duration, 2001)
+    position, velocity, acceleration = trapezoid_samples(distance, cruise, max_acceleration, times)
+    assert position[0] == 0 and position[-1] == pytest.approx(distance)
+    assert np.abs(velocity).max() <= max_velocity * (1 + 1e-9)
+    assert np.abs(acceleration).max() <= max_acceleration
+    np.testing.assert_allclose(np.gradient(position, times), velocity, atol=0.01 * max_velocity)
+
+
+def test_stretched_trapezoid_takes_exactly_the_duration():
+    cruise = synchronized_velocity(0.5, 2.0, 8.0)
+    times = np.linspace(0, 2.5, 251)
+    position, velocity, _ = trapezoid_samples(0.5, cruise, 8.0, times)
+    assert position[times >= 2.0] == pytest.approx(0.5)
+    assert velocity[times < 2.0 - 1e-9][-1] > 0 and np.all(velocity[times > 2.0 + 1e-9] == 0)
+
+
+def test_plan_without_a_region_finishes_together_at_the_target():
+    trajectory, report = plan_move(k_start, k_target, k_velocity_limits, k_acceleration_limits)
+    assert report['duration'] == pytest.approx(max(report['min_times'].values()))
+    end = trajectory.get_value(trajectory.duration)
+    assert end['elevator'] == pytest.approx(k_target['elevator'])
+    assert end['pivot'] == pytest.approx(math.degrees(k_target['pivot']))
+    assert end['wrist'] == pytest.approx(math.degrees(k_target['wrist']))
+    for key, scale in [('elevator', 1), ('pivot', 180 / math.pi), ('wrist', 180 / math.pi)]:
+        col = trajectory.columns[key]
+        assert np.abs(trajectory.velocity[:, col]).max() <= scale * k_velocity_limits[key] * (1 + 1e-9)
+        assert np.abs(trajectory.acceleration[:, col]).max() <= scale * k_acceleration_limits[key] * (1 + 1e-9)
+        assert np.abs(trajectory.velocity[-2, col]) > 0  # nobody is done early - they all arrive on the last sample
+
+
+def test_wrist_only_moves_where_the_region_is_safe():
+    region = SafeRegion.from_limits(math.radians(45), math.radians(100), 0.8)
+    trajectory, report = plan_move(k_start, k_target, k_velocity_limits, k_acceleration_limits, region=region)
+    assert report['wrist_safe']
+    assert report['wrist_start'] > 0  # it has to wait for the arm to get out of the way
+    unsafe = ~region.is_safe(trajectory.trajectory['elevator'], np.radians(trajectory.trajectory['pivot']))
+    assert unsafe.any()
+    assert np.all(trajectory.velocity[unsafe, trajectory.columns['wrist']] == 0)
+    assert trajectory.get_value(trajectory.duration)['wrist'] == pytest.approx(math.degrees(k_target['wrist']))
+
+
+def test_wrist_stays_put_when_nowhere_is_safe():
+    region = SafeRegion.from_limits(-math.pi, 2 * math.pi, 2.0)
+    trajectory, report = plan_move(k_start, k_target, k_velocity_limits, k_acceleration_limits, region=region)
+    assert not report['wrist_safe']
+    assert np.all(trajectory.trajectory['wrist'] == math.degrees(k_start['wrist']))
@@ -0,0 +1,79 @@
+import pytest
+import rev
+
+from subsystems.power_arbiter import PowerArbiter
+
+
+class FakePower:
+    subsystem_channels = {}
+
+
+@pytest.fixture(scope='module')
+def sparks():
+    """ one set for the whole module - CAN ids only go up to 62 """
+    return {'drive': [rev.SparkFlex(can_id, rev.SparkFlex.MotorType.kBrushless) for can_id in range(40, 44)],
+            'elevator': [rev.SparkMax(can_id, rev.SparkMax.MotorType.kBrushless) for can_id in range(44, 46)]}
+
+
+def configure(sparks, stall_limit):
+    for spark in sparks:
+        config = rev.SparkFlexConfig() if isinstance(spark, rev.SparkFlex) else rev.SparkMaxConfig()
+        config.smartCurrentLimit(stall_limit)
+        spark.configure(config, rev.SparkBase.ResetMode.kResetSafeParameters, rev.SparkBase.PersistMode.kNoPersistParameters)
+    return sparks
+
+
+@pytest.fixture
+def arbiter(sparks):
+    arbiter = PowerArbiter(FakePower())
+    arbiter.register('drive', configure(sparks['drive'], 0), min_limit=30, max_limit=60, priority=3)
+    arbiter.register('elevator', configure(sparks['elevator'], 40), min_limit=20, max_limit=40, priority=1)
+    return arbiter
+
+
+def flush(arbiter):
+    while arbiter.pending:
+        arbiter._send_pending()
+
+
+def test_allocation_keeps_minimums_when_short(arbiter):
+    limits = arbiter.allocate(0)
+    assert limits == pytest.approx({'drive': 30, 'elevator': 20})
+
+
+def test_allocation_splits_by_priority(arbiter):
+    # 160 A of minimums, 60 A left over split 3:1 - 45 A over four drive motors and 15 A over two elevator motors
+    limits = arbiter.allocate(220)
+    assert limits == pytest.approx({'drive': 30 + 45 / 4, 'elevator': 20 + 15 / 2})
+
+
+def test_allocation_refills_what_a_capped_group_can_not_use(arbiter):
+    # elevator first this time: 75 of the 100 A left over would take it past 40 A a motor, the 35 A it can't use goes to the drive
+    arbiter.groups['elevator']['priority'] = 3
+    arbiter.groups['drive']['priority'] = 1
+    limits = arbiter.allocate(260)
+    assert limits == pytest.approx({'drive': 30 + 60 / 4, 'elevator': 40})
+    assert arbiter.allocate(10000) == pytest.approx({'drive': 60, 'elevator': 40})
+
+
+def test_register_reads_the_configured_limits(arbiter):
+    assert arbiter.groups['drive']['static_limits'][0][0] == 0
+    assert arbiter.groups['elevator']['limit'] == 40
+
+
+def test_disabling_restores_the_configured_limits(arbiter):
+    for name in arbiter.groups:
+        arbiter._request_limit(name, 35, force=True)
+    flush(arbiter)
+    sparks = [spark for group in arbiter.groups.values() for spark in group['sparks']]
+    assert [spark.configAccessor.getSmartCurrentLimit() for spark in sparks] == [35] * 6
+
+    arbiter.set_enabled(False)
+    flush(arbiter)
+    assert [spark.configAccessor.getSmartCurrentLimit() for spark in sparks] == [0] * 4 + [40] * 2
+
+
+def test_newest_request_replaces_a_queued_one(arbiter):
+    arbiter._request_limit('elevator', 25, force=True)
+    arbiter._request_limit('elevator', 33, force=True)
+    assert [limits for spark, limits in arbiter.pending] == [(33,), (33,)]
@@ -0,0 +1,42 @@
+import math
+
+import numpy as np
+import pytest
+
+from safe_region import SafeRegion
+
+k_min_angle, k_max_angle, k_max_height = math.radians(45), math.radians(80), 0.8
+
+
+@pytest.fixture
+def region():
+    return SafeRegion.from_limits(k_min_angle, k_max_angle, k_max_height)
+
+
+def rule(heights, angles):
+    """ the scalar check Wrist.is_safe_to_move used before the grid """
+    return not (heights < k_max_height and k_min_angle < angles < k_max_angle)
+
+
+def test_grid_matches_the_rule_away_from_the_edges(region):
+    rng = np.random.default_rng(36)
+    heights = rng.uniform(0, 1.8, 2000)
+    angles = rng.uniform(-math.pi, 2 * math.pi, 2000)
+    # the grid snaps to the nearest cell, so leave out points within a cell of an edge
+    clear = ((np.abs(heights - k_max_height) > region.height_step) & (np.abs(angles - k_min_angle) > region.angle_step) &
+             (np.abs(angles - k_max_angle) > region.angle_step))
+    expected = np.array([rule(h, a) for h, a in zip(heights, angles)])
+    np.testing.assert_array_equal(region.is_safe(heights, angles)[clear], expected[clear])
+    assert (~expected[clear]).sum() > 20  # plenty of unsafe points got checked
+
+
+def test_scalars_give_bools_and_outside_clamps(region):
+    assert region.is_safe(0.2, math.radians(60)) is False
+    assert region.is_safe(1.2, math.radians(60)) is True
+    assert region.is_safe(-5.0, math.radians(60)) is False  # below the grid reads the bottom row
+    assert region.is_safe(0.2, 100.0) is True
+
+
+def test_shape_mismatch_raises():
+    with pytest.raises(ValueError):
+        SafeRegion([0, 1], [0, 1, 2], np.ones((2, 2)))
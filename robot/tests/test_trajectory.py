@@ -0,0 +1,313 @@
+import math
+
+import numpy as np
+import pytest
+
+from safe_region import SafeRegion
+import trajectory as trajectory_module
+from trajectory import CustomTrajectory, TrajectoryCache
+
+k_waypoints = {
+    0: {'elevator': 0.21, 'pivot': 90, 'wrist': 0, 'intake': 2},
+    0.25: {'elevator': 0.3, 'pivot': 90, 'wrist': 0, 'intake': 2},
+    0.5: {'elevator': 0.5, 'pivot': 70, 'wrist': 0, 'intake': 2},
+    1: {'elevator': 1.2, 'pivot': 50, 'wrist': 90, 'intake': 2},
+    1.5: {'elevator': 1.17, 'pivot': 40, 'wrist': 90, 'intake': -3},
+    2.5: {'elevator': 0.2, 'pivot': 70, 'wrist': 0, 'intake': 0},
+    3.0: {'elevator': 0.2, 'pivot': 90, 'wrist': 0, 'intake': 0},
+}
+
+
+def make_trajectory(interpolation_type='linear', **kwargs):
+    return CustomTrajectory(k_waypoints, 3, interpolation_type=interpolation_type, name='test', **kwargs)
+
+
+def masked_cubic_hermite(x, y, x_new):
+    """ the original segment-by-segment interpolation, central difference slopes """
+    dydx = np.zeros_like(y)
+    dydx[1:-1] = (y[2:] - y[:-2]) / (x[2:] - x[:-2])
+    dydx[0] = (y[1] - y[0]) / (x[1] - x[0])
+    dydx[-1] = (y[-1] - y[-2]) / (x[-1] - x[-2])
+    y_new = np.zeros_like(x_new)
+    for i in range(len(x) - 1):
+        mask = (x_new >= x[i]) & (x_new < x[i + 1])
+        h = x[i + 1] - x[i]
+        t = (x_new[mask] - x[i]) / h
+        y_new[mask] = ((1 + 2 * t) * (1 - t) ** 2 * y[i] + t * (1 - t) ** 2 * h * dydx[i] +
+                       t ** 2 * (3 - 2 * t) * y[i + 1] + t ** 2 * (t - 1) * h * dydx[i + 1])
+    return y_new
+
+
+@pytest.fixture
+def random_path():
+    rng = np.random.default_rng(2429)
+    x = np.cumsum(rng.uniform(0.1, 0.5, 12))
+    y = rng.uniform(0, 1.5, 12)
+    return x, y, np.linspace(x[0], x[-1], 1001)
+
+
+def test_cubic_matches_the_segment_loop(random_path):
+    x, y, x_new = random_path
+    values = make_trajectory()._cubic_hermite_interp(x, y, x_new)
+    # the loop never filled the last sample
+    np.testing.assert_allclose(values[:-1], masked_cubic_hermite(x, y, x_new)[:-1], atol=1e-12)
+    assert values[-1] == pytest.approx(y[-1])
+
+
+@pytest.mark.parametrize('monotone', [False, True])
+def test_derivative_orders_match_the_curve(random_path, monotone):
+    x, y, x_new = random_path
+    trajectory = make_trajectory()
+    values, d1, d2 = [trajectory._cubic_hermite_interp(x, y, x_new, monotone=monotone, order=order) for order in [0, 1, 2]]
+    np.testing.assert_allclose(np.gradient(values, x_new)[1:-1], d1[1:-1], atol=0.05 * np.abs(d1).max())
+    inside = np.ones_like(x_new, dtype=bool)  # second differences straddling a knot see the jump in d2
+    inside[np.clip(np.searchsorted(x_new, x), 0, len(x_new) - 1)] = False
+    inside = inside & np.roll(inside, 1) & np.roll(inside, -1)
+    np.testing.assert_allclose(np.gradient(d1, x_new)[inside][1:-1], d2[inside][1:-1], atol=0.05 * np.abs(d2).max())
+
+
+def test_pchip_stays_between_its_waypoints(random_path):
+    x, y, x_new = random_path
+    values = make_trajectory()._cubic_hermite_interp(x, y, x_new, monotone=True)
+    segment = np.clip(np.searchsorted(x, x_new, side='right') - 1, 0, len(x) - 2)
+    low, high = np.minimum(y[segment], y[segment + 1]), np.maximum(y[segment], y[segment + 1])
+    assert np.all(values >= low - 1e-12) and np.all(values <= high + 1e-12)
+    assert np.abs(make_trajectory()._cubic_hermite_interp(x, y, x_new) - values).max() > 0  # plain cubic does overshoot here
+
+
+@pytest.mark.parametrize('interpolation_type', ['linear', 'cubic', 'pchip'])
+def test_generated_trajectory_hits_the_waypoints(interpolation_type):
+    trajectory = make_trajectory(interpolation_type)
+    for t, pose in k_waypoints.items():
+        row = int(round(t / trajectory.dt))
+        for key in ['elevator', 'pivot', 'wrist']:
+            assert trajectory.data[row, trajectory.columns[key]] == pytest.approx(pose[key], abs=1e-9)
+
+
+k_retime_velocity = {'elevator': 1.5, 'pivot': 200, 'wrist': 300}
+k_retime_acceleration = {'elevator': 8, 'pivot': 1000, 'wrist': 1500}
+
+
+def sequential_passes(cap, ds, dq, ddq, a_max):
+    """ the original retime loop - one sample at a time, each step checked again at its far end """
+    def s_ddot_max(i, u):
+        return np.min(np.maximum(a_max - ddq[i] * u, 0) / dq[i])
+
+    u = cap.copy()
+    for i in range(len(ds)):
+        grow = s_ddot_max(i, u[i])
+        grow = min(grow, s_ddot_max(i + 1, min(cap[i + 1], u[i] + 2 * grow * ds[i])))
+        u[i + 1] = min(u[i + 1], u[i] + 2 * grow * ds[i])
+    for i in range(len(ds) - 1, -1, -1):
+        shrink = s_ddot_max(i + 1, u[i + 1])
+        shrink = min(shrink, s_ddot_max(i, min(u[i], u[i + 1] + 2 * shrink * ds[i])))
+        u[i] = min(u[i], u[i + 1] + 2 * shrink * ds[i])
+    return u
+
+
+def test_limited_passes_match_the_sequential_loop():
+    rng = np.random.default_rng(7)
+    s = np.linspace(0, 4, 401)
+    ds = np.diff(s)
+    dq = np.abs(rng.normal(1, 0.3, (len(s), 2))) + 0.1
+    ddq = np.abs(rng.normal(0, 2, (len(s), 2)))
+    a_max = np.array([3.0, 5.0])
+    cap = np.minimum(np.min(a_max / np.maximum(ddq, 1e-9), axis=1), 1e9)
+    cap[[0, -1]] = 0
+
+    def s_ddot_max(u):
+        return np.min(np.maximum(a_max - ddq * u[:, None], 0) / dq, axis=1)
+
+    trajectory = make_trajectory()
+    u = trajectory._limited_pass(cap, ds, s_ddot_max, forward=True)
+    u = trajectory._limited_pass(u, ds, s_ddot_max, forward=False)
+    reference = sequential_passes(cap, ds, dq, ddq, a_max)
+    np.testing.assert_allclose(np.sqrt(u), np.sqrt(reference), atol=0.01 * np.sqrt(reference).max())
+
+    def duration(u):
+        return np.sum(2 * ds / np.maximum(np.sqrt(u[:-1]) + np.sqrt(u[1:]), 1e-12))
+    assert duration(u) == pytest.approx(duration(reference), rel=0.01)
+
+
+@pytest.mark.parametrize('interpolation_type', ['linear', 'smoothed', 'cubic', 'pchip'])
+def test_retime_stays_inside_the_limits(interpolation_type):
+    trajectory = make_trajectory(interpolation_type)
+    report = trajectory.retime(k_retime_velocity, k_retime_acceleration, verbose=False)
+    assert report['duration'] == pytest.approx(trajectory.duration)
+    assert report['waypoint_times'][0] == 0 and report['waypoint_times'][-1] == pytest.approx(trajectory.duration)
+    for key in k_retime_velocity:
+        col = trajectory.columns[key]
+        assert np.abs(trajectory.velocity[:, col]).max() <= 1.01 * k_retime_velocity[key]
+        assert np.abs(trajectory.acceleration[:, col]).max() <= 1.01 * k_retime_acceleration[key]
+    if interpolation_type != 'smoothed':  # the smoothing window reaches past the ends
+        assert trajectory.velocity[0, :3] == pytest.approx(0, abs=1e-9)
+        assert trajectory.velocity[-1, :3] == pytest.approx(0, abs=1e-9)
+
+
+@pytest.mark.parametrize('interpolation_type', ['linear', 'cubic', 'pchip'])
+def test_retime_still_hits_the_waypoints(interpolation_type):
+    trajectory = make_trajectory(interpolation_type)
+    report = trajectory.retime(k_retime_velocity, k_retime_acceleration, verbose=False)
+    for t, pose in zip(report['waypoint_times'], k_waypoints.values()):
+        for key in k_retime_velocity:
+            value = np.interp(t, trajectory.time_steps, trajectory.data[:, trajectory.columns[key]])
+            assert value == pytest.approx(pose[key], abs=0.01 * k_retime_velocity[key])
+
+
+def test_retime_is_no_faster_with_tighter_limits():
+    loose = make_trajectory('cubic').retime(k_retime_velocity, k_retime_acceleration, verbose=False)['duration']
+    tight = make_trajectory('cubic').retime({key: limit / 2 for key, limit in k_retime_velocity.items()},
+                                            k_retime_acceleration, verbose=False)['duration']
+    assert tight > loose
+
+
+def test_check_constraints_matches_a_segment_loop():
+    trajectory = make_trajectory('cubic', velocity_constraints={'elevator': 1.5, 'pivot': 80, 'wrist': 0, 'intake': 0},
+                                 acceleration_constraints={'elevator': 5, 'pivot': 300, 'wrist': 0, 'intake': 0})
+    report = trajectory.check_constraints()
+    times = np.array(list(k_waypoints), dtype=float)
+    for col, key in enumerate(trajectory.keys):
+        velocity = trajectory.speeds[key]['velocity']
+        acceleration = trajectory.speeds[key]['acceleration']
+        for row, (start, end) in enumerate(zip(times, list(times[1:]) + [np.inf])):
+            steps = (trajectory.time_steps >= start) & (trajectory.time_steps < end)
+            steps[0] = False  # the first sample is pinned to rest
+            peak_velocity = np.abs(velocity[steps]).max(initial=0)
+            peak_acceleration = np.abs(acceleration[steps]).max(initial=0)
+            assert report['peak_velocity'][row, col] == pytest.approx(peak_velocity)
+            assert report['peak_acceleration'][row, col] == pytest.approx(peak_acceleration)
+            velocity_limit = trajectory.velocity_constraints[key] or np.inf
+            acceleration_limit = trajectory.acceleration_constraints[key] or np.inf
+            assert report['velocity_violation'][row, col] == (peak_velocity > velocity_limit)
+            assert report['acceleration_violation'][row, col] == (peak_acceleration > acceleration_limit)
+    assert trajectory.has_violations()
+    assert report['velocity_violation'][:, trajectory.columns['elevator']].any()
+    assert not report['velocity_violation'][:, trajectory.columns['wrist']].any()  # 0 is unconstrained
+
+
+def test_no_violations_with_loose_limits():
+    trajectory = make_trajectory(velocity_constraints={key: 1e6 for key in ['elevator', 'pivot', 'wrist', 'intake']},
+                                 acceleration_constraints={key: 1e9 for key in ['elevator', 'pivot', 'wrist', 'intake']})
+    trajectory.check_constraints()
+    assert not trajectory.has_violations()
+
+
+def test_sample_into_matches_np_interp():
+    trajectory = make_trajectory('cubic')
+    out = np.zeros(len(trajectory.keys))
+    for t in np.linspace(-0.1, trajectory.duration + 0.1, 157):
+        values = trajectory.sample_into(t, out)
+        assert values is out
+        for col, key in enumerate(trajectory.keys):
+            if key in trajectory.servo_columns:
+                continue
+            assert values[col] == pytest.approx(np.interp(t, trajectory.time_steps, trajectory.data[:, col]), abs=1e-12)
+
+
+def test_servos_step_instead_of_blending():
+    trajectory = make_trajectory()
+    col = trajectory.columns['intake']
+    step = int(np.argmax(trajectory.data[:, col] != trajectory.data[0, col]))  # first sample after the intake changes
+    between = trajectory.time_steps[step - 1] + 0.5 * trajectory.dt
+    assert trajectory.sample(between)[col] == trajectory.data[step, col]
+
+
+def test_get_value_is_keyed_like_the_waypoints():
+    trajectory = make_trajectory()
+    assert trajectory.get_value(0) == pytest.approx(k_waypoints[0])
+    assert trajectory.get_value(10) == pytest.approx(k_waypoints[3.0])
+
+
+def test_fix_trajectory_keeps_the_wrist_still_in_the_unsafe_region():
+    region = SafeRegion.from_limits(math.radians(45), math.radians(80), 0.8)
+    trajectory = make_trajectory()
+    assert len(trajectory.check_trajectory(region)) > 0
+    duration = trajectory.duration
+    assert len(trajectory.fix_trajectory(region)) == 0
+    assert trajectory.duration > duration
+    wrist = trajectory.trajectory['wrist']
+    assert wrist[0] == k_waypoints[0]['wrist'] and wrist[-1] == pytest.approx(k_waypoints[3.0]['wrist'])
+    unsafe = ~region.is_safe(trajectory.trajectory['elevator'], np.radians(trajectory.trajectory['pivot']))
+    held = unsafe[:-1] & unsafe[1:]  # the last unsafe sample may already be heading out
+    assert np.all(np.diff(wrist)[held] == 0)
+    assert np.all(trajectory.velocity[:-1][held, trajectory.columns['wrist']] == 0)
+
+
+@pytest.mark.parametrize('interpolation_type', ['cubic', 'pchip'])
+def test_analytic_derivatives_match_differencing(interpolation_type):
+    trajectory = make_trajectory(interpolation_type)
+    for key in ['elevator', 'pivot', 'wrist']:
+        col = trajectory.columns[key]
+        velocity, acceleration = trajectory.velocity[:, col], trajectory.acceleration[:, col]
+        # the second derivative jumps at the waypoints, which throws the differences off there - compare away from them
+        away = np.abs(trajectory.time_steps[:, None] - np.array(list(k_waypoints))[None, :]).min(axis=1) > 2.5 * trajectory.dt
+        differenced = np.gradient(trajectory.data[:, col], trajectory.time_steps)
+        np.testing.assert_allclose(differenced[away], velocity[away], atol=0.02 * np.abs(velocity).max())
+        np.testing.assert_allclose(np.gradient(velocity, trajectory.time_steps)[away], acceleration[away],
+                                   atol=0.02 * np.abs(acceleration).max())
+    assert np.all(trajectory.velocity[:, trajectory.columns['intake']] == 0)  # servos have no velocity
+
+
+def test_cache_hands_back_the_same_frozen_trajectory():
+    cache = TrajectoryCache(max_size=2)
+    first = cache.get(k_waypoints, 3, 'cubic', name='one')
+    same = cache.get({float(t): dict(pose) for t, pose in k_waypoints.items()}, 3.0, 'cubic', name='one')
+    assert same is first
+    assert cache.get_stats() == {'hits': 1, 'misses': 1, 'size': 1, 'max_size': 2}
+    assert cache.get(k_waypoints, 3, 'cubic', name='two') is not first  # the name is part of the key
+    assert cache.get(k_waypoints, 3, 'pchip', name='one') is not first
+    assert cache.get(k_waypoints, 3, 'cubic', name='one') is not first  # evicted as least recently used
+    assert cache.get_stats()['size'] == 2
+
+
+def test_frozen_trajectories_refuse_changes():
+    trajectory = TrajectoryCache().get(k_waypoints, 3, 'cubic')
+    for array in [trajectory.data, trajectory.velocity, trajectory.acceleration, trajectory.trajectory['elevator']]:
+        with pytest.raises(ValueError):
+            array[0] = 1
+    with pytest.raises(RuntimeError):
+        trajectory.rescale_trajectory(4)
+    with pytest.raises(RuntimeError):
+        trajectory.retime(k_retime_velocity, k_retime_acceleration, verbose=False)
+
+    copy = trajectory.copy()
+    copy.rescale_trajectory(4)
+    assert copy.duration == 4 and trajectory.duration == 3
+
+
+def test_state_buffers_are_independent():
+    trajectory = TrajectoryCache().get(k_waypoints, 3, 'cubic')
+    early, late = trajectory.make_state_buffer(), trajectory.make_state_buffer()
+    position, velocity, acceleration = trajectory.sample_state(0.5, early)
+    trajectory.sample_state(2.0, late)
+    assert all(np.shares_memory(row, early[i]) for i, row in enumerate([position, velocity, acceleration]))
+    np.testing.assert_array_equal(early[0], trajectory.sample(0.5))
+    np.testing.assert_array_equal(late[0], trajectory.sample(2.0))
+    assert not np.shares_memory(trajectory.sample_state(0.5)[0], trajectory.sample_state(0.5)[0])
+
+
+def test_blend_from_state_starts_at_the_state_and_joins_the_trajectory():
+    trajectory = make_trajectory('cubic')
+    state = {'elevator': (0.4, 0.5), 'pivot': (80.0, -20.0)}
+    velocity_limits, acceleration_limits = {'elevator': 2.0, 'pivot': 150}, {'elevator': 10.0, 'pivot': 800}
+    blended = trajectory.blend_from_state(state, velocity_limits, acceleration_limits)
+    assert blended.name == 'test_from_state' and blended.duration == trajectory.duration
+    assert blended.get_value(0)['wrist'] == k_waypoints[0]['wrist']  # keys left out of the state follow the original
+    # the first time we are back on the original, and it is the original from then on
+    join = int(np.argmax(np.all(blended.data[:, :2] == trajectory.data[:, :2], axis=1) &
+                         np.all(blended.velocity[:, :2] == trajectory.velocity[:, :2], axis=1)))
+    assert 0 < join < len(trajectory.time_steps) - 1
+    np.testing.assert_array_equal(blended.data[join:], trajectory.data[join:])
+    head = slice(0, join + 1)
+    for key, (position, velocity) in state.items():
+        col = trajectory.columns[key]
+        assert blended.data[0, col] == pytest.approx(position)
+        assert blended.velocity[0, col] == pytest.approx(velocity)
+        assert np.abs(blended.acceleration[head, col]).max() <= acceleration_limits[key] * (1 + 1e-9)
+        assert np.abs(blended.velocity[head, col]).max() <= max(velocity_limits[key], abs(velocity)) * (1 + 1e-9)
+
+
+def test_blend_from_state_needs_an_acceleration_limit(monkeypatch):
+    monkeypatch.setattr(trajectory_module, '_mechanism_limits', ({}, {}))
+    with pytest.raises(ValueError):
+        make_trajectory().blend_from_state({'elevator': (0.4, 0.0)})
@@ -0,0 +1,69 @@
+import struct
+
+import numpy as np
+import pytest
+
+import trajectory_library
+from trajectory_library import TrajectoryLibrary, generate_trajectory, write_library
+
+k_specs = {name: trajectory_library.trajectory_specs[name] for name in ['l3', 'l3_test']}
+
+
+@pytest.fixture
+def library_path(tmp_path):
+    path = tmp_path / 'trajectories.bin'
+    write_library(path, k_specs)
+    return path
+
+
+def test_round_trip_matches_generation(library_path):
+    library = TrajectoryLibrary(library_path, k_specs)
+    for name in k_specs:
+        loaded = library.get(name)
+        generated = generate_trajectory(name, k_specs)
+        for attribute in ['data', 'velocity', 'acceleration', 'time_steps']:
+            np.testing.assert_array_equal(getattr(loaded, attribute), getattr(generated, attribute))
+        assert loaded.frozen and not loaded.data.flags.writeable
+        assert loaded is library.get(name)
+    assert library.fallbacks == 0
+
+
+def test_samples_are_views_into_the_file(library_path):
+    library = TrajectoryLibrary(library_path, k_specs)
+    assert not library.get('l3').data.flags.owndata
+
+
+def test_missing_file_generates(tmp_path):
+    library = TrajectoryLibrary(tmp_path / 'nothing.bin', k_specs)
+    np.testing.assert_array_equal(library.get('l3').data, generate_trajectory('l3', k_specs).data)
+    assert library.fallbacks == 1
+
+
+def test_stale_specs_generate(library_path):
+    specs = dict(k_specs, l3=dict(k_specs['l3'], duration=2.5))
+    library = TrajectoryLibrary(library_path, specs)
+    assert library.entries == {}
+    assert library.get('l3').duration == 2.5
+    assert library.fallbacks == 1
+
+
+def test_truncated_file_generates(library_path):
+    contents = library_path.read_bytes()
+    library_path.write_bytes(contents[:-8])
+    library = TrajectoryLibrary(library_path, k_specs)
+    assert library.entries == {}
+    library.get('l3_test')
+    assert library.fallbacks == 1
+
+
+@pytest.mark.parametrize('corrupt', [
+    lambda contents: b'JUNK' + contents[4:],  # magic
+    lambda contents: contents[:4] + struct.pack('<I', 1) + contents[8:],  # format version
+    lambda contents: contents[:struct.calcsize(trajectory_library.k_header_format)] + b'[' + contents[13:],  # index
+    lambda contents: contents[:6],  # header
+])
+def test_corrupt_file_generates(library_path, corrupt):
+    library_path.write_bytes(corrupt(library_path.read_bytes()))
+    library = TrajectoryLibrary(library_path, k_specs)
+    assert library.entries == {}
+    np.testing.assert_array_equal(library.get('l3').data, generate_trajectory('l3', k_specs).data)
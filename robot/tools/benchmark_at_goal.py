@@ -0,0 +1,82 @@
+"""
+How much the at-goal check costs a scoring cycle - GoToReefPosition(4) then Score (which ends in GoToStow) - run from the robot directory:
+    python tools/benchmark_at_goal.py
+A simplified sim: each mechanism follows its trapezoid with a first order lag, sampled every 20 ms loop
+  old - Elevator.at_goal only refreshed when counter % 10 == 0 (MovePivot already compared the encoder itself every loop)
+  new - both settle every loop on tolerance and velocity, debounced by k_settle_debounce_time
+The counter phase is random on the robot, so the old numbers are averaged over all ten phases
+"""
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import constants  # noqa: E402
+from constants import ElevatorConstants, ShoulderConstants, IntakeConstants  # noqa: E402
+import motion_planner  # noqa: E402
+
+k_period = 0.02
+k_lag = {'elevator': 0.06, 'pivot': 0.08}  # s - guesses for how far the mechanism trails its profile, not measured
+
+
+def simulate(axis, start, target, max_velocity, max_acceleration, duration=3.0):
+    """ (times, position, velocity) of the mechanism following its profile through a first order lag """
+    times = np.arange(0, duration, k_period)
+    distance = target - start
+    cruise = motion_planner.synchronized_velocity(distance, motion_planner.trapezoid_time(distance, max_velocity, max_acceleration), max_acceleration)
+    profile = start + motion_planner.trapezoid_samples(distance, cruise, max_acceleration, times)[0]
+    position = np.empty_like(profile)
+    position[0] = start
+    alpha = k_period / (k_lag[axis] + k_period)
+    for idx in range(1, len(times)):
+        position[idx] = position[idx - 1] + alpha * (profile[idx] - position[idx - 1])
+    velocity = np.gradient(position, k_period)
+    return times, position, velocity
+
+
+def first_true(mask):
+    return int(np.argmax(mask)) if mask.any() else len(mask) - 1
+
+
+def finish_loops(position, velocity, target, tolerance, settle_velocity, debounce_time, every_ten=False, phase=0):
+    """ loops until the command waiting on this mechanism ends """
+    inside = np.abs(position - target) < tolerance
+    if every_ten:  # the old cached at_goal - only looked at when the counter comes round
+        checked = (np.arange(len(inside)) + phase) % 10 == 0
+        return first_true(inside & checked)
+    settled = inside & (np.abs(velocity) < settle_velocity)
+    loops = int(round(debounce_time / k_period))
+    run = np.convolve(settled.astype(int), np.ones(loops + 1, dtype=int))[:len(settled)]  # settled for this loop and the last `loops`
+    return first_true(run == loops + 1)
+
+
+def move_time(start, target, old, phase):
+    """ parallel elevator and pivot move (GoToReefPosition / GoToStow) - done when both commands are done """
+    loops = []
+    for axis, limits in [('elevator', ElevatorConstants), ('pivot', ShoulderConstants)]:
+        if axis == 'elevator':
+            max_velocity, max_acceleration = limits.k_max_velocity_meter_per_second, limits.k_max_acceleration_meter_per_sec_squared
+            tolerance = 0.03  # Elevator.tolerance
+        else:
+            max_velocity, max_acceleration = limits.k_max_velocity_rad_per_second, limits.k_max_acceleration_rad_per_sec_squared
+            tolerance = limits.k_tolerance
+        _, position, velocity = simulate(axis, start[axis], target[axis], max_velocity, max_acceleration)
+        every_ten = old and axis == 'elevator'
+        loops.append(finish_loops(position, velocity, target[axis], tolerance, limits.k_settle_velocity,
+                                  limits.k_settle_debounce_time, every_ten=every_ten, phase=phase))
+    return max(loops) * k_period
+
+
+def main():
+    stow = {'elevator': constants.k_positions['stow']['elevator'], 'pivot': constants.k_positions['stow']['shoulder_pivot']}
+    l4 = {'elevator': constants.k_positions['l4']['elevator'], 'pivot': constants.k_positions['l4']['shoulder_pivot']}
+    scoring_wait = 2 * IntakeConstants.k_seconds_to_stay_on_while_scoring  # the fixed waits in Score are the same either way
+
+    old = np.array([move_time(stow, l4, True, phase) + move_time(l4, stow, True, phase) for phase in range(10)]) + scoring_wait
+    new = move_time(stow, l4, False, 0) + move_time(l4, stow, False, 0) + scoring_wait
+    print(f'GoToReefPosition(4) + Score:  old {old.mean():.3f} s (best {old.min():.3f}, worst {old.max():.3f})   '
+          f'new {new:.3f} s   saved {old.mean() - new:.3f} s on average per cycle')
+
+
+if __name__ == '__main__':
+    main()
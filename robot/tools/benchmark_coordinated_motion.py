@@ -0,0 +1,74 @@
+"""
+Compare move times between the current command groups and one coordinated plan (motion_planner) - run from the robot directory:
+    python tools/benchmark_coordinated_motion.py
+Both sides use the same trapezoid limits from constants and the same wrist safe region, so only the scheduling differs:
+  parallel  - GoToPosition / GoToReefPosition: elevator and pivot start together, MoveWrist waits until it is safe to spin
+  wrist first - GoToStow: MoveWrist has to finish before the elevator and pivot start
+These are profile times only - settling and the at-goal tolerances come on top for both
+"""
+import math
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import constants  # noqa: E402
+from constants import ElevatorConstants, ShoulderConstants, WristConstants  # noqa: E402
+import motion_planner  # noqa: E402
+import safe_region  # noqa: E402
+
+velocity_limits = {'elevator': ElevatorConstants.k_max_velocity_meter_per_second,
+                   'pivot': ShoulderConstants.k_max_velocity_rad_per_second,
+                   'wrist': WristConstants.k_max_velocity_rad_per_second}
+acceleration_limits = {'elevator': ElevatorConstants.k_max_acceleration_meter_per_sec_squared,
+                       'pivot': ShoulderConstants.k_max_acceleration_rad_per_sec_squared,
+                       'wrist': WristConstants.k_max_acceleration_rad_per_sec_squared}
+
+
+def pose(name, wrist=None):
+    position = constants.k_positions[name]
+    return {'elevator': position['elevator'], 'pivot': position['shoulder_pivot'],
+            'wrist': position['wrist_pivot'] if wrist is None else wrist}
+
+
+def command_group_time(start, target, region, wrist_first, time_step=0.01) -> float:
+    """ how long the independent Move commands take - each axis runs its own fastest trapezoid """
+    times = {axis: motion_planner.trapezoid_time(target[axis] - start[axis], velocity_limits[axis], acceleration_limits[axis])
+             for axis in motion_planner.k_axes}
+    arm_time = max(times['elevator'], times['pivot'])
+    if times['wrist'] == 0:
+        return arm_time
+    if wrist_first:  # MoveWrist waits for a safe pose, but nothing else is moving
+        return times['wrist'] + arm_time if region.is_safe(start['elevator'], start['pivot']) else math.inf
+    samples = np.arange(0, arm_time + time_step, time_step)
+    arm = {axis: start[axis] + motion_planner.trapezoid_samples(
+        target[axis] - start[axis], motion_planner.synchronized_velocity(target[axis] - start[axis], times[axis], acceleration_limits[axis]),
+        acceleration_limits[axis], samples)[0] for axis in motion_planner.k_arm_axes}
+    safe = region.is_safe(arm['elevator'], arm['pivot'])
+    if not safe.any():
+        return math.inf
+    return max(arm_time, samples[np.argmax(safe)] + times['wrist'])
+
+
+def main():
+    region = safe_region.default_region()
+    cases = [
+        ('stow -> l4', pose('stow'), pose('l4'), False),
+        ('stow (wrist 0) -> l4', pose('stow', wrist=0), pose('l4'), False),
+        ('l4 -> stow', pose('l4'), pose('stow'), True),
+        ('l4 (wrist 0) -> stow', pose('l4', wrist=0), pose('stow'), True),
+        ('l2 (wrist 0) -> l4', pose('l2', wrist=0), pose('l4'), False),
+    ]
+    print(f'{"move":<24}{"commands (s)":>14}{"coordinated (s)":>17}{"saved (s)":>11}{"plan (ms)":>11}')
+    for label, start, target, wrist_first in cases:
+        baseline = command_group_time(start, target, region, wrist_first)
+        plan_start = time.perf_counter()
+        _, report = motion_planner.plan_move(start, target, velocity_limits, acceleration_limits, region)
+        plan_time = time.perf_counter() - plan_start
+        note = '' if report['wrist_safe'] else '  (wrist held - never safe)'
+        print(f'{label:<24}{baseline:>14.3f}{report["duration"]:>17.3f}{baseline - report["duration"]:>11.3f}{1000 * plan_time:>11.2f}{note}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark the trajectory cubic interpolation - run from the robot directory:  python tools/benchmark_interpolation.py
+Compares the old segment-by-segment masked loop against the single searchsorted pass and the PCHIP variant
+for 3, 10 and 50 waypoint trajectories, and reports how far each one overshoots its waypoints.
+"""
+import os
+import sys
+import timeit
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from trajectory import get_trajectory  # noqa: E402
+
+
+def old_cubic_hermite_interp(x, y, x_new):
+    """ copy of the original CustomTrajectory._cubic_hermite_interp - one boolean mask per segment """
+    dydx = np.zeros_like(y)
+    dydx[1:-1] = (y[2:] - y[:-2]) / (x[2:] - x[:-2])
+    dydx[0] = (y[1] - y[0]) / (x[1] - x[0])
+    dydx[-1] = (y[-1] - y[-2]) / (x[-1] - x[-2])
+
+    x_new = np.asarray(x_new)
+    y_new = np.zeros_like(x_new)
+    for i in range(len(x) - 1):
+        mask = (x_new >= x[i]) & (x_new < x[i + 1])
+        h = x[i + 1] - x[i]
+        t = (x_new[mask] - x[i]) / h
+        h00 = (1 + 2 * t) * (1 - t) ** 2
+        h10 = t * (1 - t) ** 2
+        h01 = t ** 2 * (3 - 2 * t)
+        h11 = t ** 2 * (t - 1)
+        y_new[mask] = h00 * y[i] + h10 * h * dydx[i] + h01 * y[i + 1] + h11 * h * dydx[i + 1]
+    return y_new
+
+
+def overshoot(x, y, y_new, x_new):
+    """ worst distance outside the range of the two waypoints bracketing each sample """
+    idx = np.clip(np.searchsorted(x, x_new, side='right') - 1, 0, len(x) - 2)
+    low = np.minimum(y[idx], y[idx + 1])
+    high = np.maximum(y[idx], y[idx + 1])
+    return float(np.max(np.maximum(low - y_new, 0) + np.maximum(y_new - high, 0)))
+
+
+def main(repeats=200):
+    rng = np.random.default_rng(2429)
+    interpolator = get_trajectory({0: {'elevator': 0, 'pivot': 0, 'wrist': 0, 'intake': 0},
+                                   1: {'elevator': 0, 'pivot': 0, 'wrist': 0, 'intake': 0}}, duration=1)
+
+    print(f"{'waypoints':>9} | {'old (us)':>9} | {'new (us)':>9} | {'pchip (us)':>10} | {'speedup':>7} | "
+          f"{'max |new-old|':>13} | {'cubic overshoot':>15} | {'pchip overshoot':>15}")
+    for count in [3, 10, 50]:
+        duration = 0.1 * count  # roughly what a real trajectory would have per waypoint
+        x = np.linspace(0, duration, count)
+        y = rng.uniform(0, 1.5, count)  # elevator-like heights with plenty of direction changes
+        x_new = np.linspace(0, duration, int(duration / 0.01) + 1)
+
+        old_time = timeit.timeit(lambda: old_cubic_hermite_interp(x, y, x_new), number=repeats) / repeats
+        new_time = timeit.timeit(lambda: interpolator._cubic_hermite_interp(x, y, x_new), number=repeats) / repeats
+        pchip_time = timeit.timeit(lambda: interpolator._cubic_hermite_interp(x, y, x_new, monotone=True), number=repeats) / repeats
+
+        old_values = old_cubic_hermite_interp(x, y, x_new)
+        new_values = interpolator._cubic_hermite_interp(x, y, x_new)
+        pchip_values = interpolator._cubic_hermite_interp(x, y, x_new, monotone=True)
+        # the old code left the very last sample at zero, so only compare the samples it actually filled
+        difference = float(np.max(np.abs(new_values[:-1] - old_values[:-1])))
+
+        print(f'{count:9d} | {1e6 * old_time:9.1f} | {1e6 * new_time:9.1f} | {1e6 * pchip_time:10.1f} | '
+              f'{old_time / new_time:6.1f}x | {difference:13.2e} | {overshoot(x, y, new_values, x_new):15.4f} | '
+              f'{overshoot(x, y, pchip_values, x_new):15.4f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Build the pivot gravity table from holding voltages - run from the robot directory:
+    python tools/build_gravity_table.py [holding.csv]
+The csv has a header and one row per steady hold: pivot_rad, wrist_rad, load, volts (load is empty / coral / algae)
+Log them with the pivot still - applied output * bus voltage, averaged over a second or so at each pose
+Prints six coefficients per load to paste into ShoulderConstants.k_gravity_coefficients, how well they fit,
+and how far the table is from plain kG * cos(pivot).  With no csv it just reports on the geometry model
+"""
+import csv
+import math
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from constants import ShoulderConstants, WristConstants  # noqa: E402
+import gravity_table  # noqa: E402
+
+
+def read_holds(filename):
+    """ {load: (pivot angles, wrist angles, volts)} """
+    holds = {}
+    with open(filename, newline='') as f:
+        for row in csv.DictReader(f):
+            holds.setdefault(row['load'], []).append((float(row['pivot_rad']), float(row['wrist_rad']), float(row['volts'])))
+    return {load: tuple(np.array(column) for column in zip(*rows)) for load, rows in holds.items()}
+
+
+def main():
+    table = gravity_table.default_table()
+    if len(sys.argv) > 1:
+        coefficients = {}
+        for load, (pivot_angles, wrist_angles, volts) in read_holds(sys.argv[1]).items():
+            coefficients[load], rms = gravity_table.fit_coefficients(pivot_angles, wrist_angles, volts)
+            print(f'{load:<6} {len(volts):>4} holds   rms residual {rms:.3f} V')
+        print('k_gravity_coefficients = {' + ', '.join(
+            f"'{load}': ({', '.join(f'{c:.4f}' for c in values)})" for load, values in coefficients.items()) + '}')
+        table = gravity_table.GravityTable.from_coefficients(
+            coefficients, (ShoulderConstants.k_min_angle, ShoulderConstants.k_max_angle),
+            (WristConstants.k_min_angle, WristConstants.k_max_angle), ShoulderConstants.k_gravity_table_step)
+
+    # how much the single kG is off by, over the whole grid
+    plain = ShoulderConstants.k_kG_volts * np.cos(table.pivot_angles)[:, None]
+    for load, grid in table.volts.items():
+        difference = grid - plain
+        i, j = np.unravel_index(np.argmax(np.abs(difference)), difference.shape)
+        print(f'{load:<6} table - kG*cos(pivot): worst {difference[i, j]:+.3f} V at pivot {math.degrees(table.pivot_angles[i]):.0f} deg, '
+              f'wrist {math.degrees(table.wrist_angles[j]):.0f} deg   (rms {np.sqrt(np.mean(difference ** 2)):.3f} V)')
+
+    # interpolation error against the exact coefficients, and what a lookup costs
+    rng = np.random.default_rng(0)
+    pivots = rng.uniform(ShoulderConstants.k_min_angle, ShoulderConstants.k_max_angle, 2000)
+    wrists = rng.uniform(WristConstants.k_min_angle, WristConstants.k_max_angle, 2000)
+    lookups = [(float(p), float(w)) for p, w in zip(pivots, wrists)]
+    start = time.perf_counter()
+    looked_up = np.array([table.lookup(p, w, 'empty') for p, w in lookups])
+    lookup_time = (time.perf_counter() - start) / len(lookups)
+    coefficients, _ = gravity_table.fit_coefficients(table.pivot_angles[:, None], table.wrist_angles[None, :], table.volts['empty'])
+    exact = gravity_table.basis(pivots, wrists) @ coefficients
+    print(f'bilinear error {np.max(np.abs(looked_up - exact)) * 1000:.1f} mV worst at a {math.degrees(ShoulderConstants.k_gravity_table_step):.0f} deg grid,'
+          f'   lookup {lookup_time * 1e6:.2f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""
+Build deploy/trajectories.bin from trajectory_library.trajectory_specs - run from the robot directory before deploying:
+    python tools/build_trajectories.py
+Also times generating every trajectory at startup (the old way) against mapping the file and wrapping them (the new way)
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import trajectory  # noqa: E402
+import trajectory_library  # noqa: E402
+
+
+def main(path=trajectory_library.k_library_path):
+    entries = trajectory_library.write_library(path)
+    print(f'wrote {len(entries)} trajectories to {path} ({os.path.getsize(path)} bytes, hash {trajectory_library.specs_hash()[:12]})')
+
+    # startup comparison - both build every named trajectory the way the robot would on boot
+    trajectory.trajectory_cache.clear()  # write_library just filled it - time a cold boot
+    start = time.perf_counter()
+    for name in trajectory_library.trajectory_specs:
+        trajectory_library.generate_trajectory(name)
+    generate_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    library = trajectory_library.TrajectoryLibrary(path)
+    for name in library.names():
+        library.get(name)
+    load_time = time.perf_counter() - start
+
+    print(f'generate at startup: {1000 * generate_time:.2f} ms   load from library: {1000 * load_time:.2f} ms   '
+          f'({generate_time / load_time:.1f}x, fallbacks: {library.fallbacks})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Rise and settle time of the elevator controllers in sim - run from the robot directory:
+    python tools/compare_elevator_controllers.py
+Both run on the ElevatorSim physics.py uses and follow the same 20 ms trapezoid from k_min_height:
+  trapezoid   - spark P loop at 1 kHz on the profiled position, plus ElevatorFeedforward as arbFF (what we run now)
+  state_space - Elevator's LQR + Kalman loop at 50 Hz, plus kG (ElevatorConstants.k_control_mode = 'state_space')
+The sim has no sensor delay and no friction, so use it to compare the two, not to predict the robot
+"""
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wpilib import simulation as simlib  # noqa: E402
+import wpimath.controller  # noqa: E402
+import wpimath.trajectory  # noqa: E402
+
+from constants import ElevatorConstants  # noqa: E402
+from subsystems.elevator import elevator_state_space_loop  # noqa: E402
+
+k_period = 0.02
+k_spark_period = 0.001
+k_spark_p = 1.4  # slot 0 - duty cycle per meter of error
+k_duration = 3.0
+
+
+def make_sim(start):
+    # same as physics.py initialize_elevator
+    return simlib.ElevatorSim(gearbox=ElevatorConstants.k_plant, gearing=ElevatorConstants.k_gear_ratio / 2,
+                              carriageMass=ElevatorConstants.k_mass_kg, drumRadius=ElevatorConstants.k_effective_pulley_diameter / 2,
+                              minHeight=ElevatorConstants.k_min_height, maxHeight=ElevatorConstants.k_max_height,
+                              simulateGravity=True, startingHeight=start)
+
+
+def run(mode, start, goal):
+    """ (times, positions) sampled at the spark rate """
+    sim = make_sim(start)
+    profile = wpimath.trajectory.TrapezoidProfile(wpimath.trajectory.TrapezoidProfile.Constraints(
+        ElevatorConstants.k_max_velocity_meter_per_second, ElevatorConstants.k_max_acceleration_meter_per_sec_squared))
+    feedforward = wpimath.controller.ElevatorFeedforward(ElevatorConstants.k_kS_volts, ElevatorConstants.k_kG_volts,
+                                                         ElevatorConstants.k_kV_volt_second_per_radian,
+                                                         ElevatorConstants.k_kA_volt_second_squared_per_meter, k_period)
+    loop = elevator_state_space_loop(k_period)
+    loop.reset([start, 0])
+    state = wpimath.trajectory.TrapezoidProfile.State(start, 0)
+    goal_state = wpimath.trajectory.TrapezoidProfile.State(goal, 0)
+
+    steps_per_loop = int(round(k_period / k_spark_period))
+    times, positions = [], []
+    volts = 0
+    for loop_index in range(int(k_duration / k_period)):
+        state = profile.calculate(k_period, state, goal_state)
+        if mode == 'state_space':
+            loop.setNextR([state.position, state.velocity])
+            loop.correct([sim.getPosition()])
+            loop.predict(k_period)
+            volts = loop.U(0) + feedforward.calculate(0)
+        else:
+            arb_feedforward = feedforward.calculate(state.velocity / 2)  # same as Elevator.useState
+        for step in range(steps_per_loop):
+            if mode != 'state_space':  # the spark closes the loop every ms on the latest setpoint
+                volts = 12 * max(-1, min(1, k_spark_p * (state.position - sim.getPosition()))) + arb_feedforward
+            sim.setInput(0, max(-12, min(12, volts)))
+            sim.update(k_spark_period)
+            times.append((loop_index * steps_per_loop + step + 1) * k_spark_period)
+            positions.append(sim.getPosition())
+    return np.array(times), np.array(positions)
+
+
+def step_metrics(times, positions, start, goal, tolerance=ElevatorConstants.k_tolerance):
+    """ 10-90% rise time, settle time (inside tolerance from then on) and overshoot """
+    travel = goal - start
+    progress = (positions - start) / travel
+    rise = times[np.argmax(progress >= 0.9)] - times[np.argmax(progress >= 0.1)] if (progress >= 0.9).any() else np.inf
+    outside = np.flatnonzero(np.abs(positions - goal) >= tolerance)
+    settle = times[outside[-1] + 1] if len(outside) and outside[-1] + 1 < len(times) else (0.0 if not len(outside) else np.inf)
+    overshoot = max(0.0, np.max(progress) - 1) * abs(travel)
+    return rise, settle, overshoot
+
+
+def main():
+    moves = [(ElevatorConstants.k_min_height, 1.2), (1.2, 0.6), (0.6, ElevatorConstants.k_min_height)]
+    print(f'{"move (m)":<14}{"controller":<13}{"rise (s)":>10}{"settle (s)":>12}{"overshoot (mm)":>16}')
+    for start, goal in moves:
+        for mode in ['trapezoid', 'state_space']:
+            rise, settle, overshoot = step_metrics(*run(mode, start, goal), start, goal)
+            print(f'{start:.2f} -> {goal:.2f}  {mode:<13}{rise:>10.3f}{settle:>12.3f}{1000 * overshoot:>16.1f}')
+
+
+if __name__ == '__main__':
+    main()
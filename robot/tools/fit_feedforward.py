@@ -0,0 +1,78 @@
+"""
+Fit kS / kG / kV / kA to the runs Characterize saved - numpy only, so run it on a laptop from the robot directory:
+    python tools/fit_feedforward.py [run.npz ...]     (default: every characterization/*.npz)
+Copy the files off the rio first:  scp lvuser@10.24.29.2:characterization/*.npz characterization/
+Each mechanism is one least squares fit over all of its runs:  volts = kS sgn(v) + kG g(x) + kV v + kA a
+  elevator: g = 1    pivot: g = cos(angle), angle 0 is level like ArmFeedforward
+Acceleration is differentiated from the logged velocity, and samples that are barely moving or are in the first
+k_skip_time of a run are dropped - static friction doesn't follow the model, and the first loop is before the volts act
+"""
+import glob
+import os
+import sys
+import numpy as np
+
+k_skip_time = 0.02  # s at the start of each run - the first loop logs volts that haven't acted yet
+k_min_velocity_fraction = 0.05  # of the run's top speed - slower than this is stiction, not kS
+k_velocity_scale = {'elevator': 0.5, 'pivot': 1.0}  # Elevator.useState feeds the feedforward velocity / 2 (the cascade)
+k_units = {'elevator': 'm', 'pivot': 'rad'}
+
+
+def load_runs(filenames):
+    """ {mechanism: [run dicts]} """
+    runs = {}
+    for filename in filenames:
+        with np.load(filename) as f:
+            data = f['data'].astype(float)
+            columns = [str(c) for c in f['columns']]
+            run = {column: data[:, idx] for idx, column in enumerate(columns)}
+            run.update({'test': str(f['test']), 'name': os.path.basename(filename)})
+            runs.setdefault(str(f['mechanism']), []).append(run)
+    return runs
+
+
+def design_rows(run, mechanism):
+    """ (regressors, volts) for the samples we keep from one run - columns are sgn(v), g(x), v, a """
+    velocity = run['velocity']
+    acceleration = np.gradient(velocity, run['time']) if len(velocity) > 2 else np.zeros_like(velocity)
+    keep = (run['time'] >= k_skip_time) & (np.abs(velocity) > k_min_velocity_fraction * np.max(np.abs(velocity)))
+    gravity = np.ones_like(velocity) if mechanism == 'elevator' else np.cos(run['position'])
+    regressors = np.column_stack([np.sign(velocity), gravity, velocity, acceleration])
+    return regressors[keep], run['volts'][keep]
+
+
+def fit(runs, mechanism):
+    """ (kS, kG, kV, kA) in logged units, overall R^2 and RMSE, and the RMSE of each run """
+    rows = [design_rows(run, mechanism) for run in runs]
+    regressors = np.concatenate([r for r, _ in rows])
+    volts = np.concatenate([v for _, v in rows])
+    gains, *_ = np.linalg.lstsq(regressors, volts, rcond=None)
+    residual = volts - regressors @ gains
+    r_squared = 1 - np.sum(residual ** 2) / np.sum((volts - volts.mean()) ** 2)
+    rmse = np.sqrt(np.mean(residual ** 2))
+    per_run = [(run['name'], len(v), np.sqrt(np.mean((v - r @ gains) ** 2)) if len(v) else np.nan) for run, (r, v) in zip(runs, rows)]
+    return gains, r_squared, rmse, per_run
+
+
+def main():
+    filenames = sys.argv[1:] or sorted(glob.glob(os.path.join('characterization', '*.npz')))
+    if not filenames:
+        print('no runs - pass some .npz files or put them in characterization/')
+        return
+    for mechanism, runs in load_runs(filenames).items():
+        tests = {run['test'] for run in runs}
+        (ks, kg, kv, ka), r_squared, rmse, per_run = fit(runs, mechanism)
+        unit = k_units.get(mechanism, 'unit')
+        print(f'{mechanism}: {len(runs)} runs ({", ".join(sorted(tests))})   R^2 {r_squared:.4f}   RMSE {rmse:.3f} V')
+        print(f'    kS {ks:.4f} V   kG {kg:.4f} V   kV {kv:.4f} V/({unit}/s)   kA {ka:.4f} V/({unit}/s^2)')
+        scale = k_velocity_scale.get(mechanism, 1.0)
+        if scale != 1.0:  # what goes in constants, given the velocity the subsystem actually hands its feedforward
+            print(f'    for the constants (feedforward sees velocity * {scale}):  kV {kv / scale:.4f}   kA {ka / scale:.4f}')
+        if 'dynamic' not in tests:
+            print('    no dynamic runs - kA is a guess until there are some')
+        for name, samples, run_rmse in per_run:
+            print(f'    {name:<48}{samples:>6} samples   RMSE {run_rmse:.3f} V')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""
+Run MyRobot and physics.py headless on a simulated clock, as fast as the CPU allows - run from the robot directory:
+    python tools/headless_sim.py --auto "1+1 in code" --alliance red --station 1 [--teleop 0] [--trace trace.csv]
+No GUI and no real time: HAL timing is paused and stepped 20 ms at a time, the driver station is set from here,
+and PhysicsEngine.update_sim runs before every robot loop just like under pyfrc.  One robot per process (the HAL is global),
+so to run many at once, call run_match from a pool of worker processes
+The trace is one row every trace_period: match time, mode, true pose from the sim, the robot's own pose estimate,
+elevator (m), pivot and wrist (deg), whether the intake sees coral, the intake volts and whether the auto is still running
+"""
+import argparse
+import contextlib
+import csv
+import math
+import os
+import sys
+import threading
+import time
+
+k_robot_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, k_robot_folder)
+import hal  # noqa: E402
+import hal.simulation  # noqa: E402
+import ntcore  # noqa: E402
+import wpilib  # noqa: E402
+from wpilib.simulation import DriverStationSim, pauseTiming, restartTiming, stepTiming  # noqa: E402
+from wpimath.geometry import Pose2d, Twist2d  # noqa: E402
+
+k_period = 0.02
+k_trace_columns = ['time', 'mode', 'x', 'y', 'heading', 'est_x', 'est_y', 'est_heading', 'elevator', 'pivot', 'wrist', 'has_coral',
+                   'intake', 'auto_running']
+
+
+class HeadlessPhysicsController:
+    """ the parts of pyfrc's PhysicsInterface that physics.py uses - just the drivetrain pose, no field widget """
+
+    def __init__(self) -> None:
+        self.pose = Pose2d()
+
+    def drive(self, speeds, tm_diff) -> Pose2d:
+        self.pose = self.pose.exp(Twist2d(speeds.vx * tm_diff, speeds.vy * tm_diff, speeds.omega * tm_diff))
+        return self.pose
+
+    def get_pose(self) -> Pose2d:
+        return self.pose
+
+    def get_true_pose(self) -> Pose2d:
+        """ where the robot really is - the same as get_pose here, but a noisy controller can let the two drift apart """
+        return self.pose
+
+    def move_robot(self, transform) -> Pose2d:
+        self.pose = self.pose.transformBy(transform)
+        return self.pose
+
+
+@contextlib.contextmanager
+def robot_deploy_directory():
+    """ wpilib (and so PathPlanner) finds deploy/ next to the main script, which is us in tools/ - pretend it is robot.py,
+    the way `robotpy sim` runs it, and put it back afterwards
+    """
+    main = sys.modules['__main__']
+    main_file = getattr(main, '__file__', None)
+    main.__file__ = os.path.join(k_robot_folder, 'robot.py')
+    try:
+        yield
+    finally:
+        main.__file__ = main_file
+
+
+def trace_row(robot, physics_controller, mode):
+    container = robot.container
+    pose, estimate = physics_controller.get_true_pose(), container.swerve.get_pose()
+    auto_running = robot.autonomousCommand is not None and robot.autonomousCommand.isScheduled()
+    return (round(wpilib.Timer.getFPGATimestamp(), 3), mode, round(pose.X(), 3), round(pose.Y(), 3), round(pose.rotation().degrees(), 1),
+            round(estimate.X(), 3), round(estimate.Y(), 3), round(estimate.rotation().degrees(), 1),
+            round(container.elevator.get_height(), 3), round(math.degrees(container.pivot.get_angle()), 1),
+            round(math.degrees(container.wrist.get_angle()), 1), int(container.intake.has_coral()),
+            container.intake.reference, int(auto_running))
+
+
+def run_match(auto=None, alliance='blue', station=1, auto_time=15.0, teleop_time=0.0, trace_period=0.1, setup=None,
+              physics_controller=None):
+    """ one match: disabled for a moment (so the auto chooser sees its selection), then auto, then teleop
+    setup(robot, physics_engine), if given, runs after robotInit and before the first step - for moving the robot or adding noise
+    physics_controller replaces the HeadlessPhysicsController, e.g. with one that slips
+    Returns {'columns', 'trace', 'sim_time', 'wall_time'}
+    """
+    with robot_deploy_directory():
+        return _run_match(auto, alliance, station, auto_time, teleop_time, trace_period, setup, physics_controller)
+
+
+def _run_match(auto, alliance, station, auto_time, teleop_time, trace_period, setup, physics_controller):
+    from robot import MyRobot  # here so this module can be imported before the HAL is up
+    import physics
+    from photonlibpy.timesync import timeSyncServer
+
+    wall_start = time.perf_counter()
+    timeSyncServer.inst.PORT = 0  # no coprocessor to sync with, and parallel runs would fight over 5810
+    if not hal.initialize(500, 0):
+        raise RuntimeError('HAL failed to initialize')
+    pauseTiming()
+    restartTiming()
+
+    ntcore.NetworkTableInstance.getDefault().startLocal()  # no server - nobody is listening, and parallel runs would fight over the ports
+    robot = MyRobot()
+    errors = []
+
+    def robot_thread():
+        try:
+            robot.startCompetition()
+        except Exception as e:  # surface it in the main thread instead of hanging
+            errors.append(e)
+
+    thread = threading.Thread(target=robot_thread, daemon=True)
+    thread.start()
+    while not hal.simulation.getProgramStarted():  # robotInit is done
+        if not thread.is_alive():
+            raise errors[0] if errors else RuntimeError('robot exited before it started')
+        time.sleep(0.001)
+
+    physics_controller = HeadlessPhysicsController() if physics_controller is None else physics_controller
+    engine = physics.PhysicsEngine(physics_controller, robot)
+    last_time = [wpilib.Timer.getFPGATimestamp()]
+
+    def on_sim_periodic():  # runs in the robot thread before simulationPeriodic, same hook pyfrc uses
+        now = wpilib.Timer.getFPGATimestamp()
+        engine.update_sim(now, now - last_time[0])
+        last_time[0] = now
+    callback = hal.simulation.registerSimPeriodicBeforeCallback(on_sim_periodic)  # noqa: F841 - the handle keeps it registered
+    if setup is not None:
+        setup(robot, engine)
+
+    station_id = getattr(hal.AllianceStationID, f'k{alliance.capitalize()}{station}')
+    DriverStationSim.setAllianceStationId(station_id)
+    DriverStationSim.setDsAttached(True)
+    if auto is not None:
+        ntcore.NetworkTableInstance.getDefault().getTable('SmartDashboard').getSubTable('autonomous routines').putString('selected', auto)
+
+    trace = []
+    steps_per_trace = max(1, int(round(trace_period / k_period)))
+    phases = [('disabled', 0.5, False, False), ('auto', auto_time, True, True), ('teleop', teleop_time, False, True)]
+    for mode, duration, autonomous, enabled in phases:
+        DriverStationSim.setAutonomous(autonomous)
+        DriverStationSim.setEnabled(enabled)
+        DriverStationSim.setMatchTime(duration)
+        for step in range(int(round(duration / k_period))):
+            DriverStationSim.notifyNewData()
+            stepTiming(k_period)
+            if errors:
+                raise errors[0]
+            if step % steps_per_trace == 0 and mode != 'disabled':
+                trace.append(trace_row(robot, physics_controller, mode))
+
+    sim_time = wpilib.Timer.getFPGATimestamp()
+    DriverStationSim.setEnabled(False)
+    DriverStationSim.notifyNewData()
+    robot.endCompetition()
+    thread.join(timeout=1.0)
+    return {'columns': k_trace_columns, 'trace': trace, 'sim_time': sim_time, 'wall_time': time.perf_counter() - wall_start}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='headless faster-than-real-time match')
+    parser.add_argument('--auto', default=None, help='name in the autonomous routines chooser (default: its default option)')
+    parser.add_argument('--alliance', default='blue', choices=['red', 'blue'])
+    parser.add_argument('--station', default=1, type=int, choices=[1, 2, 3])
+    parser.add_argument('--auto-time', default=15.0, type=float)
+    parser.add_argument('--teleop', default=0.0, type=float, help='seconds of (driverless) teleop after the auto')
+    parser.add_argument('--trace-period', default=0.1, type=float)
+    parser.add_argument('--trace', default=None, help='csv file for the trace - otherwise just the summary')
+    args = parser.parse_args()
+
+    result = run_match(args.auto, args.alliance, args.station, args.auto_time, args.teleop, args.trace_period)
+    if args.trace:
+        with open(args.trace, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(result['columns'])
+            writer.writerows(result['trace'])
+    final = dict(zip(result['columns'], result['trace'][-1])) if result['trace'] else {}
+    print(f'{result["sim_time"]:.1f} s of match in {result["wall_time"]:.2f} s of wall time '
+          f'({result["sim_time"] / result["wall_time"]:.1f}x real time), {len(result["trace"])} trace rows')
+    if final:
+        print(f'final pose ({final["x"]:.2f}, {final["y"]:.2f}, {final["heading"]:.0f} deg)  estimate ({final["est_x"]:.2f}, {final["est_y"]:.2f})  '
+              f'elevator {final["elevator"]:.2f} m  pivot {final["pivot"]:.0f} deg  wrist {final["wrist"]:.0f} deg  coral {final["has_coral"]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""
+How robust the PathPlanner autos are to noise - N headless sims of each, spread over a process pool - run from the robot directory:
+    python tools/monte_carlo_autos.py [--autos "1+1" "1+0" "1+0 trough"] [--runs 20] [--workers 8] [--json report.json]
+Every run draws its own noise (seeded, so a run can be repeated with --seed):
+  wheel slip     - the robot really moves (1 - slip) of what odometry thinks it moved
+  gyro drift     - a constant heading rate error on what the robot believes
+  vision         - a fix every k_vision_period pulls the belief back to the truth, and each one is missed with the dropout chance
+  start pose     - the robot isn't quite where the auto assumes it starts
+Each worker process runs one robot and is then replaced (the HAL is global), so the runs are independent and scale with cores
+Every robot starts where the auto's first path does (the sim itself starts at the origin), like a drive team would place it
+The report is per auto: completion rate (ended up at the end of the last path and scored as often as the auto tries to),
+final pose error, scores, first score time, the time between scores when there is more than one, and the auto duration
+--slip 0 --drift 0 --dropout 0 --start-xy 0 --start-heading 0 is the noise-free baseline - every auto should complete there
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wpimath.geometry import Pose2d, Rotation2d, Transform2d, Twist2d  # noqa: E402
+
+from headless_sim import HeadlessPhysicsController, k_robot_folder, robot_deploy_directory, run_match  # noqa: E402
+
+k_pathplanner_folder = os.path.join(k_robot_folder, 'deploy', 'pathplanner')
+k_scoring_commands = {'score'}  # NamedCommands that put a piece on the reef
+k_vision_period = 0.1  # s between vision fixes when the tags are visible
+k_vision_std = 0.03  # m of noise on a vision fix
+k_completion_tolerance = 0.15  # m from the end of the last path for the run to count as completed
+k_default_noise = {'slip': 0.08, 'drift': math.radians(1.0), 'dropout': 0.8, 'start_xy': 0.05, 'start_heading': math.radians(2)}
+
+
+class NoisyPhysicsController(HeadlessPhysicsController):
+    """ keeps two poses: get_pose is what the robot's odometry and gyro believe (physics.py hands it to the pose estimator),
+    get_true_pose is where the sim robot really is
+    """
+
+    def __init__(self, rng, noise) -> None:
+        super().__init__()
+        self.rng = rng
+        self.true_pose = Pose2d()
+        self.slip = rng.uniform(0, noise['slip'])
+        self.drift = rng.normal(0, noise['drift'])  # rad/s
+        self.dropout = min(rng.uniform(0, noise['dropout']), 1.0)  # chance each vision fix is missed
+        self.since_vision = 0.0
+
+    def drive(self, speeds, tm_diff) -> Pose2d:
+        keep = 1 - self.slip
+        self.true_pose = self.true_pose.exp(Twist2d(speeds.vx * tm_diff * keep, speeds.vy * tm_diff * keep, speeds.omega * tm_diff * keep))
+        self.pose = self.pose.exp(Twist2d(speeds.vx * tm_diff, speeds.vy * tm_diff, (speeds.omega + self.drift) * tm_diff))
+        self.since_vision += tm_diff
+        if self.since_vision >= k_vision_period:
+            self.since_vision = 0.0
+            if self.rng.random() >= self.dropout:
+                noise = self.rng.normal(0, k_vision_std, 2)
+                self.pose = Pose2d(self.true_pose.X() + noise[0], self.true_pose.Y() + noise[1], self.true_pose.rotation())
+        return self.pose
+
+    def move_robot(self, transform) -> Pose2d:
+        self.true_pose = self.true_pose.transformBy(transform)
+        return super().move_robot(transform)
+
+    def get_true_pose(self) -> Pose2d:
+        return self.true_pose
+
+    def offset_start(self, dx, dy, dtheta) -> None:
+        """ the robot is really here, but believes it is where it was put """
+        self.true_pose = self.true_pose.transformBy(Transform2d(dx, dy, Rotation2d(dtheta)))
+
+
+def auto_plan(auto, alliance='blue'):
+    """ what a clean run of the auto looks like, from its PathPlanner files:
+    {'start': Pose2d the first path starts from, 'end': (x, y, heading deg) where the last generated path really ends,
+     'scores': how many scoring commands it runs}
+    The end comes from pathplannerlib, not the last anchor in the .path file - the generated path can stop short of that
+    """
+    from pathplannerlib.path import PathPlannerPath
+    with open(os.path.join(k_pathplanner_folder, 'autos', f'{auto}.auto')) as f:
+        command = json.load(f)['command']
+
+    def walk(node):
+        yield node
+        for child in node.get('data', {}).get('commands', []):
+            yield from walk(child)
+    names = [node['data']['pathName'] for node in walk(command) if node['type'] == 'path']
+    scores = sum(node['type'] == 'named' and node['data']['name'] in k_scoring_commands for node in walk(command))
+    if not names:
+        return {'start': None, 'end': None, 'scores': scores}
+    with robot_deploy_directory():
+        first, last = PathPlannerPath.fromPathFile(names[0]), PathPlannerPath.fromPathFile(names[-1])
+    if alliance == 'red':  # same rotational flip AutoBuilder does
+        first, last = first.flipPath(), last.flipPath()
+    end = last.getAllPathPoints()[-1].position
+    return {'start': first.getStartingHolonomicPose(), 'end': (end.X(), end.Y(), last.getGoalEndState().rotation.degrees()),
+            'scores': scores}
+
+
+def summarize_run(columns, trace, plan, scoring_volts):
+    """ completion, final error and the event times from one trace
+    completed: ended within k_completion_tolerance of the end of the last path and scored as often as the auto tries to
+    ended: the auto command finished inside the auto period - some autos legitimately wait on the driver at the end
+    """
+    rows = {column: np.array([row[idx] for row in trace]) for idx, column in enumerate(columns) if column != 'mode'}
+    modes = np.array([row[columns.index('mode')] for row in trace])
+    auto = modes == 'auto'
+    times = rows['time'][auto] - rows['time'][auto][0]
+    running = rows['auto_running'][auto].astype(bool)
+    ended = not running[-1]
+    duration = float(times[np.argmin(running)]) if ended else float('nan')
+    scoring = rows['intake'][auto] == scoring_volts
+    score_times = sorted(times[1:][scoring[1:] & ~scoring[:-1]].tolist() + ([0.0] if scoring[0] else []))
+    x, y, heading = rows['x'][auto][-1], rows['y'][auto][-1], rows['heading'][auto][-1]
+    result = {'ended': ended, 'duration': duration, 'score_times': score_times}
+    completed = len(score_times) >= plan['scores']
+    if plan['end'] is not None:
+        target = plan['end']
+        result['position_error'] = float(math.hypot(x - target[0], y - target[1]))
+        result['heading_error'] = float(abs((heading - target[2] + 180) % 360 - 180))
+        completed = completed and result['position_error'] < k_completion_tolerance
+    result['completed'] = completed
+    return result
+
+
+def quiet_worker() -> None:
+    """ pool initializer: the robot prints a lot on boot - send a worker's stdout to /dev/null (errors come back in the summary) """
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+
+
+def run_one(job):
+    """ worker: one noisy sim of one auto - returns a small summary, not the trace """
+    import constants  # here, after quiet_worker - it prints on import, and spawn imports this module in every worker
+    auto, seed, alliance, noise = job
+    rng = np.random.default_rng(seed)
+    controller = NoisyPhysicsController(rng, noise)
+    start_error = (rng.normal(0, noise['start_xy']), rng.normal(0, noise['start_xy']), rng.normal(0, noise['start_heading']))
+    try:
+        plan = auto_plan(auto, alliance)
+
+        def setup(robot, engine):  # put the robot where the drive team would, then add the error
+            if plan['start'] is not None:
+                controller.move_robot(Transform2d(controller.get_pose(), plan['start']))
+            controller.offset_start(*start_error)
+        result = run_match(auto=auto, alliance=alliance, trace_period=0.04, physics_controller=controller, setup=setup)
+        summary = summarize_run(result['columns'], result['trace'], plan, constants.IntakeConstants.k_coral_scoring_voltage)
+        summary['wall_time'] = result['wall_time']
+    except Exception as e:  # one bad run shouldn't take the batch down - it shows up in the report
+        summary = {'error': f'{type(e).__name__}: {e}', 'completed': False, 'ended': False}
+    summary.update({'auto': auto, 'seed': seed, 'slip': controller.slip, 'drift': controller.drift, 'dropout': controller.dropout})
+    return summary
+
+
+def percentiles(values, points=(10, 50, 90)):
+    values = np.asarray([v for v in values if v is not None and not math.isnan(v)], dtype=float)
+    if len(values) == 0:
+        return 'n/a'
+    return '  '.join(f'p{p} {np.percentile(values, p):.2f}' for p in points) + f'  max {values.max():.2f}'
+
+
+def report(summaries, autos):
+    lines = []
+    for auto in autos:
+        runs = [s for s in summaries if s['auto'] == auto]
+        good = [s for s in runs if 'error' not in s]
+        completed = sum(s['completed'] for s in runs)
+        lines.append(f'{auto}: {len(runs)} runs, completed {completed} ({100 * completed / max(len(runs), 1):.0f}%), '
+                     f'auto ended in time {sum(s["ended"] for s in runs)}, errors {len(runs) - len(good)}')
+        lines.append(f'    final position error (m)   {percentiles(s.get("position_error") for s in good)}')
+        lines.append(f'    final heading error (deg)  {percentiles(s.get("heading_error") for s in good)}')
+        lines.append(f'    scores                     {percentiles(len(s["score_times"]) for s in good)}')
+        lines.append(f'    first score (s)            {percentiles(s["score_times"][0] for s in good if s["score_times"])}')
+        between = [b - a for s in good for a, b in zip(s['score_times'], s['score_times'][1:])]
+        if between:  # only autos that score more than once have a cycle to time
+            lines.append(f'    between scores (s)         {percentiles(between)}')
+        lines.append(f'    auto duration (s)          {percentiles(s["duration"] for s in good)}')
+        failed = [s for s in good if not s['completed']]
+        if failed:  # the noise that hurt - worst first, so they can be re-run with --seed
+            failed.sort(key=lambda s: -s.get('position_error', 0))
+            lines.append('    worst: ' + ', '.join(f'seed {s["seed"]} (slip {s["slip"]:.2f}, drift {math.degrees(s["drift"]):.1f} deg/s, '
+                                                 f'dropout {s["dropout"]:.2f})' for s in failed[:3]))
+        for s in runs:
+            if 'error' in s:
+                lines.append(f'    seed {s["seed"]}: {s["error"]}')
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Monte Carlo robustness of the PathPlanner autos')
+    parser.add_argument('--autos', nargs='+', default=['1+1', '1+0', '1+0 trough'])
+    parser.add_argument('--runs', type=int, default=20, help='runs per auto')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=0, help='first seed - run i of an auto uses seed + i')
+    parser.add_argument('--alliance', default='blue', choices=['red', 'blue'])
+    parser.add_argument('--json', default=None, help='also write every run summary here')
+    parser.add_argument('--verbose', action='store_true', help="keep the robots' own printing")
+    for key, value in k_default_noise.items():
+        parser.add_argument(f'--{key.replace("_", "-")}', type=float, default=value, help=f'noise scale (default {value:.3f})')
+    args = parser.parse_args()
+    noise = {key: getattr(args, key) for key in k_default_noise}
+
+    jobs = [(auto, args.seed + idx, args.alliance, noise) for auto in args.autos for idx in range(args.runs)]
+    start = time.perf_counter()
+    # spawn, not fork - each worker needs a clean HAL, and maxtasksperchild=1 gives every run a fresh process
+    initializer = None if args.verbose else quiet_worker
+    with multiprocessing.get_context('spawn').Pool(processes=args.workers, maxtasksperchild=1, initializer=initializer) as pool:
+        summaries = []
+        for summary in pool.imap_unordered(run_one, jobs):
+            summaries.append(summary)
+            print(f'\r{len(summaries)}/{len(jobs)} runs', end='', flush=True)
+    elapsed = time.perf_counter() - start
+    print(f'\r{len(jobs)} runs on {args.workers} workers in {elapsed:.1f} s ({60 * len(jobs) / elapsed:.0f} runs per minute)')
+    print(report(summaries, args.autos))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(sorted(summaries, key=lambda s: (s['auto'], s['seed'])), f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Pick the slot 1 (MAXMotion) P gains for the elevator and the pivot in sim - run from the robot directory:
+    python tools/tune_maxmotion.py
+Each mechanism runs on the same sim physics.py gives it, with the spark side emulated every ms the way MAXMotion runs:
+the spark steps its own trapezoid from one goal frame, P acts on the profiled position (inside allowedClosedLoopError
+it doesn't), and the only feedforward is the gravity arbFF send_maxmotion_goal works out at the goal.
+With no velocity feedforward P has to drag the mechanism along the profile, so the slot 0 gains (tuned with the rio's
+ElevatorFeedforward / ArmFeedforward doing that) are too soft. Sweeps P over the k_positions moves and prints the worst
+settle time and overshoot for each gain.
+The sim has no sensor delay, noise or friction, so more gain always settles a little faster there - instead of the
+fastest gain it picks the knee: the smallest gain within k_knee of the best settle that never overshoots the tolerance
+"""
+import math
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wpilib import simulation as simlib  # noqa: E402
+import wpimath.trajectory  # noqa: E402
+
+import constants  # noqa: E402
+from constants import ElevatorConstants, ShoulderConstants  # noqa: E402
+
+k_spark_period = 0.001
+k_duration = 4.0
+k_knee = 1.1  # take the smallest gain that settles within 10% of the best one
+
+
+def make_elevator_sim(start):
+    # same as physics.py initialize_elevator
+    return simlib.ElevatorSim(gearbox=ElevatorConstants.k_plant, gearing=ElevatorConstants.k_gear_ratio / 2,
+                              carriageMass=ElevatorConstants.k_mass_kg, drumRadius=ElevatorConstants.k_effective_pulley_diameter / 2,
+                              minHeight=ElevatorConstants.k_min_height, maxHeight=ElevatorConstants.k_max_height,
+                              simulateGravity=True, startingHeight=start)
+
+
+def make_pivot_sim(start):
+    # same as physics.py initialize_shoulder
+    return simlib.SingleJointedArmSim(gearbox=ShoulderConstants.k_plant, gearing=ShoulderConstants.k_gear_ratio,
+                                      moi=ShoulderConstants.k_moi, armLength=ShoulderConstants.k_length_meters,
+                                      minAngle=ShoulderConstants.k_min_angle, maxAngle=ShoulderConstants.k_max_angle,
+                                      simulateGravity=True, startingAngle=start)
+
+
+# per mechanism: sim, MAXMotion limits, allowed error, tolerance, arbFF at the goal, gains to try and moves from k_positions
+k_mechanisms = {
+    'elevator': {
+        'make_sim': make_elevator_sim,
+        'position': lambda sim: sim.getPosition(),
+        'max_velocity': ElevatorConstants.k_max_velocity_meter_per_second,
+        'max_acceleration': ElevatorConstants.k_max_acceleration_meter_per_sec_squared,
+        'tolerance': ElevatorConstants.k_tolerance,
+        'gravity': lambda goal: ElevatorConstants.k_kG_volts,  # Elevator.send_maxmotion_goal: feedforward.calculate(0)
+        'gains': [1.4, 2, 3, 4, 5, 6, 8, 10, 12],
+        'moves': [(constants.k_positions[a]['elevator'], constants.k_positions[b]['elevator'])
+                  for a, b in [('stow', 'l4'), ('l4', 'l2'), ('l2', 'stow')]],
+        'units': (1000, 'mm'),
+    },
+    'pivot': {
+        'make_sim': make_pivot_sim,
+        'position': lambda sim: sim.getAngle(),
+        'max_velocity': ShoulderConstants.k_max_velocity_rad_per_second,
+        'max_acceleration': ShoulderConstants.k_max_acceleration_rad_per_sec_squared,
+        'tolerance': ShoulderConstants.k_tolerance,
+        'gravity': lambda goal: ShoulderConstants.k_kG_volts * math.cos(goal),  # Pivot.send_maxmotion_goal: get_feedforward(goal, 0)
+        'gains': [0.85, 1.5, 2, 3, 4, 5, 6, 8],
+        'moves': [(constants.k_positions[a]['shoulder_pivot'], constants.k_positions[b]['shoulder_pivot'])
+                  for a, b in [('stow', 'l2'), ('l2', 'ground'), ('ground', 'stow')]],
+        'units': (180 / math.pi, 'deg'),
+    },
+}
+
+
+def run(mechanism, p, start, goal):
+    """ (times, positions) of one MAXMotion move at the spark rate """
+    sim = mechanism['make_sim'](start)
+    profile = wpimath.trajectory.TrapezoidProfile(wpimath.trajectory.TrapezoidProfile.Constraints(
+        mechanism['max_velocity'], mechanism['max_acceleration']))
+    state = wpimath.trajectory.TrapezoidProfile.State(start, 0)
+    goal_state = wpimath.trajectory.TrapezoidProfile.State(goal, 0)
+    arb_feedforward = mechanism['gravity'](goal)
+    allowed_error = mechanism['tolerance'] / 2  # allowedClosedLoopError in the slot 1 config
+    times, positions = [], []
+    for step in range(int(k_duration / k_spark_period)):
+        state = profile.calculate(k_spark_period, state, goal_state)
+        error = state.position - mechanism['position'](sim)
+        at_goal = state.position == goal and abs(error) < allowed_error
+        duty = 0.0 if at_goal else max(-1.0, min(1.0, p * error))
+        sim.setInput(0, max(-12.0, min(12.0, 12 * duty + arb_feedforward)))
+        sim.update(k_spark_period)
+        times.append((step + 1) * k_spark_period)
+        positions.append(mechanism['position'](sim))
+    return np.array(times), np.array(positions)
+
+
+def step_metrics(times, positions, start, goal, tolerance):
+    """ settle time (inside tolerance from then on) and overshoot past the goal """
+    outside = np.flatnonzero(np.abs(positions - goal) >= tolerance)
+    settle = times[outside[-1] + 1] if len(outside) and outside[-1] + 1 < len(times) else (0.0 if not len(outside) else np.inf)
+    overshoot = max(0.0, np.max((positions - goal) * np.sign(goal - start)))
+    return settle, overshoot
+
+
+def tune(name):
+    """ prints the sweep and returns the chosen gain """
+    mechanism = k_mechanisms[name]
+    scale, unit = mechanism['units']
+    print(f'{name}: worst settle (s) and overshoot ({unit}) over {len(mechanism["moves"])} moves')
+    settles = {}
+    for p in mechanism['gains']:
+        results = [step_metrics(*run(mechanism, p, start, goal), start, goal, mechanism['tolerance']) for start, goal in mechanism['moves']]
+        settle = max(result[0] for result in results)
+        overshoot = max(result[1] for result in results)
+        ok = overshoot < mechanism['tolerance'] and np.isfinite(settle)
+        print(f'  p {p:>5.2f}   settle {settle:>6.3f}   overshoot {scale * overshoot:>6.2f}{"" if ok else "   rejected"}')
+        if ok:
+            settles[p] = settle
+    if not settles:
+        print('  -> no gain settled without overshoot')
+        return None
+    fastest = min(settles.values())
+    chosen = min(p for p, settle in settles.items() if settle <= k_knee * fastest)
+    print(f'  -> slot 1 p = {chosen}  (settles in {settles[chosen]:.3f} s, the fastest gain in {fastest:.3f} s)')
+    return chosen
+
+
+def main():
+    for name in k_mechanisms:
+        tune(name)
+
+
+if __name__ == '__main__':
+    main()
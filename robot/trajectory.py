@@ -1,32 +1,123 @@
+import collections
+import hashlib
+import json
 import numpy as np
+
+import safe_region
 np.set_printoptions(formatter={'float': lambda x: "{0:0.2f}".format(x)})
 
 
+_mechanism_limits = None
+
+
+def mechanism_limits():
+    """ ({key: max velocity}, {key: max acceleration}) of the real mechanisms in trajectory units (pivot and wrist in degrees) """
+    global _mechanism_limits
+    if _mechanism_limits is None:
+        from constants import ElevatorConstants, ShoulderConstants, WristConstants  # here so numpy-only users can still import this module
+        _mechanism_limits = ({'elevator': ElevatorConstants.k_max_velocity_meter_per_second,
+                              'pivot': np.degrees(ShoulderConstants.k_max_velocity_rad_per_second),
+                              'wrist': np.degrees(WristConstants.k_max_velocity_rad_per_second)},
+                             {'elevator': ElevatorConstants.k_max_acceleration_meter_per_sec_squared,
+                              'pivot': np.degrees(ShoulderConstants.k_max_acceleration_rad_per_sec_squared),
+                              'wrist': np.degrees(WristConstants.k_max_acceleration_rad_per_sec_squared)})
+    return _mechanism_limits
+
+
+def _first_limit(key, *sources) -> float:
+    """ the first finite, nonzero limit for key in sources (dicts or None) - inf if there isn't one """
+    for source in sources:
+        value = source.get(key) if source else None
+        if value and np.isfinite(value):
+            return float(value)
+    return np.inf
+
+
 class CustomTrajectory:
     def __init__(self, waypoints, duration, interpolation_type="linear", velocity_constraints=None,
-                 acceleration_constraints=None, name='test'):
+                 acceleration_constraints=None, name='test', data=None, velocity=None, acceleration=None, time_step=0.01):
         self.name = name
         self.duration = duration
         self.interpolation_type = interpolation_type  # Store interpolation method
-        self.time_steps = np.linspace(0, duration, int(duration / 0.01) + 1)
+        self.time_step = time_step  # nominal - the actual grid spacing is self.dt so the last sample lands on duration
+        self.frozen = False  # shared trajectories from the cache or the library can't be changed - see freeze()
         self.keys = ['elevator', 'pivot', 'wrist', 'intake']
+        self.columns = {key: col for col, key in enumerate(self.keys)}  # column of each key in self.data
         self.servo_columns = {'intake'}  # Default servo column
         self.waypoints = dict(sorted(waypoints.items()))  # Store waypoints for later reuse
-        self.trajectory = {key: [] for key in self.keys}
+        self._allocate(data, velocity, acceleration)
         self.velocity_constraints = velocity_constraints if velocity_constraints else {key: 0 for key in self.keys}
         self.acceleration_constraints = acceleration_constraints if acceleration_constraints else {key: 0 for key in
                                                                                                    self.keys}
-        self.generate_trajectory()  # Generate the initial trajectory
+        if data is None:
+            self.generate_trajectory()  # Generate the initial trajectory
         # self.check_constraints()
 
-    def _smooth_trajectory_simple(self, data, window_size=9):
-        """Apply a moving average filter while keeping the array size unchanged."""
+    @classmethod
+    def from_arrays(cls, waypoints, duration, data, velocity=None, acceleration=None, **kwargs):
+        """ Wrap samples that were already generated (e.g. by trajectory_library at deploy time) without interpolating
+        data is samples x keys, on the same grid we would have built - it is used as is, so a read-only array stays read-only
+        velocity and acceleration are the same shape - if they are missing we difference the samples instead
+        """
+        return cls(waypoints, duration, data=data, velocity=velocity, acceleration=acceleration, **kwargs)
+
+    def freeze(self):
+        """ Make this trajectory read-only so it can be shared - the arrays refuse writes and the regenerating methods raise """
+        self.frozen = True
+        for array in [self.data, self.velocity, self.acceleration]:
+            array.flags.writeable = False
+        self.trajectory = {key: self.data[:, col] for col, key in enumerate(self.keys)}  # views of a read-only array are read-only too
+        return self
+
+    def _check_mutable(self):
+        if self.frozen:
+            raise RuntimeError(f'{self.name} is a shared trajectory - call copy() and change that instead')
+
+    def copy(self, name=None):
+        """ A private, writable copy (e.g. of a cached or library trajectory) """
+        return CustomTrajectory(self.waypoints, self.duration, self.interpolation_type, dict(self.velocity_constraints),
+                                dict(self.acceleration_constraints), name=name if name else self.name,
+                                data=self.data.copy(), velocity=self.velocity.copy(), acceleration=self.acceleration.copy(),
+                                time_step=self.time_step)
+
+    def _allocate(self, data=None, velocity=None, acceleration=None):
+        """ (re)build the time grid and the samples x keys arrays - self.trajectory holds column views into self.data
+        self.velocity and self.acceleration line up with self.data and come from the interpolant, not from differencing
+        """
+        self.time_steps = np.linspace(0, self.duration, int(self.duration / self.time_step) + 1)
+        self.dt = self.time_steps[1] - self.time_steps[0] if len(self.time_steps) > 1 else self.time_step
+        shape = (len(self.time_steps), len(self.keys))
+        for array in [data, velocity, acceleration]:
+            if array is not None and np.shape(array) != shape:
+                raise ValueError(f'{self.name}: array is {np.shape(array)}, expected {shape}')
+        self.servo_mask = np.array([key in self.servo_columns for key in self.keys])
+        self.data = np.zeros(shape) if data is None else data
+        self.velocity = np.zeros(shape) if velocity is None else velocity
+        self.acceleration = np.zeros(shape) if acceleration is None else acceleration
+        if data is not None and (velocity is None or acceleration is None):
+            self._differentiate_samples()
+        self.trajectory = {key: self.data[:, col] for col, key in enumerate(self.keys)}
+
+    def _differentiate_samples(self):
+        """ fallback when all we have is samples (repairs, old library files) - servos never have a velocity """
+        if len(self.time_steps) < 2:
+            self.velocity = np.zeros_like(self.data)
+            self.acceleration = np.zeros_like(self.data)
+            return
+        self.velocity = np.gradient(self.data, self.time_steps, axis=0)
+        self.acceleration = np.gradient(self.velocity, self.time_steps, axis=0)
+        self.velocity[:, self.servo_mask] = 0
+        self.acceleration[:, self.servo_mask] = 0
+
+    def _smooth_trajectory_simple(self, data, window_size=9, pad_mode='edge'):
+        """Apply a moving average filter while keeping the array size unchanged.
+        pad_mode='constant' pads with zeros - that is what a derivative of an edge-padded signal needs."""
         if window_size < 2:
             return data  # No smoothing if the window is too small
 
         # Pad edges symmetrically to prevent boundary distortion
         pad_size = window_size // 2
-        padded = np.pad(data, (pad_size, pad_size), mode='edge')
+        padded = np.pad(data, (pad_size, pad_size), mode=pad_mode)
 
         # Compute the moving average
         smoothed = np.convolve(padded, np.ones(window_size) / window_size, mode='same')
@@ -34,7 +125,7 @@ class CustomTrajectory:
         # Properly unpad symmetrically
         return smoothed[pad_size:-pad_size]
 
-    def _smooth_trajectory_gaussian(self, data, window_size=15, sigma=1.5):
+    def _smooth_trajectory_gaussian(self, data, window_size=15, sigma=1.5, pad_mode='edge'):
         """Apply Gaussian smoothing while keeping the array size unchanged."""
         if window_size < 2:
             return data  # No smoothing if the window is too small
@@ -46,7 +137,7 @@ class CustomTrajectory:
 
         # Pad the data symmetrically
         pad_size = window_size // 2
-        padded = np.pad(data, (pad_size, pad_size), mode='edge')
+        padded = np.pad(data, (pad_size, pad_size), mode=pad_mode)
 
         # Apply convolution
         smoothed = np.convolve(padded, kernel, mode='same')
@@ -54,62 +145,143 @@ class CustomTrajectory:
         # Properly unpad symmetrically
         return smoothed[pad_size:-pad_size]
 
-    def _cubic_hermite_interp(self, x, y, x_new):  # no scipy on the rio, but this is a crappy cubic
+    @staticmethod
+    def _pchip_slopes(x, y):
         """
-        Approximate PCHIP behavior using NumPy.
-        Computes derivatives using finite differences and performs interpolation.
+        Fritsch-Carlson slopes - shape preserving, so the curve never overshoots a waypoint.
+        Flat or direction-changing neighbors get a zero slope, otherwise a weighted harmonic mean of the secants.
         """
-        # Compute finite differences
+        h = np.diff(x)
+        delta = np.diff(y) / h
+        slopes = np.zeros_like(y)
+        if len(x) == 2:  # a single segment is just a line
+            slopes[:] = delta[0]
+            return slopes
+
+        # interior points - weighted harmonic mean, zero where the secants disagree in sign or either is flat
+        w1 = 2 * h[1:] + h[:-1]
+        w2 = h[1:] + 2 * h[:-1]
+        same_sign = delta[:-1] * delta[1:] > 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            harmonic = (w1 + w2) / (w1 / delta[:-1] + w2 / delta[1:])
+        slopes[1:-1] = np.where(same_sign, harmonic, 0.0)
+
+        # ends - one-sided three point estimate, clipped so it can't overshoot (same as scipy's pchip)
+        def end_slope(h0, h1, d0, d1):
+            slope = ((2 * h0 + h1) * d0 - h0 * d1) / (h0 + h1)
+            if np.sign(slope) != np.sign(d0):
+                return 0.0
+            if np.sign(d0) != np.sign(d1) and abs(slope) > 3 * abs(d0):
+                return 3 * d0
+            return slope
+
+        slopes[0] = end_slope(h[0], h[1], delta[0], delta[1])
+        slopes[-1] = end_slope(h[-1], h[-2], delta[-1], delta[-2])
+        return slopes
+
+    @staticmethod
+    def _central_difference_slopes(x, y):
+        """ the original slopes - smooth, but they overshoot around peaks """
         dydx = np.zeros_like(y)
         dydx[1:-1] = (y[2:] - y[:-2]) / (x[2:] - x[:-2])  # Central differences
         dydx[0] = (y[1] - y[0]) / (x[1] - x[0])  # Forward diff
         dydx[-1] = (y[-1] - y[-2]) / (x[-1] - x[-2])  # Backward diff
+        return dydx
+
+    def _cubic_hermite_interp(self, x, y, x_new, monotone=False, order=0):  # no scipy on the rio
+        """
+        Cubic Hermite interpolation in one vectorized pass - searchsorted finds every sample's segment at once.
+        monotone=True uses the Fritsch-Carlson (true PCHIP) slopes, otherwise central differences.
+        order=1 or 2 gives the exact first or second derivative of the same curve instead of its value.
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        x_new = np.asarray(x_new, dtype=float)
+        if len(x) < 2:
+            return np.full_like(x_new, y[0] if len(y) and order == 0 else 0.0)
 
-        # Interpolation step
-        x_new = np.asarray(x_new)
-        y_new = np.zeros_like(x_new)
+        dydx = self._pchip_slopes(x, y) if monotone else self._central_difference_slopes(x, y)
 
-        for i in range(len(x) - 1):
-            mask = (x_new >= x[i]) & (x_new < x[i+1])
-            h = x[i+1] - x[i]
-            t = (x_new[mask] - x[i]) / h
+        # segment index for every sample - clip so the samples at or past the ends use the end segments
+        idx = np.clip(np.searchsorted(x, x_new, side='right') - 1, 0, len(x) - 2)
+        h = x[idx + 1] - x[idx]
+        t = np.clip((x_new - x[idx]) / h, 0, 1)
 
-            # Hermite basis functions
-            h00 = (1 + 2 * t) * (1 - t) ** 2
-            h10 = t * (1 - t) ** 2
-            h01 = t ** 2 * (3 - 2 * t)
-            h11 = t ** 2 * (t - 1)
+        # Hermite basis functions (or their derivatives - d/dx is d/dt divided by h)
+        t2 = t * t
+        if order == 0:
+            t3 = t2 * t
+            h00, h10, h01, h11 = 2 * t3 - 3 * t2 + 1, t3 - 2 * t2 + t, -2 * t3 + 3 * t2, t3 - t2
+            scale = 1
+        elif order == 1:
+            h00, h10, h01, h11 = 6 * t2 - 6 * t, 3 * t2 - 4 * t + 1, -6 * t2 + 6 * t, 3 * t2 - 2 * t
+            scale = 1 / h
+        elif order == 2:
+            h00, h10, h01, h11 = 12 * t - 6, 6 * t - 4, -12 * t + 6, 6 * t - 2
+            scale = 1 / h ** 2
+        else:
+            raise ValueError(f'order must be 0, 1 or 2, not {order}')
 
-            y_new[mask] = (h00 * y[i] + h10 * h * dydx[i] +
-                           h01 * y[i+1] + h11 * h * dydx[i+1])
+        return scale * (h00 * y[idx] + h10 * h * dydx[idx] + h01 * y[idx + 1] + h11 * h * dydx[idx + 1])
 
-        return y_new
+    def _linear_derivatives(self, x, y, x_new):
+        """ exact slope of np.interp's line at each sample, and its acceleration as impulses at the interior waypoints
+        the impulses are spread over one sample (height change in slope / dt) so a smoothing filter turns them into ramps
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        velocity = np.zeros_like(x_new)
+        acceleration = np.zeros_like(x_new)
+        if len(x) < 2:
+            return velocity, acceleration
+        slopes = np.diff(y) / np.diff(x)
+        idx = np.clip(np.searchsorted(x, x_new, side='right') - 1, 0, len(x) - 2)
+        inside = (x_new >= x[0]) & (x_new < x[-1])  # flat before the first and after the last waypoint
+        velocity[inside] = slopes[idx[inside]]
+        # every change of slope (including starting and stopping) is an impulse at the nearest sample
+        changes = np.diff(np.concatenate(([0.0], slopes, [0.0])))
+        rows = np.clip(np.rint((x - x_new[0]) / self.dt).astype(int), 0, len(x_new) - 1)
+        np.add.at(acceleration, rows, changes / self.dt)
+        return velocity, acceleration
 
     def generate_trajectory(self):
+        self._check_mutable()
         times = np.array(list(self.waypoints.keys()))
         for key in self.keys:
             values = np.array([self.waypoints[t][key] for t in times]).astype(float)
 
+            # write straight into our column of self.data so the views in self.trajectory stay valid
+            col = self.columns[key]
+            column = self.data[:, col]
             if key in self.servo_columns:
                 # Servo behavior: stepwise constant values
-                step_values = np.zeros_like(self.time_steps)
-                for i, t in enumerate(self.time_steps):
-                    step_values[i] = values[np.searchsorted(times, t, side='right') - 1]
-                self.trajectory[key] = step_values.astype(float)
+                column[:] = values[np.clip(np.searchsorted(times, self.time_steps, side='right') - 1, 0, len(times) - 1)]
+                self.velocity[:, col] = 0
+                self.acceleration[:, col] = 0
             else:
-                # Normal interpolation using numpy
+                # Normal interpolation using numpy - derivatives come from the same interpolant, never from differencing
+                if self.interpolation_type in ["linear", "smoothed", "gaussian"]:
+                    linear = np.interp(self.time_steps, times, values)
+                    velocity, acceleration = self._linear_derivatives(times, values, self.time_steps)
                 if self.interpolation_type == "linear":
-                    self.trajectory[key] = np.interp(self.time_steps, times, values).astype(float)
+                    column[:] = linear
+                    self.velocity[:, col] = velocity
+                    self.acceleration[:, col] = 0  # the impulses at the waypoints are not something we can feed forward
                 elif self.interpolation_type == "smoothed":
-                    self.trajectory[key] = np.interp(self.time_steps, times, values).astype(float)
-                    # Apply smoothing filter
-                    self.trajectory[key] = self._smooth_trajectory_simple(self.trajectory[key])
+                    # Apply smoothing filter - the filter commutes with the derivative, so filter the exact slope too
+                    column[:] = self._smooth_trajectory_simple(linear)
+                    self.velocity[:, col] = self._smooth_trajectory_simple(velocity, pad_mode='constant')
+                    self.acceleration[:, col] = self._smooth_trajectory_simple(acceleration, pad_mode='constant')
                 elif self.interpolation_type == "gaussian":
-                    self.trajectory[key] = np.interp(self.time_steps, times, values).astype(float)
                     # Apply smoothing filter
-                    self.trajectory[key] = self._smooth_trajectory_gaussian(self.trajectory[key])
-                elif self.interpolation_type == "cubic":
-                    self.trajectory[key] = self._cubic_hermite_interp(times, values, self.time_steps)
+                    column[:] = self._smooth_trajectory_gaussian(linear)
+                    self.velocity[:, col] = self._smooth_trajectory_gaussian(velocity, pad_mode='constant')
+                    self.acceleration[:, col] = self._smooth_trajectory_gaussian(acceleration, pad_mode='constant')
+                elif self.interpolation_type in ["cubic", "pchip"]:  # pchip is the cubic that never overshoots the waypoints
+                    monotone = self.interpolation_type == "pchip"
+                    column[:] = self._cubic_hermite_interp(times, values, self.time_steps, monotone=monotone)
+                    self.velocity[:, col] = self._cubic_hermite_interp(times, values, self.time_steps, monotone=monotone, order=1)
+                    self.acceleration[:, col] = self._cubic_hermite_interp(times, values, self.time_steps, monotone=monotone, order=2)
                 else:
                     raise ValueError(f"Unsupported interpolation type: {self.interpolation_type}")
 
@@ -119,121 +291,528 @@ class CustomTrajectory:
          velocity_constraints = {'elevator':1, 'pivot':1, 'wrist':1, 'intake'0 }
          acceleration_constraints = {'elevator':1, 'pivot':1, 'wrist':1, 'intake'0 }
         """
+        self._check_mutable()
         if velocity_constraints:
             self.velocity_constraints = velocity_constraints
         if acceleration_constraints:
             self.acceleration_constraints = acceleration_constraints
-        self.check_constraints()
+        self.check_constraints(verbose=True)
 
-    def check_constraints(self):
-        """ Checks if velocity and acceleration constraints are violated and records violations """
-        self.waypoint_violations = {t: {key: None for key in self.keys} for t in self.waypoints}
-        self.speeds = {key: {'velocity': [], 'acceleration': []} for key in self.keys}
-        for key in self.keys:
-            if len(self.trajectory[key]) > 1:
-                vel = np.gradient(self.trajectory[key], self.time_steps)
-                acc = np.gradient(vel, self.time_steps)
-                vel[0] = 0  # Ensure initial condition matches waypoint
-                acc[0] = 0  # Ensure initial condition matches waypoint
-                self.speeds[key]['velocity'] = vel
-                self.speeds[key]['acceleration'] = acc
-                for i in range(1, len(self.time_steps)):
-                    for t in self.waypoints:
-                        if self.time_steps[i] >= t:
-                            if self.velocity_constraints[key] and abs(vel[i]) > self.velocity_constraints[key]:
-                                if self.waypoint_violations[t][key] is None:
-                                    self.waypoint_violations[t][key] = []
-                                self.waypoint_violations[t][key].append('vel')
-                            if self.acceleration_constraints[key] and abs(acc[i]) > self.acceleration_constraints[key]:
-                                if self.waypoint_violations[t][key] is None:
-                                    self.waypoint_violations[t][key] = []
-                                self.waypoint_violations[t][key].append('acc')
-                for t in self.waypoints:
-                    if self.waypoint_violations[t][key]:
-                        self.waypoint_violations[t][key] = set(self.waypoint_violations[t][key])
-
-        violations_exist = any(any(v is not None for v in self.waypoint_violations[t].values()) for t in self.waypoints)
-        if violations_exist:
-            print("Waypoint Violations:")
-            print("Time      | " + " | ".join(self.keys))
-            print("-" * (12 + 4 * len(self.keys)))
-            for t, violations in self.waypoint_violations.items():
-                row = [f"{t:8.2f}"] + [', '.join(violations[key]) if violations[key] else "None" for key in self.keys]
-                print(" | ".join(row))
-        else:
+    def check_constraints(self, verbose=False):
+        """ Checks if velocity and acceleration constraints are violated, attributed to the waypoint segment they happen in
+        Returns (and keeps as self.constraint_report) a dict of arrays, one row per segment and one column per key:
+          'segment_start': waypoint time each segment starts at - the last one runs to the end of the trajectory
+          'velocity_violation', 'acceleration_violation': bool flags
+          'peak_velocity', 'peak_acceleration': largest magnitudes seen in the segment
+        """
+        times = np.array(list(self.waypoints.keys()), dtype=float)
+        vel = np.gradient(self.data, self.time_steps, axis=0)
+        acc = np.gradient(vel, self.time_steps, axis=0)
+        vel[0] = 0  # Ensure initial condition matches waypoint
+        acc[0] = 0  # Ensure initial condition matches waypoint
+        self.speeds = {key: {'velocity': vel[:, col], 'acceleration': acc[:, col]} for col, key in enumerate(self.keys)}
+
+        # which segment each time step belongs to - steps before the first waypoint go with the first segment
+        segment = np.clip(np.searchsorted(times, self.time_steps, side='right') - 1, 0, len(times) - 1)
+        peak_velocity = np.zeros((len(times), len(self.keys)))
+        peak_acceleration = np.zeros((len(times), len(self.keys)))
+        np.maximum.at(peak_velocity, segment[1:], np.abs(vel[1:]))
+        np.maximum.at(peak_acceleration, segment[1:], np.abs(acc[1:]))
+
+        # a constraint of 0 (or None) means unconstrained
+        velocity_limits = np.array([self.velocity_constraints.get(key) or np.inf for key in self.keys], dtype=float)
+        acceleration_limits = np.array([self.acceleration_constraints.get(key) or np.inf for key in self.keys], dtype=float)
+
+        self.constraint_report = {
+            'segment_start': times,
+            'velocity_violation': peak_velocity > velocity_limits,
+            'acceleration_violation': peak_acceleration > acceleration_limits,
+            'peak_velocity': peak_velocity,
+            'peak_acceleration': peak_acceleration,
+        }
+        if verbose:
+            self.print_violations()
+        return self.constraint_report
+
+    def has_violations(self) -> bool:
+        report = self.constraint_report if hasattr(self, 'constraint_report') else self.check_constraints()
+        return bool(report['velocity_violation'].any() or report['acceleration_violation'].any())
+
+    def print_violations(self):
+        """ Prints the table of segments that break a constraint, with the peak value that broke it """
+        report = self.constraint_report if hasattr(self, 'constraint_report') else self.check_constraints()
+        if not self.has_violations():
             print("No Waypoint Violations:")
+            return
+
+        print("Waypoint Violations:")
+        print("Time      | " + " | ".join(f'{key:>22}' for key in self.keys))
+        print("-" * (12 + 25 * len(self.keys)))
+        for row, t in enumerate(report['segment_start']):
+            cells = []
+            for col in range(len(self.keys)):
+                flags = []
+                if report['velocity_violation'][row, col]:
+                    flags.append(f"vel {report['peak_velocity'][row, col]:.1f}")
+                if report['acceleration_violation'][row, col]:
+                    flags.append(f"acc {report['peak_acceleration'][row, col]:.1f}")
+                cells.append(f"{', '.join(flags) if flags else 'None':>22}")
+            print(f"{t:8.2f}  | " + " | ".join(cells))
 
     def set_interpolation_type(self, new_type):
         """ Change interpolation type and regenerate trajectory """
+        self._check_mutable()
         self.interpolation_type = new_type
         self.generate_trajectory()  # Recompute the trajectory with new method
 
+    def _sample_index(self, t):
+        """ (lower row, fraction of the way to the next row) for time t - the grid is uniform, so no search """
+        last = len(self.time_steps) - 1
+        u = min(max(t, 0.0), self.duration) / self.dt
+        idx = min(int(u), last - 1) if last > 0 else 0
+        return idx, (min(u - idx, 1.0) if last > 0 else 0.0)
+
+    def _interpolate_row(self, array, idx, frac, out) -> np.ndarray:
+        if frac <= 0:
+            out[:] = array[idx]
+            return out
+        upper = idx + 1
+        if frac >= 1:
+            out[:] = array[upper]
+            return out
+        np.subtract(array[upper], array[idx], out=out)
+        out *= frac
+        out += array[idx]
+        out[self.servo_mask] = array[upper, self.servo_mask]  # servos step, they don't blend
+        return out
+
+    def sample_into(self, t, out) -> np.ndarray:
+        """ Writes the setpoints at time t into out (length len(self.keys), ordered like self.keys)
+        The grid is uniform, so the index is arithmetic - no search and no new arrays
+        """
+        idx, frac = self._sample_index(t)
+        return self._interpolate_row(self.data, idx, frac, out)
+
+    def make_state_buffer(self) -> np.ndarray:
+        """ 3 x keys array for sample_state - each caller keeps its own, since a shared trajectory has many readers """
+        return np.zeros((3, len(self.keys)))
+
+    def sample_state(self, t, out=None):
+        """ (position, velocity, acceleration) at time t, indexed by self.columns
+        out is the caller's make_state_buffer() - the rows are overwritten and handed back, so a loop allocates nothing
+        without out every call gets new arrays
+        """
+        out = self.make_state_buffer() if out is None else out
+        idx, frac = self._sample_index(t)
+        return (self._interpolate_row(self.data, idx, frac, out[0]),
+                self._interpolate_row(self.velocity, idx, frac, out[1]),
+                self._interpolate_row(self.acceleration, idx, frac, out[2]))
+
+    def sample(self, t) -> np.ndarray:
+        """ Setpoints at time t in a new array indexed by self.columns - use sample_into with your own buffer in a loop """
+        return self.sample_into(t, np.zeros(len(self.keys)))
+
     def get_value(self, t):
         """ Returns a dictionary of setpoint values for any given time in the trajectory """
-        if t < 0: t = 0
-        if t > self.duration: t = self.duration
-        idx = np.searchsorted(self.time_steps, t)
-        if idx == 0:
-            return {key: float(self.trajectory[key][0]) for key in self.keys}
-        elif idx >= len(self.time_steps):
-            return {key: float(self.trajectory[key][-1]) for key in self.keys}
-        else:
-            t1, t2 = self.time_steps[idx - 1], self.time_steps[idx]
-            values = {}
-            for key in self.keys:
+        values = self.sample(t)
+        return {key: float(values[col]) for col, key in enumerate(self.keys)}
+
+    def _unsafe_mask(self, region=None) -> np.ndarray:
+        """ True at every sample where the elevator/pivot put the wrist in the no-spin zone (pivot here is in degrees) """
+        region = region if region is not None else safe_region.default_region()
+        return ~region.is_safe(self.trajectory['elevator'], np.radians(self.trajectory['pivot']))
+
+    def check_trajectory(self, region=None, tolerance=1e-6) -> np.ndarray:
+        """ Times where the wrist moves while the elevator and pivot are in the unsafe region - empty if we are clean """
+        wrist = self.trajectory['wrist']
+        moving = np.concatenate(([False], np.abs(np.diff(wrist)) > tolerance))
+        return self.time_steps[self._unsafe_mask(region) & moving]
+
+    def fix_trajectory(self, region=None, tolerance=1e-6) -> np.ndarray:
+        """ Holds the wrist wherever it would move inside the unsafe region and plays the rest of its motion late
+        Every hold pushes the remaining wrist motion back, so the trajectory gets longer by the total delay - the other
+        axes just hold their final values while the wrist finishes.  Waypoints are not changed, so regenerating undoes this.
+        Returns whatever collisions are left (e.g. the final pose itself is unsafe and the wrist still has to move there)
+        """
+        self._check_mutable()
+        original = self.data.copy()
+        original_velocity = self.velocity.copy()
+        original_acceleration = self.acceleration.copy()
+        wrist = original[:, self.columns['wrist']]
+        count = len(wrist)
+        unsafe = self._unsafe_mask(region)
+
+        # contiguous unsafe runs [start, stop) - we only loop over these, never over the samples
+        edges = np.diff(np.concatenate(([0], unsafe.astype(int), [0])))
+        starts, stops = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        source = np.arange(count)  # which original wrist sample each output sample plays
+        lag = 0
+        for start, stop in zip(starts, stops):
+            first = max(start - lag, 1)
+            window = np.arange(first, stop - lag)
+            moves = window[np.abs(wrist[window] - wrist[window - 1]) > tolerance]
+            if len(moves) == 0:
+                continue
+            freeze = moves[0] + lag  # output index where the wrist would first move
+            source[freeze:stop] = moves[0] - 1
+            source[stop:] -= stop - freeze
+            lag += stop - freeze
+
+        if lag == 0:
+            return self.check_trajectory(region, tolerance)
+
+        # play out the delayed wrist tail with everything else parked at the end
+        source = np.concatenate((source, np.arange(count - lag, count)))
+        rows = np.minimum(np.arange(count + lag), count - 1)
+        repaired_times = np.arange(count + lag) * self.dt
+        col = self.columns['wrist']
+        held = np.concatenate((source[1:] == source[:-1], [False]))  # the wrist is parked on these output samples
+        repaired = []
+        for array in [original, original_velocity, original_acceleration]:
+            values = array[rows]
+            values[count:] = original[-1] if array is original else 0  # parked means parked
+            values[:, col] = array[source, col]
+            if array is not original:
+                values[held, col] = 0
+            repaired.append(values)
+
+        self.duration = float(repaired_times[-1])
+        self._allocate()
+        index = np.clip(np.searchsorted(repaired_times, self.time_steps, side='right') - 1, 0, len(repaired_times) - 1)
+        for array, values in zip([self.data, self.velocity, self.acceleration], repaired):
+            for col, key in enumerate(self.keys):
                 if key in self.servo_columns:
-                    values[key] = float(self.trajectory[key][idx])
+                    array[:, col] = values[index, col]
                 else:
-                    v1, v2 = self.trajectory[key][idx - 1], self.trajectory[key][idx]
-                    values[key] = float(v1 + (v2 - v1) * (t - t1) / (t2 - t1))
-            return values
-
-    def check_trajectory(self, wrist_safe_pivot=(-70, 70), wrist_safe_elevator=1):
-        """ See if trajectory ever violates wrist safety constraints"""
-        collisions = []
-        for i, t in enumerate(self.time_steps):
-            pivot, elevator, wrist = self.trajectory['pivot'][i], self.trajectory['elevator'][i], \
-            self.trajectory['wrist'][i]
-            if wrist != 0 and not (
-                    pivot < wrist_safe_pivot[0] or pivot > wrist_safe_pivot[1] or elevator > wrist_safe_elevator):
-                collisions.append(t)
-        return collisions
-
-    def fix_trajectory(self, wrist_safe_pivot=(-70, 70), wrist_safe_elevator=1):
-        """ Adjusts the trajectory to ensure the wrist does not move until it is safe.
-            NOTE - does not work yet  """
-        fixed_trajectory = {key: self.trajectory[key].copy().astype(float) for key in self.keys}
-
-        for i, t in enumerate(self.time_steps):
-            pivot, elevator, wrist = fixed_trajectory['pivot'][i], fixed_trajectory['elevator'][i], \
-            fixed_trajectory['wrist'][i]
-            if wrist != 0 and not (
-                    pivot < wrist_safe_pivot[0] or pivot > wrist_safe_pivot[1] or elevator > wrist_safe_elevator):
-                fixed_trajectory['wrist'][i] = fixed_trajectory['wrist'][i - 1] if i > 0 else 0.0
-
-        self.trajectory = fixed_trajectory
+                    array[:, col] = np.interp(self.time_steps, repaired_times, values[:, col])
+        print(f'{self.name}: delayed the wrist by {lag * self.dt:.2f} s to stay out of the unsafe region')
+        return self.check_trajectory(region, tolerance)
 
     def rescale_trajectory(self, new_duration):
         """ Rescales the trajectory to fit a new duration while maintaining relative timing of waypoints. """
+        self._check_mutable()
         scale_factor = new_duration / self.duration
         new_waypoints = {t * scale_factor: v for t, v in self.waypoints.items()}
         self.duration = new_duration
-        self.time_steps = np.linspace(0, new_duration, int(new_duration / 0.01) + 1)
         self.waypoints = dict(sorted(new_waypoints.items()))
+        self._allocate()
         self.generate_trajectory()
 
-# make a test trajectory, call it L3
-waypoints = {
-    0: {'elevator': 0.21, 'pivot': 90, 'wrist': 0, 'intake': 2},  # start
-    0.25: {'elevator': 0.3, 'pivot': 90, 'wrist': 0, 'intake': 2},  # start
-    0.5: {'elevator': 0.5, 'pivot': 70, 'wrist': 0, 'intake': 2},  # get to safe wrist
-    1: {'elevator': 1.2, 'pivot': 50, 'wrist': 90, 'intake': 2},  # get to scoring wrist while raising elevator
-    1.5: {'elevator': 1.17, 'pivot': 40, 'wrist': 90, 'intake': -3},  # move pivot while scoring
-    2.5: {'elevator': 0.2, 'pivot': 70, 'wrist': 0, 'intake': 0},  # return home with wrist safe
-    3.0: {'elevator': 0.2, 'pivot': 90, 'wrist': 0, 'intake': 0},  # come down to bottom
-}
-velocity_constraints = {'elevator':1.5, 'pivot':1000, 'wrist':90, 'intake':0 }
-acceleration_constraints = {'elevator': 20, 'pivot':1000, 'wrist':180, 'intake':0 }
-# linear, pchip, cubic
-trajectory_L3 = CustomTrajectory(waypoints, duration=3, interpolation_type="smoothed",
-                              velocity_constraints=velocity_constraints, acceleration_constraints=acceleration_constraints)
+    @staticmethod
+    def _sweep(cap, ds, bound, forward=True) -> np.ndarray:
+        """ largest u = s_dot**2 under cap that changes by at most 2 * bound[i] * ds[i] over interval i, in one pass of numpy
+        Going forward, u[i] = min over j <= i of cap[j] + 2 * (sum of bound * ds from j to i) - with the running sum
+        c that is c[i] + cumulative min of (cap - c). Backward is the same thing from the far end.
+        """
+        steps = 2 * bound * ds
+        if forward:
+            c = np.concatenate(([0.0], np.cumsum(steps)))
+            return c + np.minimum.accumulate(cap - c)
+        c = np.concatenate((np.cumsum(steps[::-1])[::-1], [0.0]))
+        return c + np.minimum.accumulate((cap - c)[::-1])[::-1]
+
+    def _limited_pass(self, cap, ds, s_ddot_max, forward=True, max_sweeps=40) -> np.ndarray:
+        """ one retime pass - sweeps with each interval's s_ddot bound taken at the previous sweep's u, at both its ends
+        The bound shrinks as u grows, so plain repeated sweeps flip between too fast and too slow and never meet -
+        averaging each sweep with the one before settles on the u whose own bounds built it (about 20 sweeps).
+        The last min with one more sweep only matters if it didn't settle: that sweep's bounds came from u, which is above it.
+        """
+        def sweep(guess):
+            allowed = s_ddot_max(guess)
+            return self._sweep(cap, ds, np.minimum(allowed[:-1], allowed[1:]), forward)
+
+        u = sweep(cap)
+        for _ in range(max_sweeps):
+            swept = sweep(u)
+            settled = np.allclose(swept, u, rtol=1e-6, atol=1e-9)
+            u = 0.5 * (u + swept)
+            if settled:
+                break
+        return np.minimum(u, sweep(u))
+
+    def _path_interp(self, knots, values, s, order=0) -> np.ndarray:
+        """ the waypoint path in waypoint index s, the way self.interpolation_type draws it between the waypoints
+        cubic and pchip are the Hermite curves, the linear family (linear, smoothed, gaussian) is the polyline - its
+        smoothing is applied afterwards, in time, exactly like generate_trajectory does
+        """
+        if self.interpolation_type in ["cubic", "pchip"]:
+            return self._cubic_hermite_interp(knots, values, s, monotone=self.interpolation_type == "pchip", order=order)
+        if self.interpolation_type not in ["linear", "smoothed", "gaussian"]:
+            raise ValueError(f"Unsupported interpolation type: {self.interpolation_type}")
+        if order == 0:
+            return np.interp(s, knots, values)
+        if order == 2:
+            return np.zeros_like(s)  # straight lines - the corners are handled by stopping on them
+        slopes = np.diff(values)  # knots are one apart
+        return slopes[np.clip(np.searchsorted(knots, s, side='right') - 1, 0, len(slopes) - 1)]
+
+    def retime(self, velocity_constraints=None, acceleration_constraints=None, axes=('elevator', 'pivot', 'wrist'),
+               samples_per_segment=200, max_sweeps=40, verbose=True):
+        """ Fastest timing of the waypoint path that keeps every axis inside its velocity and acceleration limits
+        The path through the waypoints is drawn the way self.interpolation_type draws it, in waypoint index s, so it
+        still hits every waypoint. The linear family has to stop on every waypoint where the direction changes.
+        Each axis has q' = dq/ds and q'' = d2q/ds2, and its acceleration is q' * s_ddot + q'' * s_dot**2, so at a given
+        u = s_dot**2 the s_ddot each axis allows is whatever the curvature term leaves of its limit:
+          speed cap    u <= min over axes of  (v_max / |q'|)**2  and  a_max / |q''|
+          passes       forward and backward with |s_ddot| <= min over axes of (a_max - |q''| u) / |q'|  (u[i+1] = u[i] + 2 s_ddot ds)
+        With the s_ddot bounds fixed, a pass is a cumulative minimum (see _sweep). The bounds depend on u, so each pass
+        repeats that until u and its bounds agree (see _limited_pass) - about 10 ms for l3_test, where a python loop over
+        the samples took 17 ms.
+        Start and end at rest.
+        Replaces the samples and waypoint times in place and returns a report with the achievable duration.
+        """
+        self._check_mutable()
+        velocity_constraints = velocity_constraints if velocity_constraints else self.velocity_constraints
+        acceleration_constraints = acceleration_constraints if acceleration_constraints else self.acceleration_constraints
+        times = np.array(list(self.waypoints.keys()), dtype=float)
+        if len(times) < 2:
+            raise ValueError(f'{self.name}: need at least two waypoints to retime')
+
+        # the path, sampled densely in waypoint index
+        knots = np.arange(len(times), dtype=float)
+        s = np.linspace(0, len(times) - 1, (len(times) - 1) * samples_per_segment + 1)
+        path_values = [np.array([self.waypoints[t][key] for t in times], dtype=float) for key in axes]
+        path_d1, path_d2 = [np.column_stack([self._path_interp(knots, values, s, order=order) for values in path_values])
+                            for order in [1, 2]]
+
+        # 0 (or missing) means unconstrained, like everywhere else in this class
+        v_max = np.array([velocity_constraints.get(key) or np.inf for key in axes], dtype=float)
+        a_max = np.array([acceleration_constraints.get(key) or np.inf for key in axes], dtype=float)
+        if not (np.isfinite(v_max).any() or np.isfinite(a_max).any()):
+            raise ValueError(f'{self.name}: retiming needs at least one finite velocity or acceleration limit')
+
+        # the curvature term q'' * s_dot**2 takes its share of each axis's limit first, and s_ddot gets what is left over:
+        #   |s_ddot| <= min over axes of  (a_max - |q''| u) / |q'|    with u = s_dot**2
+        dq = np.abs(path_d1)
+        ddq = np.abs(path_d2)
+        corners = []
+        if self.interpolation_type not in ["cubic", "pchip"]:
+            # a sample on a waypoint belongs to both of its segments - take the worse slope, and stop where the line bends
+            on_knot = np.arange(samples_per_segment, len(s) - 1, samples_per_segment)
+            dq[on_knot] = np.maximum(dq[on_knot], dq[on_knot - 1])
+            bends = np.any(np.abs(path_d1[on_knot] - path_d1[on_knot - 1]) > 1e-12, axis=1)
+            corners = on_knot[bends]
+        big = 1e9  # stand-in for "no limit" so a stationary stretch doesn't make infinities
+        with np.errstate(divide='ignore', invalid='ignore'):
+            limit = np.minimum(np.min((v_max / dq) ** 2, axis=1), np.min(a_max / ddq, axis=1))
+        limit = np.nan_to_num(np.minimum(limit, big), nan=big, posinf=big)
+        limit[[0, -1]] = 0  # at rest on both ends
+        limit[corners] = 0
+
+        # only axes that move and have a finite acceleration limit bound s_ddot
+        bounded = (dq > 0) & np.isfinite(a_max)
+
+        def s_ddot_max(u):
+            """ largest |s_ddot| every axis allows at each sample, for u = s_dot**2 there """
+            with np.errstate(divide='ignore', invalid='ignore'):
+                allowed = np.where(bounded, np.maximum(a_max - ddq * u[:, None], 0) / dq, big)
+            return np.minimum(allowed.min(axis=1), big)
+
+        # forward pass speeds up as hard as that allows, backward pass slows down the same way - the interval's s_ddot
+        # has to fit at both of its ends
+        ds = np.diff(s)
+        u = self._limited_pass(limit, ds, s_ddot_max, forward=True, max_sweeps=max_sweeps)
+        u = self._limited_pass(u, ds, s_ddot_max, forward=False, max_sweeps=max_sweeps)
+        s_dot = np.sqrt(u)
+
+        # constant acceleration over each interval, so dt = 2 ds / (v0 + v1)
+        dt = 2 * ds / np.maximum(s_dot[:-1] + s_dot[1:], 1e-12)
+        t_path = np.concatenate(([0.0], np.cumsum(dt)))
+        original_duration = self.duration
+        new_times = t_path[::samples_per_segment]
+
+        # new waypoint times, then resample the path on our uniform grid
+        self.waypoints = {float(new_t): self.waypoints[old_t] for new_t, old_t in zip(new_times, times)}
+        self.duration = float(t_path[-1])
+        self._allocate()
+        # s moves with constant s_ddot inside each interval, so integrate that rather than interpolating s(t) linearly
+        s_ddot = np.diff(u) / (2 * ds)
+        interval = np.clip(np.searchsorted(t_path, self.time_steps, side='right') - 1, 0, len(ds) - 1)
+        tau = self.time_steps - t_path[interval]
+        s_of_t = np.minimum(s[interval] + s_dot[interval] * tau + 0.5 * s_ddot[interval] * tau ** 2, s[interval + 1])
+        s_dot_of_t = np.maximum(s_dot[interval] + s_ddot[interval] * tau, 0)
+        # chain rule for the derivatives: q_dot = q' s_dot, q_ddot = q'' s_dot**2 + q' s_ddot
+        # the linear family gets the same smoothing filter generate_trajectory gives it
+        smooth = {'smoothed': self._smooth_trajectory_simple, 'gaussian': self._smooth_trajectory_gaussian}.get(self.interpolation_type)
+        for col, key in enumerate(axes):
+            target = self.columns[key]
+            q, d1, d2 = [self._path_interp(knots, path_values[col], s_of_t, order=order) for order in [0, 1, 2]]
+            velocity = d1 * s_dot_of_t
+            acceleration = d2 * s_dot_of_t ** 2 + d1 * s_ddot[interval]
+            if smooth:
+                q, velocity, acceleration = smooth(q), smooth(velocity, pad_mode='constant'), smooth(acceleration, pad_mode='constant')
+            self.data[:, target] = q
+            self.velocity[:, target] = velocity
+            self.acceleration[:, target] = acceleration
+        # everything we didn't retime (servos, axes left out) keeps its waypoint values on the new times
+        for key in self.keys:
+            if key not in axes:
+                values = np.array([self.waypoints[t][key] for t in self.waypoints], dtype=float)
+                index = np.clip(np.searchsorted(new_times, self.time_steps, side='right') - 1, 0, len(new_times) - 1)
+                if key in self.servo_columns:
+                    self.trajectory[key][:] = values[index]
+                else:
+                    self.trajectory[key][:] = np.interp(self.time_steps, new_times, values)
+                    self.velocity[:, self.columns[key]] = self._linear_derivatives(new_times, values, self.time_steps)[0]
+
+        report = {'duration': self.duration, 'original_duration': original_duration, 'waypoint_times': new_times}
+        if verbose:
+            print(f'{self.name}: retimed from {original_duration:.2f} s to {self.duration:.2f} s  '
+                  f'waypoints at {np.array2string(new_times)}')
+        return report
+
+
+    def blend_from_state(self, state, velocity_limits=None, acceleration_limits=None, name=None):
+        """ A copy of this trajectory whose start is replaced by a minimum-time cubic from the measured state
+        state is {key: (position, velocity)} in trajectory units (pivot and wrist in degrees) - keys left out follow the original
+        Every join time on our grid is tried at once: the cubic Hermite from (p0, v0) to (q(T), q'(T)) has linear acceleration,
+        so its peaks are at the ends, and its velocity peaks where the acceleration crosses zero - all closed form.
+        The earliest T where every axis stays inside its limits wins.  Limits come from the arguments, then the trajectory's
+        own constraints, then the mechanism limits in constants (0 or missing falls through to the next one).
+        """
+        mechanism_velocity, mechanism_acceleration = mechanism_limits()
+        axes = [key for key in self.keys if key in state and key not in self.servo_columns]
+        cols = [self.columns[key] for key in axes]
+        p0 = np.array([state[key][0] for key in axes], dtype=float)
+        v0 = np.array([state[key][1] for key in axes], dtype=float)
+        v_max = np.array([_first_limit(key, velocity_limits, self.velocity_constraints, mechanism_velocity) for key in axes])
+        a_max = np.array([_first_limit(key, acceleration_limits, self.acceleration_constraints, mechanism_acceleration) for key in axes])
+        if not np.all(np.isfinite(a_max)):  # with no acceleration limit the "transition" is one 10 ms jump
+            raise ValueError(f'{self.name}: no acceleration limit for {[key for key, a in zip(axes, a_max) if not np.isfinite(a)]} - '
+                             f'can not blend from the measured state')
+
+        # every candidate join, one row each
+        rows = np.arange(1, len(self.time_steps))
+        T = self.time_steps[rows][:, None]
+        p1 = self.data[rows][:, cols]
+        v1 = self.velocity[rows][:, cols]
+        a_start = (6 * (p1 - p0) - T * (4 * v0 + 2 * v1)) / T ** 2
+        a_end = (-6 * (p1 - p0) + T * (2 * v0 + 4 * v1)) / T ** 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            crossing = a_start / (a_start - a_end)  # fraction of T where the acceleration is zero
+        crossing = np.where((crossing > 0) & (crossing < 1), crossing, 0)
+        v_peak = np.abs(v0 + 0.5 * a_start * T * crossing)
+        v_allowed = np.maximum(v_max, np.maximum(np.abs(v0), np.abs(v1)))  # we can't do better than where we start or join
+        feasible = np.all((np.abs(a_start) <= a_max) & (np.abs(a_end) <= a_max) & (v_peak <= v_allowed), axis=1)
+        join = rows[np.argmax(feasible)] if feasible.any() else rows[-1]
+        if not feasible.any():
+            print(f'{self.name}: no join from the measured state stays inside the limits - blending over the whole trajectory')
+
+        # build the transition on our own grid and splice it in
+        T = self.time_steps[join]
+        tau = self.time_steps[:join + 1, None] / T
+        p1, v1 = self.data[join, cols], self.velocity[join, cols]
+        h00, h10, h01, h11 = 2 * tau ** 3 - 3 * tau ** 2 + 1, tau ** 3 - 2 * tau ** 2 + tau, -2 * tau ** 3 + 3 * tau ** 2, tau ** 3 - tau ** 2
+        d00, d10, d01, d11 = 6 * tau ** 2 - 6 * tau, 3 * tau ** 2 - 4 * tau + 1, -6 * tau ** 2 + 6 * tau, 3 * tau ** 2 - 2 * tau
+        e00, e10, e01, e11 = 12 * tau - 6, 6 * tau - 4, -12 * tau + 6, 6 * tau - 2
+        data, velocity, acceleration = self.data.copy(), self.velocity.copy(), self.acceleration.copy()
+        data[:join + 1, cols] = h00 * p0 + h10 * T * v0 + h01 * p1 + h11 * T * v1
+        velocity[:join + 1, cols] = (d00 * p0 + d10 * T * v0 + d01 * p1 + d11 * T * v1) / T
+        acceleration[:join + 1, cols] = (e00 * p0 + e10 * T * v0 + e01 * p1 + e11 * T * v1) / T ** 2
+
+        start = dict(self.waypoints[next(iter(self.waypoints))])
+        start.update({key: float(p0[idx]) for idx, key in enumerate(axes)})
+        waypoints = {0: start}
+        waypoints.update({t: pose for t, pose in self.waypoints.items() if t >= T})
+        return CustomTrajectory.from_arrays(waypoints, self.duration, data, velocity=velocity, acceleration=acceleration,
+                                            interpolation_type=self.interpolation_type, velocity_constraints=self.velocity_constraints,
+                                            acceleration_constraints=self.acceleration_constraints,
+                                            name=name if name else f'{self.name}_from_state', time_step=self.time_step)
+
+    def blend_into(self, other, overlap, name=None):
+        """ This trajectory followed by other, with the last overlap seconds of ours running at the same time as the first of theirs
+        Superposition: in the overlap the motions add (ours + theirs - their start), so if their start is our end nothing jumps
+        and we never have to stop in between.  Check the result's constraints if the overlap is long - the velocities add too.
+        """
+        overlap = min(max(overlap, 0.0), self.duration, other.duration)
+        offset = self.duration - overlap  # when the other trajectory starts
+        duration = offset + other.duration
+        time_steps = np.linspace(0, duration, int(duration / self.time_step) + 1)
+
+        ours_t = np.minimum(time_steps, self.duration)
+        theirs_t = np.maximum(time_steps - offset, 0)
+        ours_moving = (time_steps <= self.duration)[:, None]  # after our end we contribute position only
+        theirs_moving = (time_steps >= offset)[:, None]
+
+        def resample(trajectory, times, array):
+            return np.column_stack([np.interp(times, trajectory.time_steps, array[:, col]) for col in range(len(self.keys))])
+
+        data = resample(self, ours_t, self.data) + resample(other, theirs_t, other.data) - other.data[0]
+        velocity = resample(self, ours_t, self.velocity) * ours_moving + resample(other, theirs_t, other.velocity) * theirs_moving
+        acceleration = resample(self, ours_t, self.acceleration) * ours_moving + resample(other, theirs_t, other.acceleration) * theirs_moving
+
+        # servos don't add - ours until the other one starts, then theirs
+        for col in np.flatnonzero(self.servo_mask):
+            ours_index = np.clip(np.searchsorted(self.time_steps, ours_t, side='right') - 1, 0, len(self.time_steps) - 1)
+            theirs_index = np.clip(np.searchsorted(other.time_steps, theirs_t, side='right') - 1, 0, len(other.time_steps) - 1)
+            data[:, col] = np.where(time_steps < offset, self.data[ours_index, col], other.data[theirs_index, col])
+            velocity[:, col] = 0
+            acceleration[:, col] = 0
+
+        waypoints = {t: pose for t, pose in self.waypoints.items() if t <= offset}
+        waypoints.update({t + offset: pose for t, pose in other.waypoints.items()})
+        return CustomTrajectory.from_arrays(waypoints, duration, data, velocity=velocity, acceleration=acceleration,
+                                            interpolation_type=self.interpolation_type, velocity_constraints=self.velocity_constraints,
+                                            acceleration_constraints=self.acceleration_constraints,
+                                            name=name if name else f'{self.name}_into_{other.name}', time_step=self.time_step)
+
+class TrajectoryCache:
+    """ Bounded LRU cache of generated trajectories, keyed by a hash of everything that shapes the samples
+    Asking twice for the same name, waypoints, duration, interpolation type and time step hands back the same frozen object
+    """
+
+    def __init__(self, max_size=32) -> None:
+        self.max_size = max_size
+        self.trajectories = collections.OrderedDict()  # key -> CustomTrajectory, least recently used first
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(waypoints, duration, interpolation_type='linear', time_step=0.01, velocity_constraints=None,
+                 acceleration_constraints=None, name='test') -> str:
+        """ canonical hash - waypoint times and values go through float so 1 and 1.0 are the same trajectory
+        the name is part of it because it is in every error message and log line the trajectory prints
+        """
+        canonical = {
+            'name': name,
+            'waypoints': [[float(t), {key: float(value) for key, value in sorted(pose.items())}]
+                          for t, pose in sorted(waypoints.items())],
+            'duration': float(duration),
+            'interpolation_type': interpolation_type,
+            'time_step': float(time_step),
+            'velocity_constraints': {key: float(value) for key, value in sorted((velocity_constraints or {}).items())},
+            'acceleration_constraints': {key: float(value) for key, value in sorted((acceleration_constraints or {}).items())},
+        }
+        return hashlib.sha1(json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+
+    def get(self, waypoints, duration, interpolation_type='linear', time_step=0.01, velocity_constraints=None,
+            acceleration_constraints=None, name='test') -> CustomTrajectory:
+        key = self.make_key(waypoints, duration, interpolation_type, time_step, velocity_constraints, acceleration_constraints, name)
+        if key in self.trajectories:
+            self.hits += 1
+            self.trajectories.move_to_end(key)
+            return self.trajectories[key]
+
+        self.misses += 1
+        trajectory = CustomTrajectory(waypoints, duration, interpolation_type, velocity_constraints,
+                                      acceleration_constraints, name=name, time_step=time_step).freeze()
+        self.trajectories[key] = trajectory
+        if len(self.trajectories) > self.max_size:
+            self.trajectories.popitem(last=False)
+        return trajectory
+
+    def clear(self) -> None:
+        self.trajectories.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def get_stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.trajectories), 'max_size': self.max_size}
+
+
+trajectory_cache = TrajectoryCache()
+
+
+def get_trajectory(waypoints, duration, interpolation_type='linear', time_step=0.01, **kwargs) -> CustomTrajectory:
+    """ shared, read-only trajectory from the module cache - use .copy() if you need to change it """
+    return trajectory_cache.get(waypoints, duration, interpolation_type, time_step, **kwargs)
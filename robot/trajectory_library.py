@@ -0,0 +1,208 @@
+"""
+Named mechanism trajectories, generated once at deploy time instead of on every boot
+Build the file on the laptop before deploying:  python tools/build_trajectories.py  (writes deploy/trajectories.bin)
+On the robot load_trajectory(name) memory-maps that file and wraps the samples for that one name the first time it is asked for
+If the file is missing or was built from different specs we print a warning and generate from the specs instead
+"""
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+import numpy as np
+
+import constants
+import trajectory
+from trajectory import CustomTrajectory, get_trajectory
+
+k_format_version = 2  # 2: velocity and acceleration are stored with the positions
+k_magic = b'TRAJ'
+k_header_format = '<4sII'  # magic, format version, length of the json header that follows
+k_library_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'deploy', 'trajectories.bin')
+
+# every named trajectory - pivot and wrist are in degrees here, FollowTrajectory converts them
+# k_positions is in radians, so everything taken from it goes through math.degrees
+trajectory_specs = {
+    'l3': {
+        'waypoints': {
+            0: {'elevator': 0.21, 'pivot': 90, 'wrist': 0, 'intake': 0},  # start
+            1: {'elevator': 1.1, 'pivot': 90, 'wrist': 0, 'intake': 0},  # get to scoring wrist
+            2: {'elevator': 0.8, 'pivot': 50, 'wrist': 90, 'intake': 3},  # return home with wrist safe
+        },
+        'duration': 2,
+    },
+    # the old import-time test trajectory from trajectory.py - FollowTrajectory's default
+    'l3_test': {
+        'waypoints': {
+            0: {'elevator': 0.21, 'pivot': 90, 'wrist': 0, 'intake': 2},  # start
+            0.25: {'elevator': 0.3, 'pivot': 90, 'wrist': 0, 'intake': 2},  # start
+            0.5: {'elevator': 0.5, 'pivot': 70, 'wrist': 0, 'intake': 2},  # get to safe wrist
+            1: {'elevator': 1.2, 'pivot': 50, 'wrist': 90, 'intake': 2},  # get to scoring wrist while raising elevator
+            1.5: {'elevator': 1.17, 'pivot': 40, 'wrist': 90, 'intake': -3},  # move pivot while scoring
+            2.5: {'elevator': 0.2, 'pivot': 70, 'wrist': 0, 'intake': 0},  # return home with wrist safe
+            3.0: {'elevator': 0.2, 'pivot': 90, 'wrist': 0, 'intake': 0},  # come down to bottom
+        },
+        'duration': 3,
+        'interpolation_type': 'smoothed',
+        'velocity_constraints': {'elevator': 1.5, 'pivot': 1000, 'wrist': 90, 'intake': 0},
+        'acceleration_constraints': {'elevator': 20, 'pivot': 1000, 'wrist': 180, 'intake': 0},
+    },
+    # WAYPOINTS FOR 67 SCORING STYLE FOR L2, L3, and L4 - TODO: TUNE
+    'l2_score_67': {
+        'waypoints': {
+            0: {'elevator': constants.k_positions["l2"]["elevator"] + 0.035, 'pivot': math.degrees(constants.k_positions["l2"]["shoulder_pivot"]), 'wrist': math.degrees(constants.k_positions["l2"]["wrist_pivot"]), 'intake': 0},
+            0.8: {'elevator': constants.k_positions["l2"]["elevator"] + 0.035, 'pivot': math.degrees(constants.k_positions["l2"]["shoulder_pivot"]) + 14.5, 'wrist': math.degrees(constants.k_positions["l2"]["wrist_pivot"]), 'intake': 0},
+            # 1.4 : {'elevator': constants.k_positions["l2"]["elevator"] + 0.1, 'pivot': math.degrees(constants.k_positions["l2"]["shoulder_pivot"]) + 10, 'wrist': math.degrees(constants.k_positions["l2"]["wrist_pivot"]), 'intake': 3}, #FOR DRIVERS; PULL BACK WHEN CORAL IS CLIPPED AFTER ~0.8 SECONDS SO THAT WHEN INTAKE IS ACTIVATED ROBOT CAN BE PULLED BACK AND PIECE RELEASED
+        },
+        'duration': 0.8,
+    },
+    'l3_score_67': {
+        'waypoints': {
+            0: {'elevator': constants.k_positions["l3"]["elevator"] + 0.035, 'pivot': math.degrees(constants.k_positions["l3"]["shoulder_pivot"]), 'wrist': math.degrees(constants.k_positions["l3"]["wrist_pivot"]), 'intake': 0},
+            0.8: {'elevator': constants.k_positions["l3"]["elevator"] + 0.035, 'pivot': math.degrees(constants.k_positions["l2"]["shoulder_pivot"]) + 14.5, 'wrist': math.degrees(constants.k_positions["l3"]["wrist_pivot"]), 'intake': 0},
+        },
+        'duration': 0.8,
+    },
+    'l4_score_67': {
+        'waypoints': {
+            0: {'elevator': constants.k_positions["l4"]["elevator"] + 0.035, 'pivot': math.degrees(constants.k_positions["l4"]["shoulder_pivot"]), 'wrist': math.degrees(constants.k_positions["l4"]["wrist_pivot"]), 'intake': 0},
+            1.2: {'elevator': constants.k_positions["l4"]["elevator"] + 0.035, 'pivot': math.degrees(constants.k_positions["l2"]["shoulder_pivot"]) + 7.5, 'wrist': math.degrees(constants.k_positions["l4"]["wrist_pivot"]), 'intake': 0},
+            # NOTE: DRIVERS HAVE ~1 SECOND TO MOVE ROBOT BACK WHILE PIVOT IS MOVING - THIS IS REQUIRED DUE TO GEOMETRY OF OUTTAKE + REEF!
+        },
+        'duration': 1.2,
+    },
+}
+
+
+def _spec_kwargs(name, spec) -> dict:
+    """ CustomTrajectory keyword arguments for a spec, everything except waypoints and duration """
+    kwargs = {'interpolation_type': spec.get('interpolation_type', 'linear'), 'name': name}
+    for key in ['velocity_constraints', 'acceleration_constraints']:
+        if key in spec:
+            kwargs[key] = spec[key]
+    return kwargs
+
+
+def generator_hash() -> str:
+    """ sha256 of trajectory.py - the code that turns specs into samples, so changing it makes the file stale too """
+    with open(trajectory.__file__, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def specs_hash(specs=None) -> str:
+    """ sha256 of the specs, the format version and the generator code - any change to a waypoint means the file on the robot is stale """
+    specs = trajectory_specs if specs is None else specs
+    text = json.dumps({'version': k_format_version, 'generator': generator_hash(), 'specs': specs}, sort_keys=True, default=float)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def generate_trajectory(name, specs=None) -> CustomTrajectory:
+    """ the slow way - interpolate from the waypoints, through the trajectory cache so a spec is only ever built once
+    the result is frozen and shared - copy() it to change it
+    """
+    spec = (trajectory_specs if specs is None else specs)[name]
+    return get_trajectory(spec['waypoints'], spec['duration'], **_spec_kwargs(name, spec))
+
+
+def write_library(path=k_library_path, specs=None) -> dict:
+    """ Generate every spec and write them all to one file: fixed header, json index, then float64 blocks
+    each block is position, velocity and acceleration stacked - 3 x samples x keys
+    """
+    specs = trajectory_specs if specs is None else specs
+    entries = {}
+    blocks = []
+    offset = 0
+    for name in specs:
+        trajectory = generate_trajectory(name, specs)
+        block = np.ascontiguousarray(np.stack([trajectory.data, trajectory.velocity, trajectory.acceleration]), dtype='<f8')
+        entries[name] = {'offset': offset, 'rows': block.shape[1], 'cols': block.shape[2], 'keys': trajectory.keys}
+        blocks.append(block)
+        offset += block.nbytes
+
+    index = json.dumps({'hash': specs_hash(specs), 'entries': entries}).encode()
+    index += b' ' * (-(struct.calcsize(k_header_format) + len(index)) % 8)  # keep the samples 8-byte aligned
+    with open(path, 'wb') as f:
+        f.write(struct.pack(k_header_format, k_magic, k_format_version, len(index)))
+        f.write(index)
+        for block in blocks:
+            f.write(block.tobytes())
+    return entries
+
+
+class TrajectoryLibrary:
+    """ Memory-mapped view of deploy/trajectories.bin - trajectories are only wrapped when someone asks for them by name """
+
+    def __init__(self, path=k_library_path, specs=None) -> None:
+        self.path = path
+        self.specs = trajectory_specs if specs is None else specs
+        self.entries = {}
+        self.trajectories = {}  # name -> CustomTrajectory, filled lazily
+        self.buffer = None
+        self.data_start = 0
+        self.fallbacks = 0  # how many we had to generate because the file was missing or stale
+
+        try:
+            with open(path, 'rb') as f:
+                self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            print(f'TrajectoryLibrary: could not map {path} ({e}) - generating trajectories at runtime')
+            return
+
+        header_size = struct.calcsize(k_header_format)
+        try:
+            magic, version, index_length = struct.unpack_from(k_header_format, self.buffer, 0)
+            if magic != k_magic or version != k_format_version:
+                print(f'TrajectoryLibrary: {path} is not a version {k_format_version} library - generating trajectories at runtime')
+                return
+            index = json.loads(self.buffer[header_size:header_size + index_length])
+            if index['hash'] != specs_hash(self.specs):
+                print(f'TrajectoryLibrary: {path} was built from different specs - rerun tools/build_trajectories.py')
+                return
+            entries = index['entries']
+            data_start = header_size + index_length
+            # a short file would only fail when someone asks for that name, so check every block fits now
+            for name, entry in entries.items():
+                if data_start + entry['offset'] + 3 * entry['rows'] * entry['cols'] * 8 > len(self.buffer):
+                    raise ValueError(f'{name} runs past the end of the file')
+        except (struct.error, ValueError, KeyError, TypeError) as e:  # json errors are ValueErrors
+            print(f'TrajectoryLibrary: {path} is truncated or corrupt ({e}) - generating trajectories at runtime')
+            return
+        self.entries = entries
+        self.data_start = data_start
+
+    def names(self) -> list:
+        return list(self.specs.keys())
+
+    def get(self, name) -> CustomTrajectory:
+        if name in self.trajectories:
+            return self.trajectories[name]
+
+        spec = self.specs[name]
+        entry = self.entries.get(name)
+        if entry is None:
+            self.fallbacks += 1
+            trajectory = generate_trajectory(name, self.specs)
+        else:
+            # read-only view straight into the mapped file - nothing is copied or interpolated
+            block = np.frombuffer(self.buffer, dtype='<f8', count=3 * entry['rows'] * entry['cols'],
+                                  offset=self.data_start + entry['offset']).reshape(3, entry['rows'], entry['cols'])
+            trajectory = CustomTrajectory.from_arrays(spec['waypoints'], spec['duration'], block[0], velocity=block[1],
+                                                      acceleration=block[2], **_spec_kwargs(name, spec))
+        self.trajectories[name] = trajectory.freeze()  # everyone who asks for this name shares it
+        return trajectory
+
+
+_library = None
+
+
+def get_library() -> TrajectoryLibrary:
+    global _library
+    if _library is None:
+        _library = TrajectoryLibrary()
+    return _library
+
+
+def load_trajectory(name) -> CustomTrajectory:
+    """ a named trajectory from the deploy-time library, generated on the spot if the library can't supply it """
+    return get_library().get(name)
@@ -0,0 +1,166 @@
+"""
+Relay-feedback and step-response autotuning for one spark - used by robot.py's 'Autotune?' mode
+The experiment runs on the rio at 50 Hz in duty cycle (the gravity arbFF from the dashboard still goes on top):
+  rest  - hold still with just the arbFF, so the step starts from rest
+  step  - open loop duty step: velocity response -> first order plus dead time (FOPDT) fit, K (units/s per duty), tau, theta
+  relay - bang-bang around the middle of travel: ultimate gain Ku and period Tu, and from them the effective dead time
+Gains come back in spark units: P in duty per unit of error, I and D per 1 ms spark loop, FF in duty per unit/s
+The relay closes its loop on the rio, so its dead time includes our 20 ms - gains from it are on the safe side
+"""
+import math
+import numpy as np
+
+k_spark_period = 0.001  # the spark's closed loop runs at 1 kHz - I and D are per loop, not per second
+k_rio_period = 0.02
+
+k_rest_time = 0.5  # s
+k_step_duty = 0.3
+k_step_time = 1.0  # s - the step stops early if it runs out of travel
+k_step_travel = 0.4  # units (m on the elevator)
+k_relay_duty = 0.15
+k_relay_hysteresis = 0.005  # units - keeps encoder noise from chattering the relay
+k_relay_skip_cycles = 2  # the first cycles are still getting to the setpoint
+k_relay_cycles = 4
+k_relay_timeout = 10.0  # s
+k_limit_margin = 0.02  # units - stop if we get this close to the end of travel
+
+
+def fit_fopdt(times, values, step):
+    """ least squares first order plus dead time fit to a step response starting at times[0] from rest
+    Returns (K per unit of step, tau, theta, rms residual)
+    """
+    times = np.asarray(times, dtype=float) - times[0]
+    values = np.asarray(values, dtype=float)
+    thetas = np.arange(0, min(0.3, 0.5 * times[-1]), 0.005)
+    taus = np.geomspace(0.005, 2.0, 150)
+    # every (theta, tau) shape at once - the gain for each is a closed form projection
+    shifted = np.clip(times[None, None, :] - thetas[:, None, None], 0, None)
+    shapes = 1 - np.exp(-shifted / taus[None, :, None])
+    gains = (shapes @ values) / np.maximum(np.sum(shapes ** 2, axis=-1), 1e-12)
+    errors = np.sum((gains[..., None] * shapes - values) ** 2, axis=-1)
+    i, j = np.unravel_index(np.argmin(errors), errors.shape)
+    return float(gains[i, j] / step), float(taus[j]), float(thetas[i]), math.sqrt(errors[i, j] / len(values))
+
+
+def relay_ultimate(times, positions, outputs, relay_duty, hysteresis, skip_cycles=k_relay_skip_cycles):
+    """ ultimate gain and period from a relay experiment (Astrom-Hagglund, with the hysteresis correction)
+    Returns (Ku in duty per unit, Tu in s, amplitude in units) or None if there weren't enough cycles
+    """
+    times, positions, outputs = (np.asarray(x, dtype=float) for x in (times, positions, outputs))
+    rising = np.flatnonzero((outputs[1:] > 0) & (outputs[:-1] <= 0)) + 1  # relay switched to pushing up
+    if len(rising) < skip_cycles + 2:
+        return None
+    start, end = rising[skip_cycles], rising[-1]
+    period = (times[end] - times[start]) / (len(rising) - 1 - skip_cycles)
+    amplitude = (positions[start:end].max() - positions[start:end].min()) / 2
+    amplitude = max(amplitude, 1.01 * hysteresis)
+    ku = 4 * relay_duty / (math.pi * math.sqrt(amplitude ** 2 - hysteresis ** 2))
+    return ku, float(period), float(amplitude)
+
+
+def relay_dead_time(tau, tu):
+    """ dead time that puts an integrator + lag + delay (our position plant) at -180 degrees at the relay frequency """
+    omega = 2 * math.pi / tu
+    return max((math.pi / 2 - math.atan(tau * omega)) / omega, 0.0)
+
+
+def velocity_gains(K, tau, theta, tc=None):
+    """ SIMC PI for the velocity slot, plus the FF that gives the right steady state duty by itself
+    tc is the closed loop time constant - defaults to the tightest SIMC recommends (theta), but not under one rio loop
+    """
+    tc = max(theta, k_rio_period) if tc is None else tc
+    kc = tau / (K * (tc + theta))
+    ti = min(tau, 4 * (tc + theta))
+    return {'p': kc, 'i': kc / ti * k_spark_period, 'd': 0.0, 'ff': 1 / K}
+
+
+def position_gains(K, tau, theta, tc=None):
+    """ SIMC PD for the position slot - the velocity FOPDT is an integrating plant in position, D cancels the lag """
+    tc = max(theta, k_rio_period) if tc is None else tc
+    kc = 1 / (K * (tc + theta))
+    return {'p': kc, 'i': 0.0, 'd': kc * tau / k_spark_period, 'ff': 0.0}
+
+
+def relay_position_gains(ku, tu):
+    """ Ziegler-Nichols 'no overshoot' PD straight from the relay, for comparison """
+    kc = 0.2 * ku
+    return {'p': kc, 'i': 0.0, 'd': kc * tu / 3 / k_spark_period, 'ff': 0.0}
+
+
+class RelayAutotuner:
+    """ step() once per loop with the measurements, send back the duty it returns - phase says where it is """
+
+    def __init__(self, min_position, max_position, setpoint=None) -> None:
+        self.min_position = min_position
+        self.max_position = max_position
+        self.setpoint = (min_position + max_position) / 2 if setpoint is None else setpoint
+        self.phase = 'rest'
+        self.message = ''
+        self.phase_start = None
+        self.step_start_position = None
+        self.step_samples = []  # (time, velocity)
+        self.relay_samples = []  # (time, position, duty)
+        self.relay_duty = k_relay_duty
+        self.relay_switches = 0  # times the relay flipped to pushing up
+        self.results = None
+
+    def is_finished(self) -> bool:
+        return self.phase in ['done', 'aborted']
+
+    def abort(self, message) -> float:
+        self.phase = 'aborted'
+        self.message = message
+        return 0.0
+
+    def step(self, now, position, velocity) -> float:
+        if self.is_finished():
+            return 0.0
+        if self.phase_start is None:
+            self.phase_start = now
+        elapsed = now - self.phase_start
+        if position > self.max_position - k_limit_margin or (self.phase == 'relay' and position < self.min_position + k_limit_margin):
+            return self.abort(f'stopped at {position:.3f} - too close to the end of travel')
+
+        if self.phase == 'rest':
+            if elapsed < k_rest_time:
+                return 0.0
+            self.phase, self.phase_start, elapsed = 'step', now, 0.0
+            self.step_start_position = position
+
+        if self.phase == 'step':
+            self.step_samples.append((now, velocity))
+            if elapsed < k_step_time and position - self.step_start_position < k_step_travel:
+                return k_step_duty
+            self.phase, self.phase_start, elapsed = 'relay', now, 0.0
+
+        # relay - latch the output until the error leaves the hysteresis band
+        error = self.setpoint - position
+        last_duty = self.relay_samples[-1][2] if self.relay_samples else self.relay_duty
+        duty = self.relay_duty if error > k_relay_hysteresis else -self.relay_duty if error < -k_relay_hysteresis else last_duty
+        if self.relay_samples and last_duty <= 0 < duty:
+            self.relay_switches += 1
+        self.relay_samples.append((now, position, duty))
+        if self.relay_switches >= k_relay_skip_cycles + k_relay_cycles + 1:
+            self.finish()
+            return 0.0
+        if elapsed > k_relay_timeout:
+            return self.abort(f'relay only managed {self.relay_switches} cycles in {k_relay_timeout} s')
+        return duty
+
+    def finish(self) -> None:
+        times, velocities = zip(*self.step_samples)
+        K, tau, theta, rms = fit_fopdt(times, velocities, k_step_duty)
+        times, positions, duties = zip(*self.relay_samples)
+        ultimate = relay_ultimate(times, positions, duties, self.relay_duty, k_relay_hysteresis)
+        self.results = {'K': K, 'tau': tau, 'theta': theta, 'fit_rms': rms, 'velocity': velocity_gains(K, tau, theta)}
+        if ultimate is None:
+            self.results['position'] = position_gains(K, tau, theta)
+        else:
+            ku, tu, amplitude = ultimate
+            relay_theta = relay_dead_time(tau, tu)  # includes the rio loop, so this is the one to trust for position
+            self.results.update({'ku': ku, 'tu': tu, 'relay_amplitude': amplitude, 'relay_theta': relay_theta,
+                                 'position': position_gains(K, tau, max(theta, relay_theta)),
+                                 'position_zn': relay_position_gains(ku, tu)})
+        self.phase = 'done'
+        self.message = (f'K={K:.3f}/duty tau={tau:.3f}s theta={theta:.3f}s' +
+                        (f' Ku={self.results["ku"]:.2f} Tu={self.results["tu"]:.3f}s' if ultimate is not None else ''))
@@ -0,0 +1,44 @@
+import wpilib
+import wpilib.simulation as simlib
+from pyfrc.physics.core import PhysicsInterface
+from rev import SparkMaxSim
+
+import robot as tuning_robot
+
+
+class PhysicsEngine:
+    """ The elevator from robot.py on an ElevatorSim, driven through SparkMaxSim - so the spark's own closed loop
+    (and the autotune experiment) can be run without hardware
+    """
+
+    def __init__(self, physics_controller: PhysicsInterface, robot: tuning_robot.Robot):
+        self.physics_controller = physics_controller
+        self.robot = robot
+
+        # the elevator is a cascade, so the carriage goes twice as fast as the chain - halve the gearing FOR THE SIM ONLY (same as the main robot)
+        self.elevator_sim = simlib.ElevatorSim(gearbox=tuning_robot.k_plant,
+                                               gearing=tuning_robot.k_gear_ratio / 2,
+                                               carriageMass=tuning_robot.k_mass_kg,
+                                               drumRadius=tuning_robot.k_effective_pulley_diameter / 2,
+                                               minHeight=tuning_robot.k_min_height,
+                                               maxHeight=tuning_robot.k_max_height,
+                                               simulateGravity=True,
+                                               startingHeight=tuning_robot.k_sim_starting_height)
+
+        self.spark_sim = SparkMaxSim(self.robot.motor, tuning_robot.k_plant)
+        self.follower_spark_sim = SparkMaxSim(self.robot.follower, tuning_robot.k_plant)
+
+        self.mech = wpilib.Mechanism2d(1, 2)
+        self.mech2d_elevator = self.mech.getRoot("base", 0.5, 0).appendLigament("elevator", length=tuning_robot.k_sim_starting_height,
+                                                                                 angle=90, color=wpilib.Color8Bit(red=150, green=255, blue=160))
+        wpilib.SmartDashboard.putData("tuning mech", self.mech)
+
+    def update_sim(self, now, tm_diff):
+        self.elevator_sim.setInput(0, self.spark_sim.getAppliedOutput() * simlib.RoboRioSim.getVInVoltage())
+        self.elevator_sim.update(tm_diff)
+        for spark_sim in [self.spark_sim, self.follower_spark_sim]:
+            spark_sim.setPosition(self.elevator_sim.getPosition())
+            spark_sim.iterate(velocity=self.elevator_sim.getVelocity(), vbus=12, dt=tm_diff)
+
+        simlib.RoboRioSim.setVInVoltage(simlib.BatterySim.calculate([self.elevator_sim.getCurrentDraw()]))
+        self.mech2d_elevator.setLength(self.elevator_sim.getPosition())
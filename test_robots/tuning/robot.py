@@ -16,31 +16,33 @@ import wpilib
 from wpimath.units import inchesToMeters, lbsToKilograms
 from wpimath.system.plant import DCMotor
 
+import autotune
 
-class Robot(wpilib.TimedRobot):
-    def robotInit(self):
+# module level so physics.py can build the same elevator in the sim
+k_CAN_id = 4
+k_follower_CAN_id = 5
 
+k_gear_ratio = 15 # 9, 12, or 15 gear ratio said victor 1/30/25
+                  # we need it seperate for the sim
+k_effective_pulley_diameter = inchesToMeters(1.91) # (https://www.andymark.com/products/25-24-tooth-0-375-in-hex-sprocket) although we're using rev, rev doesn't give a pitch diameter
+k_meters_per_revolution = math.pi * 2 * k_effective_pulley_diameter / k_gear_ratio # 2 because our elevator goes twice as fast as the chain because continuous rigging
+k_mass_kg = lbsToKilograms(25)
+k_plant = DCMotor.NEO(2)
 
-        k_CAN_id = 4
-        k_follower_CAN_id = 5
+k_min_height = inchesToMeters(8)
+k_max_height = inchesToMeters(60)
+k_tolerance = 2 / 100 # 2 cm
 
-        k_gear_ratio = 15 # 9, 12, or 15 gear ratio said victor 1/30/25
-                          # we need it seperate for the sim
-        k_effective_pulley_diameter = inchesToMeters(1.91) # (https://www.andymark.com/products/25-24-tooth-0-375-in-hex-sprocket) although we're using rev, rev doesn't give a pitch diameter
-        k_meters_per_revolution = math.pi * 2 * k_effective_pulley_diameter / k_gear_ratio # 2 because our elevator goes twice as fast as the chain because continuous rigging
-        k_mass_kg = lbsToKilograms(25)
-        k_plant = DCMotor.NEO(2)
+k_ff = 1 / 2.032
+# NOTE:
+# 2/15/25 14:37 ff of 0.6 and arbff of 0.38 v works
+# maybe decrease FF by a few hundredths
 
-        k_min_height = inchesToMeters(8)
-        k_max_height = inchesToMeters(60)
-        k_tolerance = 2 / 100 # 2 cm
+k_sim_starting_height = k_min_height
 
-        k_ff = 1 / 2.032
-        # NOTE:
-        # 2/15/25 14:37 ff of 0.6 and arbff of 0.38 v works
-        # maybe decrease FF by a few hundredths
 
-        k_sim_starting_height = 2
+class Robot(wpilib.TimedRobot):
+    def robotInit(self):
 
         self.k_config = SparkMaxConfig()
 
@@ -129,11 +131,49 @@ class Robot(wpilib.TimedRobot):
         wpilib.SmartDashboard.putBoolean("Velocity control?", False)
         wpilib.SmartDashboard.putBoolean("MaxMotion?", False)
 
+        # autotune: step + relay experiment (see autotune.py), then 'Apply autotune gains' copies the proposal into the boxes above
+        # set 'Feed Forward - Arb Volts' to hold the elevator against gravity first - the experiment adds its duty on top of it
+        self.autotuner = None
+        self.autotune_results = None
+        wpilib.SmartDashboard.putBoolean("Autotune?", False)
+        wpilib.SmartDashboard.putBoolean("Apply autotune gains", False)
+        wpilib.SmartDashboard.putString("_Autotune", "idle")
+
+    def disabledInit(self):
+        # an experiment can't pick up where it left off - its timing and samples are stale
+        if self.autotuner is not None and not self.autotuner.is_finished():
+            print(f'autotune abandoned in the {self.autotuner.phase} phase')
+        self.autotuner = None
+        wpilib.SmartDashboard.putBoolean("Autotune?", False)
+
+    def run_autotune(self):
+        if self.autotuner is None:
+            self.autotuner = autotune.RelayAutotuner(k_min_height, k_max_height)
+            print(f'autotune starting: step then relay around {self.autotuner.setpoint:.3f}')
+        duty = self.autotuner.step(wpilib.Timer.getFPGATimestamp(), self.encoder.getPosition(), self.encoder.getVelocity())
+        self.pid_controller.setReference(duty, rev.SparkMax.ControlType.kDutyCycle, arbFeedforward=self.arbFF, arbFFUnits=rev.SparkClosedLoopController.ArbFFUnits.kVoltage)
+        wpilib.SmartDashboard.putString("_Autotune", self.autotuner.phase)
+        if self.autotuner.is_finished():
+            print(f'autotune {self.autotuner.phase}: {self.autotuner.message}')
+            wpilib.SmartDashboard.putString("_Autotune", f'{self.autotuner.phase}: {self.autotuner.message}')
+            if self.autotuner.results is not None:
+                self.autotune_results = self.autotuner.results
+                for slot in ['velocity', 'position', 'position_zn']:
+                    if slot in self.autotune_results:
+                        gains = self.autotune_results[slot]
+                        print(f'  {slot:<12} p={gains["p"]:.4g} i={gains["i"]:.4g} d={gains["d"]:.4g} ff={gains["ff"]:.4g}')
+                        for key, value in gains.items():
+                            wpilib.SmartDashboard.putNumber(f"_Autotune {slot} {key}", value)
+            self.autotuner = None
+            wpilib.SmartDashboard.putBoolean("Autotune?", False)
+
     def teleopPeriodic(self):
 
         mode = wpilib.SmartDashboard.getBoolean("Velocity control?", False)
         self.arbFF = wpilib.SmartDashboard.getNumber("Feed Forward - Arb Volts", 0)
-        if mode:
+        if wpilib.SmartDashboard.getBoolean("Autotune?", False):
+            self.run_autotune()
+        elif mode:
             setpoint = wpilib.SmartDashboard.getNumber("Set Velocity", 0)
             self.pid_controller.setReference(setpoint, rev.SparkMax.ControlType.kVelocity, arbFeedforward=self.arbFF, arbFFUnits=rev.SparkClosedLoopController.ArbFFUnits.kVoltage)
             pv = self.encoder.getVelocity()
@@ -153,6 +193,15 @@ class Robot(wpilib.TimedRobot):
         self.counter += 1
         if self.counter % 2 == 0:
 
+            if wpilib.SmartDashboard.getBoolean("Apply autotune gains", False):
+                if self.autotune_results is not None:  # position uses the SIMC gains - the ZN ones are only there to compare
+                    gains = self.autotune_results['velocity' if mode else 'position']
+                    wpilib.SmartDashboard.putNumber("P Gain", gains['p'])
+                    wpilib.SmartDashboard.putNumber("I Gain", gains['i'])
+                    wpilib.SmartDashboard.putNumber("D Gain", gains['d'])
+                    wpilib.SmartDashboard.putNumber("Feed Forward", gains['ff'])
+                wpilib.SmartDashboard.putBoolean("Apply autotune gains", False)
+
             p = wpilib.SmartDashboard.getNumber("P Gain", 0)
             i = wpilib.SmartDashboard.getNumber("I Gain", 0)
             d = wpilib.SmartDashboard.getNumber("D Gain", 0)